@@ -0,0 +1,76 @@
+"""Сравнение задержек FSM хранилищ: MemoryStorage и PostgresStorage.
+
+Нужна БД из .env с примененными миграциями. Состояния пишутся
+для отрицательных chat_id, чтобы не задеть игроков, и удаляются в конце.
+
+Запуск из корня проекта:
+    python -m db.bench_fsm_storage [users] [rounds]
+"""
+import asyncio
+import sys
+from statistics import median
+from time import perf_counter
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from tgbot.services.db_managing import BaseConnection, shutdown_db_executor
+from tgbot.services.fsm_storage import PostgresStorage
+
+
+async def measure(storage, users: int, rounds: int) -> dict:
+    """Один раунд игрока - как шаг сделки в хендлере:
+    set_state, update_data, get_state, get_data.
+
+    Returns:
+        dict: {operation: [секунды, ...]}
+    """
+    timings = {}
+
+    async def timed(name: str, coroutine):
+        start = perf_counter()
+        await coroutine
+        timings.setdefault(name, []).append(perf_counter() - start)
+
+    async def player(chat: int):
+        for step in range(rounds):
+            await timed('set_state', storage.set_state(
+                chat=chat, user=chat, state='MarketDeal:waiting'))
+            await timed('update_data', storage.update_data(
+                chat=chat, user=chat, data={'step': step}))
+            await timed('get_state', storage.get_state(chat=chat, user=chat))
+            await timed('get_data', storage.get_data(chat=chat, user=chat))
+        await storage.reset_state(chat=chat, user=chat)
+
+    await asyncio.gather(*[player(-chat) for chat in range(1, users + 1)])
+    return timings
+
+
+def print_timings(name: str, timings: dict, total: float) -> None:
+    operations = sum(len(values) for values in timings.values())
+    print(f'{name}: {operations} operations, '
+          f'{operations / total:.0f} ops/sec')
+    for operation, values in timings.items():
+        values = sorted(values)
+        p95 = values[int(len(values) * 0.95) - 1]
+        print(f'  {operation:<12} median {median(values) * 1000:.2f} ms, '
+              f'p95 {p95 * 1000:.2f} ms')
+
+
+async def main(users: int, rounds: int) -> None:
+    for name, storage in (
+            ('MemoryStorage', MemoryStorage()),
+            ('PostgresStorage', PostgresStorage())):
+        start = perf_counter()
+        timings = await measure(storage, users, rounds)
+        print_timings(name, timings, perf_counter() - start)
+        await storage.close()
+
+
+if __name__ == '__main__':
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    try:
+        asyncio.run(main(users, rounds))
+    finally:
+        shutdown_db_executor()
+        BaseConnection.close_pool()
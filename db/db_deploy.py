@@ -1,6 +1,11 @@
+import os
+
 import psycopg2
 from config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT
 
+MIGRATIONS_DIR = './db/migrations'
+INIT_MIGRATION = '001_init_tables.sql'
+
 db_config = {'host': DB_HOST,
              'dbname': DB_NAME,
              'user': DB_USER,
@@ -10,9 +15,36 @@ db_config = {'host': DB_HOST,
 print('connection to database')
 connection = psycopg2.connect(**db_config)
 with connection.cursor() as cursor:
-    print('starting sql file')
-    cursor.execute(open("./db/migrations/001_init_tables.sql", "r").read())
-    print('end of sql file')
+    cursor.execute(
+        '''CREATE TABLE IF NOT EXISTS schema_migrations (
+                version varchar(255) PRIMARY KEY,
+                applied_at timestamp NOT NULL DEFAULT now()
+        );''')
+    cursor.execute('SELECT version FROM schema_migrations;')
+    applied = {version for version, in cursor.fetchall()}
+    if not applied:
+        # база развернута до появления schema_migrations:
+        # не пересоздаем таблицы поверх существующих данных
+        cursor.execute("SELECT to_regclass('public.game') IS NOT NULL;")
+        is_deployed, = cursor.fetchone()
+        if is_deployed:
+            cursor.execute(
+                'INSERT INTO schema_migrations (version) VALUES (%s);',
+                (INIT_MIGRATION,))
+            applied.add(INIT_MIGRATION)
 connection.commit()
+
+for file_name in sorted(os.listdir(MIGRATIONS_DIR)):
+    if not file_name.endswith('.sql') or file_name in applied:
+        continue
+    with connection.cursor() as cursor:
+        print(f'starting sql file {file_name}')
+        with open(os.path.join(MIGRATIONS_DIR, file_name), 'r') as file:
+            cursor.execute(file.read())
+        cursor.execute(
+            'INSERT INTO schema_migrations (version) VALUES (%s);',
+            (file_name,))
+        print(f'end of sql file {file_name}')
+    connection.commit()
 connection.close()
 print('data base successfully deployed')
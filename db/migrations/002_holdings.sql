@@ -0,0 +1,16 @@
+-- Акции хранятся количеством на пару (владелец, компания)
+-- вместо одной строки share на каждую акцию
+CREATE TABLE holding (
+        owner int REFERENCES game_user(gameuser_id) ON DELETE CASCADE,
+        company int REFERENCES company(company_id) ON DELETE CASCADE,
+        quantity int NOT NULL DEFAULT 0 CHECK (quantity >= 0),
+        PRIMARY KEY (owner, company)
+);
+
+INSERT INTO holding (owner, company, quantity)
+SELECT share.owner, share.company, count(*)
+FROM share
+WHERE share.owner IS NOT NULL AND share.company IS NOT NULL
+GROUP BY share.owner, share.company;
+
+DROP TABLE share;
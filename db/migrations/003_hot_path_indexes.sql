@@ -0,0 +1,33 @@
+-- Индексы под частые запросы бота.
+-- share(owner, company) заменена таблицей holding,
+-- ее первичный ключ (owner, company) уже покрывает этот поиск.
+
+-- активный игрок по tg_id: каждое нажатие кнопки
+CREATE INDEX IF NOT EXISTS game_user_active_tg_id_idx
+        ON game_user (tg_id) INCLUDE (gameuser_id)
+        WHERE is_active;
+
+-- игроки игры: рассылки, экспорт портфелей, проверка регистрации
+CREATE INDEX IF NOT EXISTS game_user_game_idx
+        ON game_user (game) INCLUDE (gameuser_id, tg_id);
+
+-- проверка уникальности ника
+CREATE INDEX IF NOT EXISTS game_user_nickname_idx
+        ON game_user (nickname);
+
+-- вход в игру по ключу
+CREATE INDEX IF NOT EXISTS game_game_key_idx
+        ON game (game_key);
+
+-- компании игры
+CREATE INDEX IF NOT EXISTS company_game_idx
+        ON company (game) INCLUDE (company_id);
+
+-- история цен компании
+CREATE INDEX IF NOT EXISTS company_history_company_idx
+        ON company_history (company, date_entry);
+
+-- объем торгов за день при закрытии биржи
+CREATE INDEX IF NOT EXISTS transactions_date_type_company_idx
+        ON transactions (date_deal, type_deal, company_id)
+        INCLUDE (number_of_shares);
@@ -0,0 +1,12 @@
+-- Очередь выгрузки в Google Sheets: строки пишутся в одной транзакции
+-- с изменением состояния, фоновая задача отправляет их в таблицу
+CREATE TABLE gs_outbox (
+        outbox_id bigint generated by default as identity PRIMARY KEY,
+        game int REFERENCES game(game_id) ON DELETE CASCADE,
+        worksheet varchar(255) NOT NULL,
+        action varchar(32) NOT NULL DEFAULT 'append',
+        payload jsonb NOT NULL,
+        created_at timestamp NOT NULL DEFAULT now(),
+        attempts int NOT NULL DEFAULT 0,
+        last_error text
+);
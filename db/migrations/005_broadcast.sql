@@ -0,0 +1,21 @@
+-- Рассылки с сохраненным списком получателей: после RetryAfter
+-- или перезапуска бота рассылка продолжается с неотправленных
+CREATE TABLE broadcast (
+        broadcast_id int generated by default as identity PRIMARY KEY,
+        post jsonb NOT NULL,
+        status varchar(32) NOT NULL DEFAULT 'active',
+        progress_chat_id bigint,
+        progress_message_id bigint,
+        created_at timestamp NOT NULL DEFAULT now(),
+        finished_at timestamp
+);
+
+CREATE TABLE broadcast_recipient (
+        broadcast int REFERENCES broadcast(broadcast_id) ON DELETE CASCADE,
+        tg_id bigint NOT NULL,
+        status varchar(32) NOT NULL DEFAULT 'pending',
+        PRIMARY KEY (broadcast, tg_id)
+);
+
+CREATE INDEX broadcast_recipient_pending_idx
+        ON broadcast_recipient (broadcast) WHERE status = 'pending';
@@ -0,0 +1,8 @@
+-- Отложенные сообщения пользователям (гайд после регистрации):
+-- хранятся до отправки, после перезапуска бота планируются заново
+CREATE TABLE scheduled_message (
+        message_id bigint generated by default as identity PRIMARY KEY,
+        tg_id bigint NOT NULL,
+        text text NOT NULL,
+        send_at timestamptz NOT NULL
+);
@@ -0,0 +1,12 @@
+-- Состояния FSM aiogram: переживают перезапуск и общие для всех
+-- процессов бота. Старые состояния удаляются по updated_at
+CREATE TABLE fsm_state (
+        chat_id bigint NOT NULL,
+        user_id bigint NOT NULL,
+        state varchar(255),
+        data jsonb NOT NULL DEFAULT '{}',
+        updated_at timestamp NOT NULL DEFAULT now(),
+        PRIMARY KEY (chat_id, user_id)
+);
+
+CREATE INDEX fsm_state_updated_at_idx ON fsm_state (updated_at);
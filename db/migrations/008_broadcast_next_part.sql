@@ -0,0 +1,4 @@
+-- Номер следующей части поста для получателя: после RetryAfter
+-- или перезапуска бота пост досылается с нее, без повторов
+ALTER TABLE broadcast_recipient
+        ADD COLUMN next_part int NOT NULL DEFAULT 0;
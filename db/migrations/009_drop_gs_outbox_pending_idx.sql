@@ -0,0 +1,3 @@
+-- Индекс повторял первичный ключ gs_outbox: выборка идет по outbox_id,
+-- а фильтр attempts < %s с параметром частичным индексом не покрыть
+DROP INDEX IF EXISTS gs_outbox_pending_idx;
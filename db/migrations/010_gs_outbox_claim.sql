@@ -0,0 +1,3 @@
+-- Записи очереди выгрузки, взятые в работу одним процессом бота:
+-- другие процессы не берут листы, в которых есть занятые записи
+ALTER TABLE gs_outbox ADD COLUMN claimed_until timestamp;
@@ -0,0 +1,4 @@
+-- Очередь выгрузки по листу игры: счетчик регистраций в очереди
+-- и проверка занятых листов при заборе записей
+CREATE INDEX IF NOT EXISTS gs_outbox_game_worksheet_idx
+        ON gs_outbox (game, worksheet) INCLUDE (attempts, claimed_until);
@@ -0,0 +1,60 @@
+import asyncio
+
+from aiogram.utils import exceptions
+
+from tgbot.utils import broadcast
+from tgbot.utils.pars_messages import Post
+
+
+POST = Post(title=None, text='text', photos=[], video=None, docs=[], polls=[])
+
+
+async def no_limit(chat_id, messages=1):
+    pass
+
+
+def make_parts(sent: list, fail_once_at: int):
+    failed = []
+
+    def make_part(number):
+        async def part():
+            if number == fail_once_at and not failed:
+                failed.append(number)
+                raise exceptions.RetryAfter(0)
+            sent.append(number)
+        return part
+
+    return [make_part(number) for number in range(3)]
+
+
+def test_retry_after_resumes_from_unsent_part(monkeypatch):
+    sent = []
+    monkeypatch.setattr(broadcast.chat_limiter, 'acquire', no_limit)
+    monkeypatch.setattr(
+        broadcast, 'make_post_parts',
+        lambda *args: make_parts(sent, fail_once_at=1))
+
+    status = asyncio.run(broadcast.send_post_to_user(POST, 1))
+
+    assert status == broadcast.SENT
+    assert sent == [0, 1, 2]
+
+
+def test_send_starts_from_saved_part(monkeypatch):
+    sent = []
+    saved = []
+
+    async def on_part(user_id, next_part):
+        saved.append(next_part)
+
+    monkeypatch.setattr(broadcast.chat_limiter, 'acquire', no_limit)
+    monkeypatch.setattr(
+        broadcast, 'make_post_parts',
+        lambda *args: make_parts(sent, fail_once_at=None))
+
+    status = asyncio.run(broadcast.send_post_to_user(
+        POST, 1, start_part=1, on_part=on_part))
+
+    assert status == broadcast.SENT
+    assert sent == [1, 2]
+    assert saved == [2]
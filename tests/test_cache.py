@@ -0,0 +1,53 @@
+from tgbot.services import cache
+from tgbot.services.cache import ObjectCache
+
+
+def test_least_recently_used_is_evicted():
+    objects = ObjectCache(max_size=2)
+    objects.put(1, 'a')
+    objects.put(2, 'b')
+    objects.get(1)
+    objects.put(3, 'c')
+
+    assert objects.get(2) is None
+    assert objects.get(1) == 'a'
+    assert objects.get(3) == 'c'
+    assert objects.stats()['evictions'] == 1
+
+
+def test_expired_object_is_dropped(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache, 'monotonic', lambda: now[0])
+    objects = ObjectCache(max_size=10, ttl=5)
+    objects.put(1, 'a')
+
+    now[0] = 104.0
+    assert objects.get(1) == 'a'
+    now[0] = 106.0
+    assert objects.get(1) is None
+    assert objects.stats() == {
+        'size': 0, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+
+def test_stats_count_hits_and_misses():
+    objects = ObjectCache(max_size=10)
+    objects.put(1, 'a')
+    objects.get(1)
+    objects.get(1)
+    objects.get(2)
+
+    assert objects.stats() == {
+        'size': 1, 'hits': 2, 'misses': 1, 'evictions': 0}
+
+
+def test_invalidate_and_clear():
+    objects = ObjectCache(max_size=10)
+    objects.put(1, 'a')
+    objects.put(2, 'b')
+
+    objects.invalidate(1)
+    assert objects.get(1) is None
+    assert objects.get(2) == 'b'
+
+    objects.clear()
+    assert objects.stats()['size'] == 0
@@ -0,0 +1,49 @@
+import pytest
+
+from tgbot.services.db_managing import FsmStateData
+
+
+TTL = 3600
+CHAT_ID = USER_ID = 1
+
+
+@pytest.fixture()
+def fsm_state(db_connection):
+    yield FsmStateData
+    FsmStateData.delete(CHAT_ID, USER_ID)
+
+
+def make_stale(db_connection):
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE fsm_state SET updated_at = now() - interval '2 hours';")
+    db_connection.commit()
+
+
+def test_set_state_keeps_fresh_data(fsm_state):
+    fsm_state.set_data(CHAT_ID, USER_ID, {'answer': 'buy'}, TTL)
+    assert fsm_state.set_state(CHAT_ID, USER_ID, 'deal', TTL) \
+        == ('deal', {'answer': 'buy'})
+
+
+def test_set_state_drops_stale_data(fsm_state, db_connection):
+    fsm_state.set_data(CHAT_ID, USER_ID, {'answer': 'buy'}, TTL)
+    make_stale(db_connection)
+    assert fsm_state.set_state(CHAT_ID, USER_ID, 'deal', TTL) == ('deal', {})
+
+
+def test_set_data_drops_stale_state(fsm_state, db_connection):
+    fsm_state.set_state(CHAT_ID, USER_ID, 'deal', TTL)
+    make_stale(db_connection)
+    assert fsm_state.set_data(CHAT_ID, USER_ID, {'page': 1}, TTL) \
+        == (None, {'page': 1})
+
+
+def test_update_data_drops_stale_state_and_data(fsm_state, db_connection):
+    fsm_state.set_state(CHAT_ID, USER_ID, 'deal', TTL)
+    fsm_state.update_data(CHAT_ID, USER_ID, {'answer': 'buy'}, TTL)
+    assert fsm_state.update_data(CHAT_ID, USER_ID, {'page': 1}, TTL) \
+        == ('deal', {'answer': 'buy', 'page': 1})
+    make_stale(db_connection)
+    assert fsm_state.update_data(CHAT_ID, USER_ID, {'page': 2}, TTL) \
+        == (None, {'page': 2})
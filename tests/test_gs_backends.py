@@ -0,0 +1,44 @@
+from datetime import date
+
+import pytest
+
+from tgbot.services.gs_backends import FakeSheetBackend, SheetBackend, \
+    make_game_template
+from tgbot.services.gs_module import GameSheet, EFFECT_WS
+
+
+GS_LINK = 'https://docs.google.com/spreadsheets/d/fake'
+
+
+def test_sheet_backend_is_abstract():
+    with pytest.raises(TypeError):
+        SheetBackend()
+
+
+def test_template_game_is_running_today():
+    today = date(2026, 10, 18)
+    backend = FakeSheetBackend()
+    backend.add_sheet(GS_LINK, make_game_template(today=today))
+    game_sheet = GameSheet(GS_LINK, backend=backend)
+
+    base_value = game_sheet.get_base_value()
+    assert base_value['start_day'] <= today <= base_value['end_day']
+    assert base_value['max_percentage'] == 30
+    assert game_sheet.get_date_and_bool_from_timetable() == (today, True)
+
+
+def test_company_effects_skip_wrong_rows():
+    backend = FakeSheetBackend()
+    backend.add_sheet(GS_LINK)
+    backend.get_matrix(GS_LINK, EFFECT_WS)[2:] = [
+        ['Альфа', 'ALFA', '5', '0'],
+        ['Бета', 'BETA', '', '1'],
+        ['Гамма', 'GAMM', 'x', '0'],
+    ]
+
+    effects = GameSheet(GS_LINK, backend=backend).get_company_effects()
+
+    assert effects == {
+        'ALFA': {'effect': 5, 'liquidation': False},
+        'BETA': {'effect': 0, 'liquidation': True},
+    }
@@ -0,0 +1,91 @@
+import pytest
+
+from tgbot.services import gs_outbox
+from tgbot.services.gs_backends import FakeSheetBackend, FakeSheetsError
+from tgbot.services.gs_module import GameSheet, PRICES_WS
+
+
+GS_LINK = 'https://docs.google.com/spreadsheets/d/fake'
+
+
+class FailingBackend(FakeSheetBackend):
+    """Падает на append с номером fail_on (с 1)."""
+    def __init__(self, fail_on: int):
+        super().__init__()
+        self.fail_on = fail_on
+        self.appends = 0
+
+    def append_rows(self, gs_link, ws_name, rows):
+        self.appends += 1
+        if self.appends == self.fail_on:
+            raise FakeSheetsError('bad request', status=400)
+        super().append_rows(gs_link, ws_name, rows)
+
+
+class FakeOutbox:
+    def __init__(self, entries: list):
+        self.entries = entries
+        self.deleted = []
+        self.failed = []
+        self.released = []
+
+    def claim_pending(self, limit, max_attempts, claim_ttl):
+        return self.entries
+
+    def delete(self, outbox_ids):
+        self.deleted += outbox_ids
+
+    def mark_failed(self, outbox_ids, error):
+        self.failed += outbox_ids
+
+    def release(self, outbox_ids):
+        self.released += sorted(outbox_ids)
+
+
+def make_entries(count: int, worksheet: str = PRICES_WS) -> list:
+    return [
+        {
+            'outbox_id': outbox_id,
+            'game': 1,
+            'gs_link': GS_LINK,
+            'worksheet': worksheet,
+            'action': 'append',
+            'payload': ['2030-01-01', 'ALFA', outbox_id],
+        }
+        for outbox_id in range(1, count + 1)
+    ]
+
+
+@pytest.fixture()
+def outbox(monkeypatch):
+    def install(entries: list, backend: FakeSheetBackend) -> FakeOutbox:
+        fake_outbox = FakeOutbox(entries)
+        backend.add_sheet(GS_LINK)
+        monkeypatch.setattr(gs_outbox, 'OutboxData', fake_outbox)
+        monkeypatch.setattr(gs_outbox, 'GSHEET_APPEND_CHUNK_SIZE', 2)
+        monkeypatch.setattr(
+            gs_outbox, 'GameSheet',
+            lambda gs_link: GameSheet(gs_link, backend=backend))
+        return fake_outbox
+    return install
+
+
+def test_written_chunks_are_deleted_before_a_failure(outbox):
+    backend = FailingBackend(fail_on=2)
+    fake_outbox = outbox(make_entries(5), backend)
+
+    assert gs_outbox.flush_gs_outbox() == 2
+
+    assert fake_outbox.deleted == [1, 2]
+    assert fake_outbox.failed == [3, 4]
+    assert fake_outbox.released == [5]
+    rows = backend.get_matrix(GS_LINK, PRICES_WS)[1:]
+    assert [row[2] for row in rows] == ['1', '2']
+
+
+def test_all_chunks_sent(outbox):
+    fake_outbox = outbox(make_entries(5), FailingBackend(fail_on=None))
+
+    assert gs_outbox.flush_gs_outbox() == 5
+    assert fake_outbox.deleted == [1, 2, 3, 4, 5]
+    assert fake_outbox.failed == fake_outbox.released == []
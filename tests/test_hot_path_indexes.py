@@ -0,0 +1,163 @@
+from datetime import date, timedelta
+
+import pytest
+
+
+# размер тестовой базы: игра на PLAYERS игроков среди GAMES игр,
+# эти же игроки раньше играли еще в PAST_GAMES играх
+GAMES = 1000
+PAST_GAMES = 19
+PLAYERS = 5000
+COMPANIES = 10
+DAYS = 20
+DEALS_PER_DAY = 10000
+FIRST_TG_ID = 10000001
+FIRST_DAY = date(2030, 1, 1)
+
+# частые запросы бота и индексы из 003_hot_path_indexes.sql под них
+HOT_QUERIES = [
+    (
+        'game_user_active_tg_id_idx',
+        '''SELECT game_user.gameuser_id FROM game_user
+           WHERE game_user.tg_id = %(tg_id)s AND game_user.is_active = TRUE;'''
+    ),
+    (
+        'game_user_game_idx',
+        '''SELECT game_user.tg_id
+           FROM game_user WHERE game_user.game = %(game_id)s;'''
+    ),
+    (
+        'game_user_nickname_idx',
+        '''SELECT EXISTS(
+               SELECT * FROM game_user WHERE nickname = %(nickname)s);'''
+    ),
+    (
+        'game_game_key_idx',
+        '''SELECT game.game_id FROM game WHERE game_key = %(game_key)s;'''
+    ),
+    (
+        'company_game_idx',
+        '''SELECT company.company_id
+           FROM company WHERE company.game = %(game_id)s;'''
+    ),
+    (
+        'transactions_date_type_company_idx',
+        '''SELECT transactions.company_id,
+               transactions.type_deal,
+               SUM(transactions.number_of_shares)
+           FROM transactions
+           JOIN company ON company.company_id = transactions.company_id
+           WHERE transactions.date_deal = %(date_deal)s
+               AND company.game = %(game_id)s
+           GROUP BY transactions.company_id, transactions.type_deal;'''
+    ),
+]
+
+
+@pytest.fixture(scope='module')
+def seeded_game(db_connection) -> dict:
+    """Игра на 5000 игроков с компаниями и сделками за DAYS дней.
+    Возвращает параметры запросов к ней."""
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            '''INSERT INTO tg_user (tg_id, username)
+               SELECT tg_id, 'user_' || tg_id
+               FROM generate_series(%s, %s) AS tg_id;''',
+            (FIRST_TG_ID, FIRST_TG_ID + PLAYERS - 1))
+        cursor.execute(
+            '''INSERT INTO game (game_key, game_name, gs_link)
+               SELECT 'SEED' || number, 'game ' || number,
+                   'https://docs.google.com/spreadsheets/d/' || md5(number::text)
+               FROM generate_series(1, %s) AS number
+               ORDER BY number
+               RETURNING game_id;''',
+            (GAMES,))
+        game_ids = sorted(row[0] for row in cursor.fetchall())
+        game_id = game_ids[0]
+
+        # игроки заходят в игры по очереди, активна только текущая игра
+        cursor.execute(
+            '''INSERT INTO game_user (tg_id, is_active, nickname, game, cash)
+               SELECT tg_id, game.game_id = %(game_id)s,
+                   'player_' || game.game_id || '_' || tg_id,
+                   game.game_id, 1000
+               FROM unnest(%(game_ids)s) AS game(game_id)
+               CROSS JOIN generate_series(
+                   %(first_tg_id)s, %(last_tg_id)s) AS tg_id
+               ORDER BY game.game_id, tg_id;''',
+            {
+                'game_id': game_id,
+                'game_ids': game_ids[:PAST_GAMES + 1],
+                'first_tg_id': FIRST_TG_ID,
+                'last_tg_id': FIRST_TG_ID + PLAYERS - 1,
+            })
+        cursor.execute(
+            '''INSERT INTO company
+                   (game, company_name, company_ticker, price, effect)
+               SELECT game.game_id, 'company ' || number, 'C' || number, 100, 0
+               FROM unnest(%s) AS game(game_id)
+               CROSS JOIN generate_series(1, %s) AS number
+               ORDER BY game.game_id, number;''',
+            (game_ids, COMPANIES))
+
+        cursor.execute(
+            '''SELECT gameuser_id FROM game_user
+               WHERE game = %s ORDER BY gameuser_id;''',
+            (game_id,))
+        player_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            '''SELECT company_id FROM company
+               WHERE game = %s ORDER BY company_id;''',
+            (game_id,))
+        company_ids = [row[0] for row in cursor.fetchall()]
+
+        # сделки пишутся день за днем, как при игре
+        cursor.execute(
+            '''INSERT INTO transactions (
+                   date_deal, subject_deal, type_deal,
+                   company_id, number_of_shares)
+               SELECT %(first_day)s::date + number / %(deals_per_day)s,
+                   (%(player_ids)s::int[])[1 + mod(number, %(players)s)],
+                   (ARRAY['BUY', 'SELL']::deal_id[])[1 + mod(number, 2)],
+                   (%(company_ids)s::int[])[1 + mod(number, %(companies)s)],
+                   1 + mod(number, 7)
+               FROM generate_series(0, %(deals)s - 1) AS number;''',
+            {
+                'first_day': FIRST_DAY,
+                'deals_per_day': DEALS_PER_DAY,
+                'player_ids': player_ids,
+                'players': len(player_ids),
+                'company_ids': company_ids,
+                'companies': len(company_ids),
+                'deals': DAYS * DEALS_PER_DAY,
+            })
+        cursor.execute(
+            'ANALYZE tg_user, game, game_user, company, transactions;')
+    db_connection.commit()
+
+    yield {
+        'game_id': game_id,
+        'tg_id': FIRST_TG_ID + PLAYERS // 2,
+        'nickname': f'player_{game_id}_{FIRST_TG_ID}',
+        'game_key': 'SEED1',
+        'date_deal': FIRST_DAY + timedelta(days=DAYS // 2),
+    }
+
+    db_connection.rollback()
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM game WHERE game_id = ANY(%s);', (game_ids,))
+        cursor.execute(
+            'DELETE FROM tg_user WHERE tg_id BETWEEN %s AND %s;',
+            (FIRST_TG_ID, FIRST_TG_ID + PLAYERS - 1))
+    db_connection.commit()
+
+
+@pytest.mark.parametrize(
+    'index, query', HOT_QUERIES, ids=[row[0] for row in HOT_QUERIES])
+def test_hot_query_uses_index(db_connection, seeded_game, index, query):
+    with db_connection.cursor() as cursor:
+        cursor.execute('EXPLAIN ' + query, seeded_game)
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+    db_connection.rollback()
+    assert index in plan, plan
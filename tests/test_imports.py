@@ -0,0 +1,25 @@
+import importlib
+
+import pytest
+
+
+MODULES = [
+    'tgbot.config',
+    'tgbot.loader',
+    'tgbot.services.gs_backends',
+    'tgbot.services.gs_module',
+    'tgbot.services.gs_outbox',
+    'tgbot.services.db_managing',
+    'tgbot.services.business_logic',
+    'tgbot.services.fsm_storage',
+    'tgbot.utils.broadcast',
+    'tgbot.utils.scheduled_messages',
+    'tgbot.handlers',
+    'tgbot.middlewares',
+    'tgbot.__main__',
+]
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_module_imports(module):
+    importlib.import_module(module)
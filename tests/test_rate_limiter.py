@@ -0,0 +1,87 @@
+import asyncio
+from time import monotonic
+
+import pytest
+from aiogram import Bot
+from aiogram.utils import exceptions
+
+from tgbot.loader import bot
+from tgbot.utils import rate_limiter
+from tgbot.utils.rate_limiter import PriorityRateGovernor, \
+    INTERACTIVE, MAILING
+
+
+def test_interactive_overtakes_queued_mailing():
+    async def run():
+        governor = PriorityRateGovernor(100, period=1)
+        for _ in range(100):
+            await governor.acquire(MAILING)
+        order = []
+
+        async def send(name, priority):
+            await governor.acquire(priority)
+            order.append(name)
+
+        mailing = [
+            asyncio.ensure_future(send(f'mailing_{number}', MAILING))
+            for number in range(3)
+        ]
+        await asyncio.sleep(0)
+        await asyncio.gather(send('interactive', INTERACTIVE), *mailing)
+        return order
+
+    assert asyncio.run(run()) == [
+        'interactive', 'mailing_0', 'mailing_1', 'mailing_2']
+
+
+def test_pause_delays_every_waiter():
+    async def run():
+        governor = PriorityRateGovernor(100, period=1)
+        governor.pause(0.2)
+        start = monotonic()
+        waited = []
+
+        async def send(priority):
+            await governor.acquire(priority)
+            waited.append(monotonic() - start)
+
+        await asyncio.gather(send(INTERACTIVE), send(MAILING))
+        return waited
+
+    assert all(seconds >= 0.2 for seconds in asyncio.run(run()))
+
+
+@pytest.fixture
+def requests(monkeypatch) -> dict:
+    calls = {'sent': [], 'acquired': 0, 'paused': []}
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        calls['sent'].append(method)
+        if data == 'flood':
+            raise exceptions.RetryAfter(5)
+        return True
+
+    async def acquire(priority=None):
+        calls['acquired'] += 1
+
+    monkeypatch.setattr(Bot, 'request', request)
+    monkeypatch.setattr(rate_limiter.telegram_governor, 'acquire', acquire)
+    monkeypatch.setattr(
+        rate_limiter.telegram_governor, 'pause', calls['paused'].append)
+    return calls
+
+
+def test_only_sending_methods_are_governed(requests):
+    asyncio.run(bot.request('getMe'))
+    asyncio.run(bot.request('answerCallbackQuery'))
+    asyncio.run(bot.request('sendMessage'))
+
+    assert requests['sent'] == ['getMe', 'answerCallbackQuery', 'sendMessage']
+    assert requests['acquired'] == 1
+
+
+def test_retry_after_pauses_governor(requests):
+    with pytest.raises(exceptions.RetryAfter):
+        asyncio.run(bot.request('sendMessage', 'flood'))
+
+    assert requests['paused'] == [5]
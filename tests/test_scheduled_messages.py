@@ -0,0 +1,58 @@
+import asyncio
+
+from aiogram.utils import exceptions
+
+from tgbot.utils import scheduled_messages
+from tgbot.services.db_managing import ScheduledMessageData
+
+
+def patch_storage(monkeypatch, deleted: list):
+    monkeypatch.setattr(
+        ScheduledMessageData, 'get',
+        staticmethod(lambda message_id: (10, 'text')))
+    monkeypatch.setattr(
+        ScheduledMessageData, 'delete',
+        staticmethod(lambda message_id: deleted.append(message_id)))
+
+
+def patch_send(monkeypatch, error: Exception = None):
+    async def send_message(chat_id, text):
+        if error:
+            raise error
+
+    monkeypatch.setattr(scheduled_messages.dp.bot, 'send_message', send_message)
+
+
+def test_message_deleted_after_send(monkeypatch):
+    deleted = []
+    patch_storage(monkeypatch, deleted)
+    patch_send(monkeypatch)
+
+    asyncio.run(scheduled_messages.send_scheduled_message(1))
+
+    assert deleted == [1]
+
+
+def test_network_error_keeps_message_and_retries(monkeypatch):
+    deleted = []
+    retried = []
+    patch_storage(monkeypatch, deleted)
+    patch_send(monkeypatch, exceptions.NetworkError('timeout'))
+    monkeypatch.setattr(
+        scheduled_messages, 'add_send_job',
+        lambda message_id, send_at: retried.append(message_id))
+
+    asyncio.run(scheduled_messages.send_scheduled_message(1))
+
+    assert deleted == []
+    assert retried == [1]
+
+
+def test_blocked_user_message_deleted(monkeypatch):
+    deleted = []
+    patch_storage(monkeypatch, deleted)
+    patch_send(monkeypatch, exceptions.BotBlocked('blocked'))
+
+    asyncio.run(scheduled_messages.send_scheduled_message(1))
+
+    assert deleted == [1]
@@ -0,0 +1,81 @@
+import pytest
+
+from tgbot.services import gs_module
+from tgbot.services.gs_backends import FakeSheetsError
+from tgbot.services.gs_module import RateLimiter, SheetsApiError, \
+    sheets_request
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(gs_module, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(gs_module, 'sleep', clock.sleep)
+    monkeypatch.setattr(
+        gs_module, 'sheets_rate_limiter', RateLimiter(1000, period=1))
+    return clock
+
+
+def failing(statuses: list):
+    """Вызов, который падает с каждым статусом из statuses, потом - 'ok'."""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(statuses):
+            raise FakeSheetsError('error', status=statuses[len(calls) - 1])
+        return 'ok'
+
+    return func, calls
+
+
+def test_too_many_requests_is_retried(clock):
+    func, calls = failing([429, 503])
+
+    assert sheets_request(func) == 'ok'
+    assert len(calls) == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_bad_request_is_not_retried(clock):
+    func, calls = failing([400])
+
+    with pytest.raises(SheetsApiError) as error:
+        sheets_request(func)
+    assert error.value.status == 400
+    assert len(calls) == 1
+    assert clock.sleeps == []
+
+
+def test_retries_are_limited(clock, monkeypatch):
+    monkeypatch.setattr(gs_module, 'GSHEET_MAX_RETRIES', 2)
+    func, calls = failing([429] * 5)
+
+    with pytest.raises(SheetsApiError) as error:
+        sheets_request(func)
+    assert error.value.status == 429
+    assert len(calls) == 3
+
+
+def test_rate_limiter_waits_for_token(clock):
+    limiter = RateLimiter(2, period=1)
+
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.sleeps == []
+
+    limiter.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+
+import pytest
+from psycopg2 import extensions
+
+from tgbot.services import db_managing
+from tgbot.services.db_managing import run_in_transaction
+
+
+@pytest.fixture(autouse=True)
+def no_db(monkeypatch):
+    @contextmanager
+    def connection():
+        yield None
+    monkeypatch.setattr(db_managing.BaseConnection, 'connection', connection)
+    monkeypatch.setattr(db_managing, 'sleep', lambda seconds: None)
+
+
+def make_func(failures: int):
+    calls = []
+
+    def func(value):
+        calls.append(value)
+        if len(calls) <= failures:
+            raise extensions.TransactionRollbackError('deadlock detected')
+        return value
+    return func, calls
+
+
+def test_rolled_back_transaction_is_retried():
+    func, calls = make_func(failures=1)
+    assert run_in_transaction(func, 'done') == 'done'
+    assert len(calls) == 2
+
+
+def test_retries_are_bounded(monkeypatch):
+    monkeypatch.setattr(db_managing, 'DB_TRANSACTION_MAX_ATTEMPTS', 3)
+    func, calls = make_func(failures=10)
+    with pytest.raises(extensions.TransactionRollbackError):
+        run_in_transaction(func, 'done')
+    assert len(calls) == 3
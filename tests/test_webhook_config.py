@@ -0,0 +1,26 @@
+import pytest
+
+from tgbot.__main__ import check_webhook_config
+
+
+@pytest.mark.parametrize('host, secret', [
+    ('https://bot.example.com', None),
+    ('https://bot.example.com', 'Abc_123-xyz'),
+    ('https://bot.example.com', 'a' * 256),
+])
+def test_valid_webhook_config(host, secret):
+    check_webhook_config(host, secret)
+
+
+@pytest.mark.parametrize('host, secret', [
+    (None, 'secret'),
+    ('', 'secret'),
+    ('http://bot.example.com', 'secret'),
+    ('https://bot.example.com', ''),
+    ('https://bot.example.com', 'with space'),
+    ('https://bot.example.com', 'токен'),
+    ('https://bot.example.com', 'a' * 257),
+])
+def test_invalid_webhook_config(host, secret):
+    with pytest.raises(ValueError):
+        check_webhook_config(host, secret)
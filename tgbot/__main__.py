@@ -1,12 +1,19 @@
 from aiogram import Dispatcher
 from aiogram import executor, types
+from aiohttp import web
 from loguru import logger
+import hmac
 import os
+import re
 
 from tgbot.config import GSHEET_SERVICE_FILE, BOT_MAILADDRESS
-from tgbot.utils.broadcast import send_messages
-from tgbot.config import TG_ADMINS_ID
+from tgbot.utils.broadcast import send_messages, resume_broadcasts
+from tgbot.utils.scheduled_messages import restore_scheduled_messages
+from tgbot.config import TG_ADMINS_ID, BOT_MODE, WEBHOOK_HOST, \
+    WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT, \
+    SHUTDOWN_DRAIN_TIMEOUT
 from tgbot.services.business_logic import MarketBot
+from tgbot.services.db_managing import BaseConnection, shutdown_db_executor
 from tgbot.loader import scheduler
 
 
@@ -19,9 +26,8 @@ async def setup_default_commands(dp: Dispatcher):
     logger.info('Default commands soccessfully set')
 
 
-async def on_startup_polling(dp: Dispatcher):
-    logger.info('Start on polling mode')
-
+async def on_startup(dp: Dispatcher):
+    """Общий запуск для polling и webhook."""
     await setup_default_commands(dp)
 
     from tgbot import handlers
@@ -30,16 +36,73 @@ async def on_startup_polling(dp: Dispatcher):
 
     # Check after reboot
     MarketBot().check_games_and_create_schedule()
+    MarketBot().create_blocked_users_schedule()
+    MarketBot().create_gs_outbox_schedule()
+    MarketBot().create_fsm_cleanup_schedule()
 
     await send_messages(TG_ADMINS_ID, 'startup')
+    await resume_broadcasts()
+    await restore_scheduled_messages()
+
+
+async def on_startup_polling(dp: Dispatcher):
+    logger.info('Start on polling mode')
+    await on_startup(dp)
+
+
+async def on_startup_webhook(dp: Dispatcher):
+    logger.info('Start on webhook mode')
+    # secret_token пока нет в Bot.set_webhook этой версии aiogram
+    payload = {'url': WEBHOOK_HOST.rstrip('/') + WEBHOOK_PATH}
+    if WEBHOOK_SECRET:
+        payload['secret_token'] = WEBHOOK_SECRET
+    await dp.bot.request('setWebhook', payload)
+    await on_startup(dp)
 
 
 async def on_shutdown(dp: Dispatcher):
     logger.info('Shutdown')
 
+    from tgbot.middlewares import in_flight_updates
+    await in_flight_updates.wait_drained(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+
     scheduler.shutdown()
     logger.info('scheduler shutdown')
 
+    shutdown_db_executor()
+    BaseConnection.close_pool()
+
+
+# допустимый secret_token для setWebhook по документации Bot API
+SECRET_TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,256}')
+
+
+def check_webhook_config(host: str, secret: str) -> None:
+    """Проверяет настройки webhook до запуска сервера.
+
+    Raises:
+        ValueError: WEBHOOK_HOST не https url или WEBHOOK_SECRET
+            с недопустимыми для Telegram символами или длиной
+    """
+    if not host or not host.startswith('https://'):
+        raise ValueError(
+            f'WEBHOOK_HOST must be an https:// url, got {host!r}')
+    if secret is not None and not SECRET_TOKEN_PATTERN.fullmatch(secret):
+        raise ValueError(
+            'WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, '
+            '_ and -')
+
+
+@web.middleware
+async def check_secret_token(request: web.Request, handler):
+    """Пропускает на webhook только запросы от Telegram."""
+    if request.path == WEBHOOK_PATH and WEBHOOK_SECRET:
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+            logger.warning('webhook request with wrong secret token')
+            raise web.HTTPUnauthorized()
+    return await handler(request)
+
 
 def polling(skip_updates: bool = False):
     from tgbot.handlers import dp
@@ -51,5 +114,26 @@ def polling(skip_updates: bool = False):
     )
 
 
+def webhook(skip_updates: bool = False):
+    check_webhook_config(WEBHOOK_HOST, WEBHOOK_SECRET)
+    from tgbot.handlers import dp
+    webhook_executor = executor.set_webhook(
+        dispatcher=dp,
+        webhook_path=WEBHOOK_PATH,
+        skip_updates=skip_updates,
+        on_startup=on_startup_webhook,
+        on_shutdown=on_shutdown,
+        web_app=web.Application(middlewares=[check_secret_token])
+    )
+    webhook_executor.run_app(
+        host=WEBAPP_HOST,
+        port=WEBAPP_PORT,
+        shutdown_timeout=SHUTDOWN_DRAIN_TIMEOUT
+    )
+
+
 if __name__ == '__main__':
-    polling()
+    if BOT_MODE == 'webhook':
+        webhook()
+    else:
+        polling()
@@ -4,17 +4,96 @@ import os
 load_dotenv()  # take environment variables from .env.
 
 TGBOT_TOKEN = os.getenv('TGBOT_TOKEN')
+# polling or webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# webhook: public url of the bot, path of updates and secret token
+# that telegram sends in X-Telegram-Bot-Api-Secret-Token
+# (1-256 chars of A-Z, a-z, 0-9, _ and -; empty - no secret check)
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST') or None
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
+# address of the aiohttp server behind the reverse proxy
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '127.0.0.1')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', 8080))
+# seconds to wait for updates in flight on shutdown
+SHUTDOWN_DRAIN_TIMEOUT = int(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', 30))
 TG_ADMINS_ID = [int(i) for i in os.getenv('TG_ADMINS_ID').split(',') if i]
 
 GSHEET_SERVICE_FILE = os.getenv('GSHEET_SERVICE_FILE')
 BOT_MAILADDRESS = os.getenv('BOT_MAILADDRESS')
+# seconds before cached spreadsheet and worksheet handles are reopened
+GSHEET_CACHE_TTL = int(os.getenv('GSHEET_CACHE_TTL', 600))
+# seconds the FAQ of a game is served from memory instead of the sheet
+GSHEET_FAQ_CACHE_TTL = int(os.getenv('GSHEET_FAQ_CACHE_TTL', 600))
+# max rows written to a worksheet by one append request
+GSHEET_APPEND_CHUNK_SIZE = int(os.getenv('GSHEET_APPEND_CHUNK_SIZE', 500))
+# Sheets API quota shared by all requests of the bot
+GSHEET_REQUESTS_PER_MINUTE = int(os.getenv('GSHEET_REQUESTS_PER_MINUTE', 60))
+# retries on 429/5xx with exponential backoff: base * 2^attempt, capped
+GSHEET_MAX_RETRIES = int(os.getenv('GSHEET_MAX_RETRIES', 5))
+GSHEET_BACKOFF_BASE = float(os.getenv('GSHEET_BACKOFF_BASE', 1))
+GSHEET_BACKOFF_MAX = float(os.getenv('GSHEET_BACKOFF_MAX', 32))
+# background export queue: seconds between flushes, entries per flush,
+# failed attempts after which an entry is skipped, seconds the entries
+# taken by one bot process are hidden from the others
+GSHEET_OUTBOX_INTERVAL = int(os.getenv('GSHEET_OUTBOX_INTERVAL', 10))
+GSHEET_OUTBOX_BATCH_SIZE = int(os.getenv('GSHEET_OUTBOX_BATCH_SIZE', 1000))
+GSHEET_OUTBOX_MAX_ATTEMPTS = int(os.getenv('GSHEET_OUTBOX_MAX_ATTEMPTS', 20))
+GSHEET_OUTBOX_CLAIM_TTL = int(os.getenv('GSHEET_OUTBOX_CLAIM_TTL', 600))
+# queued registrations that trigger a flush before the next interval
+GSHEET_REGISTRATION_BATCH_SIZE = int(
+    os.getenv('GSHEET_REGISTRATION_BATCH_SIZE', 50))
+# pygsheets - real spreadsheets, fake - local stand-in for tests and load runs
+GSHEET_BACKEND = os.getenv('GSHEET_BACKEND', 'pygsheets')
+# fake backend: json file with sheets (in memory if empty), seconds per call,
+# share of calls failing with 503, calls per minute before 429 (0 - no limit)
+GSHEET_FAKE_FILE = os.getenv('GSHEET_FAKE_FILE') or None
+GSHEET_FAKE_LATENCY = float(os.getenv('GSHEET_FAKE_LATENCY', 0))
+GSHEET_FAKE_ERROR_RATE = float(os.getenv('GSHEET_FAKE_ERROR_RATE', 0))
+GSHEET_FAKE_REQUESTS_PER_MINUTE = int(
+    os.getenv('GSHEET_FAKE_REQUESTS_PER_MINUTE', 0))
 
 DB_HOST = os.getenv('DB_HOST')
 DB_NAME = os.getenv('DB_NAME')
 DB_USER = os.getenv('DB_USER')
 DB_PASS = os.getenv('DB_PASS')
 DB_PORT = os.getenv('DB_PORT')
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+# seconds of idle time after which a pooled connection is pinged on checkout
+DB_POOL_PING_INTERVAL = int(os.getenv('DB_POOL_PING_INTERVAL', 30))
+# attempts of a transaction aborted by a deadlock or serialization failure
+DB_TRANSACTION_MAX_ATTEMPTS = int(os.getenv('DB_TRANSACTION_MAX_ATTEMPTS', 3))
 
 SUPERADMIN_PASS = os.getenv('SUPERADMIN_PASS')
 
 TIMEZONE_SERVER = int(os.getenv('TIMEZONE_SERVER'))
+
+# cache of business objects: max objects per class, time to live in seconds
+CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', 5000))
+CACHE_TTL = int(os.getenv('CACHE_TTL', 3600)) or None
+
+# companies on one page of the market message
+MARKET_PAGE_SIZE = int(os.getenv('MARKET_PAGE_SIZE', 8))
+# seconds between messages of the guide sent after registration
+ONBOARDING_MESSAGE_DELAY = float(os.getenv('ONBOARDING_MESSAGE_DELAY', 3))
+
+# seconds between reconciliations of the blocked users set with the db
+BLOCKED_USERS_RELOAD_INTERVAL = int(
+    os.getenv('BLOCKED_USERS_RELOAD_INTERVAL', 300))
+
+# memory or postgres (survives restarts, shared by all bot processes)
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory')
+# postgres storage: seconds a state is cached locally (0 - no cache, use it
+# when updates of one chat can reach different processes), seconds after
+# which an unchanged state is dropped
+FSM_CACHE_TTL = int(os.getenv('FSM_CACHE_TTL', 30))
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', 86400))
+
+# Telegram limits shared by all sends: messages per second for the bot,
+# seconds between messages to one chat
+TG_MESSAGES_PER_SECOND = int(os.getenv('TG_MESSAGES_PER_SECOND', 25))
+TG_CHAT_MESSAGE_INTERVAL = float(os.getenv('TG_CHAT_MESSAGE_INTERVAL', 1))
+# concurrent senders of one mailing, seconds between progress updates
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', 10))
+BROADCAST_PROGRESS_INTERVAL = int(os.getenv('BROADCAST_PROGRESS_INTERVAL', 5))
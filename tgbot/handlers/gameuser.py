@@ -4,6 +4,7 @@ import time
 from loguru import logger
 
 from aiogram import Bot, Dispatcher, executor, types
+from aiogram.utils.exceptions import MessageNotModified
 
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
@@ -12,81 +13,111 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 from tgbot.loader import dp, bot
 from tgbot.keyboards.inline import make_inline_keyboard, button_cb
 from tgbot.keyboards.gameuser import gameuser_keyboard, \
-    make_keyboard_for_deal, make_keyboard_for_company, \
+    make_keyboard_for_deal, make_keyboard_for_market, \
     market_button_word, portfolio_button_word, chart_button_word, \
     how_to_use_button_word, update_button_word, gameuser_buttons_list, \
     buy_button, sell_button, cancel_button
     
 from tgbot.utils.file_manager import get_text_from
+from tgbot.config import MARKET_PAGE_SIZE
 from tgbot.services.business_logic import Company, DealIllegal, Game, MarketBot, \
-    NotEnoughMoney, SuperAdmin, GameUser, TgUser
+    NotEnoughMoney, SuperAdmin, GameUser, TgUser, MarketClosed
 
 
 #  ---------------------------------------------------------- КЛАВИАТУРА ИГРОКА
 
 
-async def send_market(message: types.Message, gameuser: GameUser):
-    logger.info(f'send_market to: {message.from_user.id}')
-    game = gameuser.get_game()
-    is_market_open = game.is_market_open_now()
+async def make_market_page(gameuser: GameUser, page: int) -> tuple:
+    """Страница рынка: текст и клавиатура. Данные - одним запросом.
 
-    cash = gameuser.get_cash()
-    if is_market_open:
+    Returns:
+        tuple: (text: str, keyboard: InlineKeyboardMarkup)
+    """
+    market = await gameuser.aio.get_market()
+    companies = market['companies']
+    pages = max(1, -(-len(companies) // MARKET_PAGE_SIZE))
+    page = page % pages
+    page_companies = companies[
+        page * MARKET_PAGE_SIZE:(page + 1) * MARKET_PAGE_SIZE]
+
+    if market['is_market_open']:
         market_closed = '\nРынок открыт'
     else:
         market_closed = '\n<b>Рынок закрыт</b>'
 
     text = (
         'Это список всех компаний.'
-        f'\nВаш баланс: { round(cash) }'
+        f'\nВаш баланс: { round(market["cash"]) }'
         f'{ market_closed }'
     )
+    for company in page_companies:
+        text += (
+            f'\n\n📈 <b>{ company["name"] }</b> ({ company["ticker"] })'
+            f'\nЦена: { round(company["price"]) }'
+            f'\nУ вас в портфеле этих акций: { company["count"] }'
+        )
+    keyboard = await make_keyboard_for_market(
+        page_companies, page, pages, market['is_market_open'])
+    return text, keyboard
+
+
+async def send_market(message: types.Message, gameuser: GameUser):
+    logger.info(f'send_market to: {message.from_user.id}')
+    text, keyboard = await make_market_page(gameuser, page=0)
     await message.answer(
         text=text,
-        reply_markup=gameuser_keyboard
+        reply_markup=keyboard
     )
-    companes = game.get_list_of_actual_companyes()
-    for company in companes:
-        count = len(
-            gameuser.get_list_of_shares(
-                company_id=company.get_id()
-            )
-        )
-        text = (
-            f'📈 <b>{ company.get_name() }</b> ({ company.get_ticker() })'
-            f'\nЦена: {round(company.get_price())}'
-            f'\nУ вас в портфеле этих акций: { count }'
-        )
-        if is_market_open:
-            keyboard = await make_keyboard_for_company(company.get_id())
-        else:
-            keyboard = None
-        await message.answer(
+
+
+@dp.callback_query_handler(
+    button_cb.filter(question_name=['market_page']),
+    state='*')
+async def callback_market_page(
+        query: types.CallbackQuery,
+        callback_data: Dict[str, str]):
+    """Листает и обновляет сообщение рынка на месте."""
+    logger.info(f'Got this callback data: {callback_data}')
+
+    gameuser_id = await MarketBot().aio.get_active_gameuser_id_for(
+        query.from_user.id)
+    if not gameuser_id:
+        await query.answer()
+        return
+    gameuser = await GameUser.aget(gameuser_id)
+
+    text, keyboard = await make_market_page(
+        gameuser, page=int(callback_data['data']))
+    try:
+        await query.message.edit_text(
             text=text,
             reply_markup=keyboard
         )
+    except MessageNotModified:
+        pass
+    await query.answer()
 
 
 async def send_gameuser_partfolio(message: types.Message, gameuser: GameUser):
     logger.info(f'send_gameuser_partfolio to: {message.from_user.id}')
-    size = gameuser.get_portfolio_size()
+    portfolio = await gameuser.aio.get_portfolio()
+    cash = portfolio['cash']
+    size = cash + sum(position['value'] for position in portfolio['positions'])
+
+    def weight(value: float) -> str:
+        return f'{round(100 * value / size, 1)}%' if size else '0%'
 
     text = (
         f'Оценка портфеля: { round(size) }'
-        f'\nСвободные средства: { round(gameuser.get_cash()) }'
+        f'\nСвободные средства: { round(cash) } ({ weight(cash) })'
         '\n------------------'
     )
-    shares_dict = {}
-    for share in gameuser.get_list_of_shares():
-        if share.get_company_id() in shares_dict:
-            shares_dict[share.get_company_id()] += 1
-        else:
-            shares_dict[share.get_company_id()] = 1
-
-    for company_id, number in shares_dict.items():
-        company = Company.get(company_id)
-        s = f'\n{company.get_ticker()} - {number} - {round(company.get_price())}'
-        text += s
+    for position in portfolio['positions']:
+        text += (
+            f'\n{ position["ticker"] } - { position["quantity"] }'
+            f' × { round(position["price"]) }'
+            f' = { round(position["value"]) } ({ weight(position["value"]) })'
+        )
     await message.answer(
         text=text,
         reply_markup=gameuser_keyboard
@@ -95,9 +126,7 @@ async def send_gameuser_partfolio(message: types.Message, gameuser: GameUser):
 
 async def send_gameuser_chart_link(message: types.Message, gameuser: GameUser):
     logger.info(f'send_gameuser_chart_link to: {message.from_user.id}')
-    gameuser_id = MarketBot().get_active_gameuser_id_for(message.from_user.id)
-    gameuser = GameUser.get(gameuser_id)
-    game = gameuser.get_game()
+    game = await gameuser.aio.get_game()
 
     text = (
         'Здесть публикуются ссылки на графики и статистику по рынку'
@@ -116,9 +145,7 @@ async def send_gameuser_chart_link(message: types.Message, gameuser: GameUser):
 
 async def send_gameuser_help(message: types.Message, gameuser: GameUser):
     logger.info(f'send_gameuser_help to: {message.from_user.id}')
-    gameuser_id = MarketBot().get_active_gameuser_id_for(message.from_user.id)
-    gameuser = GameUser.get(gameuser_id)
-    game = gameuser.get_game()
+    game = await gameuser.aio.get_game()
 
     text = (
         f'{ get_text_from("./tgbot/text_of_questions/instruction.txt") }'
@@ -130,7 +157,7 @@ async def send_gameuser_help(message: types.Message, gameuser: GameUser):
     )
 
     FAQ_text = 'Часто задаваемые вопросы:'
-    for QA_dict in game.get_FAQ():
+    for QA_dict in await game.aio.get_FAQ():
         FAQ_text += (
             f"\n\n◾ <b>{ QA_dict['question'] }</b>"
             f"\n{ QA_dict['answer'] }"
@@ -167,9 +194,10 @@ async def gameuser_keyboard_push(message: types.Message, state: FSMContext):
     """
     logger.info(f'push gameuser_keyboard from: {message.from_user.id}')
     
-    gameuser_id = MarketBot().get_active_gameuser_id_for(message.from_user.id)
+    gameuser_id = await MarketBot().aio.get_active_gameuser_id_for(
+        message.from_user.id)
     if gameuser_id:
-        gameuser = GameUser.get(gameuser_id)
+        gameuser = await GameUser.aget(gameuser_id)
     else:
         logger.error(f'push button from unkown user: {message.from_user.id}')
         return
@@ -193,17 +221,19 @@ async def callback_market_deal(
         state: FSMContext):
     logger.info(f'Got this callback data: {callback_data}')
     
-    gameuser_id = MarketBot().get_active_gameuser_id_for(query.from_user.id)
-    gameuser = GameUser.get(gameuser_id)
-    game = gameuser.get_game()
+    gameuser_id = await MarketBot().aio.get_active_gameuser_id_for(
+        query.from_user.id)
+    gameuser = await GameUser.aget(gameuser_id)
+    game = await gameuser.aio.get_game()
 
-    if not game.is_market_open_now():
+    if not await game.aio.is_market_open_now():
         await query.message.answer(
             get_text_from('./tgbot/text_of_questions/market_is_close.txt'))
         return
 
-    company = Company.get(callback_data['data'])
-    if company.get_price() == 0:
+    company = await Company.aget(int(callback_data['data']))
+    price = await company.aio.get_price()
+    if price == 0:
         await query.message.answer(
             get_text_from('./tgbot/text_of_questions/company_was_liquidated.txt'))
         return
@@ -212,14 +242,12 @@ async def callback_market_deal(
             '<b>Введи количество</b> акций'
             f' { company.get_name() } ({ company.get_ticker() })'
             ' которое хочешь купить.'
-            f'\nСтоимость одной акции: {round(company.get_price())}'
-            f'\nВаши свободные средства: { round(gameuser.get_cash()) }'
+            f'\nСтоимость одной акции: {round(price)}'
+            f'\nВаши свободные средства: { round(await gameuser.aio.get_cash()) }'
         )
     elif callback_data['answer'] == sell_button:
-        count = len(
-            gameuser.get_list_of_shares(
-                company_id=company.get_id()
-            )
+        count = await gameuser.aio.get_number_of_shares(
+            company_id=company.get_id()
         )
         if count == 0:
             await query.message.answer(
@@ -229,7 +257,7 @@ async def callback_market_deal(
             '<b>Введи количество</b> акций'
             f' { company.get_name() } ({ company.get_ticker() })'
             ' которое хочешь продать?'
-            f'\nСтоимость одной акции: {round(company.get_price())}'
+            f'\nСтоимость одной акции: {round(price)}'
             f'\nВ портфеле этих акций: { count }'
         )
     await MarketDeal.waiting_number_shares.set()
@@ -280,24 +308,29 @@ async def number_of_shares(message: types.Message, state: FSMContext):
         return
     state_data = await state.get_data()
 
-    gameuser_id = MarketBot().get_active_gameuser_id_for(message.from_user.id)
-    gameuser = GameUser.get(gameuser_id)
-    game = gameuser.get_game()
-    company = Company.get(state_data['data_'])
+    gameuser_id = await MarketBot().aio.get_active_gameuser_id_for(
+        message.from_user.id)
+    gameuser = await GameUser.aget(gameuser_id)
+    game = await gameuser.aio.get_game()
+    company = await Company.aget(int(state_data['data_']))
 
-    if not game.is_market_open_now():
+    if not await game.aio.is_market_open_now():
         await message.answer(
             get_text_from('./tgbot/text_of_questions/market_is_close.txt'))
         return
 
     if state_data['answer'] == buy_button:
         try:
-            game.buy_deal(
+            await game.aio.buy_deal(
                 buyer=gameuser,
                 company=company,
                 shares_number=number
             )
             text_was_sold = f'Успешная покупка {number} акций(я) компании '
+        except MarketClosed:
+            await message.answer(
+                get_text_from('./tgbot/text_of_questions/market_is_close.txt'))
+            return
         except NotEnoughMoney:
             await message.answer(
                 get_text_from(
@@ -314,24 +347,27 @@ async def number_of_shares(message: types.Message, state: FSMContext):
                 ))
             return
     elif state_data['answer'] == sell_button:
-        real_number = game.sell_deal(
-            seller=gameuser,
-            company=company,
-            shares_number=number
-        )
+        try:
+            real_number = await game.aio.sell_deal(
+                seller=gameuser,
+                company=company,
+                shares_number=number
+            )
+        except MarketClosed:
+            await message.answer(
+                get_text_from('./tgbot/text_of_questions/market_is_close.txt'))
+            return
         text_was_sold = f'Успешно продано {real_number} акций(я) компании'
     await state.finish()
-    count = len(
-        gameuser.get_list_of_shares(
-            company_id=company.get_id()
-        )
+    count = await gameuser.aio.get_number_of_shares(
+        company_id=company.get_id()
     )
 
     text = (
         f'{text_was_sold}'
         f'{ company.get_name() } ({ company.get_ticker() }).'
         f'\n\nТеперь в портфеле этих акций: { count }'
-        f'\nВаш баланс: { round(gameuser.get_cash()) }'
+        f'\nВаш баланс: { round(await gameuser.aio.get_cash()) }'
     )
     await bot.delete_message(
         chat_id=message.from_user.id,
@@ -1,6 +1,5 @@
 from random import randrange
 from typing import List, Dict
-import time
 from loguru import logger
 
 from aiogram import Bot, Dispatcher, executor, types
@@ -12,6 +11,8 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 from tgbot.loader import dp
 from tgbot.keyboards.gameuser import gameuser_keyboard
 from tgbot.utils.file_manager import get_text_from
+from tgbot.utils.scheduled_messages import schedule_messages
+from tgbot.config import ONBOARDING_MESSAGE_DELAY
 from tgbot.filters.content import TextNotComand
 from tgbot.services.business_logic import Company, DealIllegal, Game, MarketBot, \
     NotEnoughMoney, SuperAdmin, GameUser, TgUser
@@ -39,7 +40,7 @@ async def new_gameuser_command(message: types.Message, state: FSMContext):
     state=NewGameUser.waiting_game_key)
 async def gameuser_gamekey(message: types.Message, state: FSMContext):
     logger.info(f'gameuser_gamekey from: {message.from_user.id}')
-    game = MarketBot().get_game_by_game_key(
+    game = await MarketBot().aio.get_game_by_game_key(
         game_key=message.text
     )
 
@@ -49,20 +50,20 @@ async def gameuser_gamekey(message: types.Message, state: FSMContext):
             get_text_from('./tgbot/text_of_questions/game_key_wrong.txt'))
         return
 
-    if not game.is_registration_open():
+    if not await game.aio.is_registration_open():
         logger.warning(f'registration closed: {game.game_id}')
         await message.answer(
             get_text_from('./tgbot/text_of_questions/registration_closed.txt'))
         return
 
-    if game.gameuser_in_game(tg_id=message.from_user.id):
+    if await game.aio.gameuser_in_game(tg_id=message.from_user.id):
         logger.info(f'gameuser already exist: {message.from_user.id}')
         await state.finish()
         await message.answer(
             get_text_from('./tgbot/text_of_questions/gameuser_in_game.txt'))
     else:
-        gameuser = game.add_gameuser(tg_id=message.from_user.id)
-        gameuser.activate()
+        gameuser = await game.aio.add_gameuser(tg_id=message.from_user.id)
+        await gameuser.aio.activate()
         await NewGameUser.next()
         await message.answer(
                 get_text_from('./tgbot/text_of_questions/game_key_correct.txt'))
@@ -74,9 +75,10 @@ async def gameuser_gamekey(message: types.Message, state: FSMContext):
 async def gameuser_lastname(message: types.Message, state: FSMContext):
     logger.info(f'gameuser_lastname from: {message.from_user.id}')
 
-    gameuser_id = MarketBot().get_active_gameuser_id_for(message.from_user.id)
-    gameuser = GameUser.get(gameuser_id)
-    gameuser.change_last_name(
+    gameuser_id = await MarketBot().aio.get_active_gameuser_id_for(
+        message.from_user.id)
+    gameuser = await GameUser.aget(gameuser_id)
+    await gameuser.aio.change_last_name(
         new_last_name=message.text
     )
     await NewGameUser.next()
@@ -90,9 +92,10 @@ async def gameuser_lastname(message: types.Message, state: FSMContext):
 async def gameuser_firstname(message: types.Message, state: FSMContext):
     logger.info(f'gameuser_firstname from: {message.from_user.id}')
 
-    gameuser_id = MarketBot().get_active_gameuser_id_for(message.from_user.id)
-    gameuser = GameUser.get(gameuser_id)
-    gameuser.change_first_name(
+    gameuser_id = await MarketBot().aio.get_active_gameuser_id_for(
+        message.from_user.id)
+    gameuser = await GameUser.aget(gameuser_id)
+    await gameuser.aio.change_first_name(
         new_first_name=message.text
     )
     await NewGameUser.next()
@@ -106,24 +109,25 @@ async def gameuser_firstname(message: types.Message, state: FSMContext):
 async def gameuser_nickname(message: types.Message, state: FSMContext):
     logger.info(f'gameuser_nickname from: {message.from_user.id}')
 
-    gameuser_id = MarketBot().get_active_gameuser_id_for(message.from_user.id)
-    gameuser = GameUser.get(gameuser_id)
-    if gameuser.is_nickname_unique(nickname=message.text):
-        gameuser.change_nickname(
-            new_nickname=message.text
+    gameuser_id = await MarketBot().aio.get_active_gameuser_id_for(
+        message.from_user.id)
+    gameuser = await GameUser.aget(gameuser_id)
+    if await gameuser.aio.is_nickname_unique(nickname=message.text):
+        game = await gameuser.aio.get_game()
+        await game.aio.finish_registration(
+            gameuser=gameuser,
+            nickname=message.text
         )
         await state.finish()
         text = (
-            f'{gameuser.get_first_name()}, я успешно зарегистрировал '
-            f'тебя в игре {gameuser.get_game().game_id} '
-            f'под ником {gameuser.get_nickname()}'
+            f'{await gameuser.aio.get_first_name()}, я успешно зарегистрировал '
+            f'тебя в игре {game.game_id} '
+            f'под ником {message.text}'
         )
         await message.answer(
             text,
             reply_markup=gameuser_keyboard
         )
-        game = gameuser.get_game()
-        game.add_gameuser_in_sheet(gameuser_id)
         await start_guide(message)
     else:
         logger.info(f'wrong gameuser_nickname from: {message.from_user.id}')
@@ -132,12 +136,21 @@ async def gameuser_nickname(message: types.Message, state: FSMContext):
 
 
 async def start_guide(message: types.Message):
+    """Первое сообщение гайда сразу, остальные - по расписанию
+    через ONBOARDING_MESSAGE_DELAY секунд одно за другим."""
     logger.info(f'start_guide from: {message.from_user.id}')
     await message.answer(
             get_text_from('./tgbot/text_of_questions/about_1.txt'))
-    time.sleep(3)
-    await message.answer(
-            get_text_from('./tgbot/text_of_questions/about_2.txt'))
-    time.sleep(3)
-    await message.answer(
-            get_text_from('./tgbot/text_of_questions/about_3.txt'))
\ No newline at end of file
+    await schedule_messages(
+        tg_id=message.from_user.id,
+        messages=[
+            (
+                ONBOARDING_MESSAGE_DELAY,
+                get_text_from('./tgbot/text_of_questions/about_2.txt')
+            ),
+            (
+                2 * ONBOARDING_MESSAGE_DELAY,
+                get_text_from('./tgbot/text_of_questions/about_3.txt')
+            ),
+        ]
+    )
\ No newline at end of file
@@ -25,7 +25,7 @@ def get_empty_keyboard():
 async def start_command(message: types.Message, state: FSMContext):
     logger.info(f'start command from: {message.from_user.id}')
 
-    MarketBot().add_tg_user(
+    await MarketBot().aio.add_tg_user(
         tg_id=message.from_user.id,
         tg_username=message.from_user.username
     )
@@ -38,10 +38,11 @@ async def start_command(message: types.Message, state: FSMContext):
 @dp.message_handler(commands=['help'], state="*")
 async def send_help(message: types.Message, state: FSMContext):
     logger.info(f'help command from: {message.from_user.id}')
-    gameuser_id = MarketBot().get_active_gameuser_id_for(message.from_user.id)
+    gameuser_id = await MarketBot().aio.get_active_gameuser_id_for(
+        message.from_user.id)
     await state.finish()
     if gameuser_id:
-        gameuser = GameUser.get(gameuser_id)
+        gameuser = await GameUser.aget(gameuser_id)
         await send_gameuser_help(
             message=message,
             gameuser=gameuser
@@ -15,10 +15,12 @@ from tgbot.loader import dp
 from tgbot.config import SUPERADMIN_PASS, BOT_MAILADDRESS
 from tgbot.keyboards.inline import make_inline_keyboard, button_cb
 from tgbot.utils.file_manager import get_text_from
-from tgbot.utils.broadcast import send_post, broadcast_post
+from tgbot.utils.broadcast import send_post, broadcast_post, \
+    start_broadcast, send_post_to_user
 from tgbot.utils.pars_messages import parse_message, Post
 from tgbot.services.business_logic import Company, DealIllegal, Game, MarketBot, \
     NotEnoughMoney, SuperAdmin, GameUser, TgUser
+from tgbot.services.db_managing import run_in_db_executor
 
 
 #  ------------------------------------------------------ СОСТОЯНИЯ СУПЕРАДМИНА
@@ -35,12 +37,12 @@ async def superadmin_command_from_real_admin(message: types.Message):
 @dp.message_handler(commands=['superadmin', 'sa'], state="*")
 async def superadmin_command(message: types.Message):
     logger.info(f'superadmin_command from: {message.from_user.id}')
-    if message.from_user.id in MarketBot().get_superadmin_tg_ids():
+    if message.from_user.id in await MarketBot().aio.get_superadmin_tg_ids():
         await superadmin_command_from_real_admin(message)
     else:
         await message.answer(
             "Вы пытаетесь войти в меню Суперадмина. Введите пароль:")
-        MarketBot().add_tg_user(
+        await MarketBot().aio.add_tg_user(
             tg_id=message.from_user.id,
             tg_username=message.from_user.username
         )
@@ -54,7 +56,7 @@ async def check_superadmin_pass(message: types.Message, state: FSMContext):
     logger.info(f'check_superadmin_pass from: {message.from_user.id}')
     if message.text == SUPERADMIN_PASS:
         await message.answer("Верный пароль")
-        MarketBot().add_superadmin(message.from_user.id)
+        await MarketBot().aio.add_superadmin(message.from_user.id)
         await superadmin_command_from_real_admin(message)
         await state.finish()
     else:
@@ -70,10 +72,10 @@ class NewGameState(StatesGroup):
 @dp.message_handler(commands=['new_game'], state="*")
 async def new_game_command(message: types.Message, state: FSMContext):
     logger.info(f'new_game_command from: {message.from_user.id}')
-    if message.from_user.id not in MarketBot().get_superadmin_tg_ids():
+    if message.from_user.id not in await MarketBot().aio.get_superadmin_tg_ids():
         return
     await NewGameState.waiting_gs_link.set()
-    game_id = SuperAdmin.create_new_game()
+    game_id = await run_in_db_executor(SuperAdmin.create_new_game)
     await state.update_data(game_id=game_id)
 
     await message.answer(
@@ -88,10 +90,10 @@ async def new_game_command(message: types.Message, state: FSMContext):
     state=NewGameState.waiting_gs_link)
 async def new_gs_link(message: types.Message, state: FSMContext):
     logger.info(f'new_gs_link from: {message.from_user.id}')
-    if Game.is_url_correct(gs_url=message.text):
+    if await run_in_db_executor(Game.is_url_correct, gs_url=message.text):
         state_data = await state.get_data()
-        game = Game.get(state_data['game_id'])
-        game.change_gslink(message.text)
+        game = await Game.aget(state_data['game_id'])
+        await game.aio.change_gslink(message.text)
         await state.finish()
 
         MarketBot().create_load_base_schedule(
@@ -137,10 +139,10 @@ async def make_keyboard_for_game(game_id: int):
 
 async def make_text_for_game(game: Game):
     text = (
-        f'Игра: {game.game_id} {game.get_name()}\n'
-        f'Ссылка: <a href="{game.get_gs_link()}">google sheet</a> \n'
-        f'Регистрация: {game.is_registration_open()} \n'
-        f'Торги: {game.is_market_open_now()} \n'
+        f'Игра: {game.game_id} {await game.aio.get_name()}\n'
+        f'Ссылка: <a href="{await game.aio.get_gs_link()}">google sheet</a> \n'
+        f'Регистрация: {await game.aio.is_registration_open()} \n'
+        f'Торги: {await game.aio.is_market_open_now()} \n'
     )
     return text
 
@@ -148,10 +150,10 @@ async def make_text_for_game(game: Game):
 @dp.message_handler(commands=['all_games'], state="*")
 async def all_game_command(message: types.Message, state: FSMContext):
     logger.info(f'all_games_command from: {message.from_user.id}')
-    if message.from_user.id not in MarketBot().get_superadmin_tg_ids():
+    if message.from_user.id not in await MarketBot().aio.get_superadmin_tg_ids():
         return
     await message.answer('Все игры:')
-    for game in MarketBot().get_games():
+    for game in await MarketBot().aio.get_games():
         keyboard = await make_keyboard_for_game(game.game_id)
         text = await make_text_for_game(game)
         await message.answer(
@@ -166,8 +168,8 @@ async def delete_game(message: types.Message, game_id: int):
 
 async def stop_registration_game(message: types.Message, game_id: int):
     logger.info(f'stop_registration_game from: {message.from_user.id}')
-    game = Game.get(game_id)
-    game.close_registration()
+    game = await Game.aget(game_id)
+    await game.aio.close_registration()
 
     keyboard = await make_keyboard_for_game(game.game_id)
     text = await make_text_for_game(game)
@@ -182,8 +184,8 @@ async def stop_registration_game(message: types.Message, game_id: int):
 
 async def open_registration_game(message: types.Message, game_id: int):
     logger.info(f'open_registration_game from: {message.from_user.id}')
-    game = Game.get(game_id)
-    game.open_registration()
+    game = await Game.aget(game_id)
+    await game.aio.open_registration()
 
     keyboard = await make_keyboard_for_game(game.game_id)
     text = await make_text_for_game(game)
@@ -198,8 +200,8 @@ async def open_registration_game(message: types.Message, game_id: int):
 
 async def stop_market_game(message: types.Message, game_id: int):
     logger.info(f'stop_market_game from: {message.from_user.id}')
-    game = Game.get(game_id)
-    game.close_market()
+    game = await Game.aget(game_id)
+    await game.aio.close_market()
 
     keyboard = await make_keyboard_for_game(game.game_id)
     text = await make_text_for_game(game)
@@ -215,9 +217,9 @@ async def stop_market_game(message: types.Message, game_id: int):
 async def stop_market_and_job_after_game(message: types.Message, game_id: int):
     logger.info(f'stop_market_and_job_after_game from: {message.from_user.id}')
     answer = await message.answer('Расчет запущен...')
-    game = Game.get(game_id)
+    game = await Game.aget(game_id)
     try:
-        game.job_after_close()
+        await game.aio.job_after_close()
         await answer.delete()
     except Exception as e:
         await message.answer('При расчете произошла ошибка')
@@ -237,8 +239,8 @@ async def stop_market_and_job_after_game(message: types.Message, game_id: int):
 
 async def open_market_game(message: types.Message, game_id: int):
     logger.info(f'open_market_game from: {message.from_user.id}')
-    game = Game.get(game_id)
-    game.open_market()
+    game = await Game.aget(game_id)
+    await game.aio.open_market()
 
     keyboard = await make_keyboard_for_game(game.game_id)
     text = await make_text_for_game(game)
@@ -253,8 +255,8 @@ async def open_market_game(message: types.Message, game_id: int):
 async def update_base_game(message: types.Message, game_id: int):
     logger.info(f'update_base_game from: {message.from_user.id}')
     answer = await message.answer('Начинаю обновление ...')
-    game: Game = Game.get(game_id)
-    result_loading = game.load_base_value()
+    game: Game = await Game.aget(game_id)
+    result_loading = await game.aio.load_base_value()
 
     await answer.delete()
     if result_loading:
@@ -283,12 +285,12 @@ async def superadmin_buttons(
         callback_data: Dict[str, str],
         state: FSMContext):
     logger.info(f'Got this callback data: {callback_data}')
-    if query.from_user.id not in MarketBot().get_superadmin_tg_ids():
+    if query.from_user.id not in await MarketBot().aio.get_superadmin_tg_ids():
         return
 
     await gameadmin_button_dict[callback_data['answer']](
         message=query.message,
-        game_id=callback_data['data']
+        game_id=int(callback_data['data'])
     )
 
 
@@ -296,7 +298,7 @@ async def superadmin_buttons(
 @dp.message_handler(commands=['ban', 'justify'], state="*")
 async def ban_command(message: types.Message, state: FSMContext):
     logger.info(f'ban_command from: {message.from_user.id}')
-    if message.from_user.id not in MarketBot().get_superadmin_tg_ids():
+    if message.from_user.id not in await MarketBot().aio.get_superadmin_tg_ids():
         return
 
     words_command: List[str] = message.text.split(' ')
@@ -307,16 +309,16 @@ async def ban_command(message: types.Message, state: FSMContext):
 
     command, tg_id = words_command
     try:
-        user = TgUser.get(int(tg_id))
+        user = await TgUser.aget(int(tg_id))
     except Exception:
         await message.reply('id не найден')
         return
 
     if command == '/ban':
-        user.ban()
+        await user.aio.ban()
         await message.reply('забанено')
     elif command == '/justify':
-        user.unban()
+        await user.aio.unban()
         await message.reply('разбанено')
 
 
@@ -329,7 +331,7 @@ mailing_cb = CallbackData('mailing_cb', 'target')
 @dp.message_handler(commands=['mailing'], state='*')
 async def letter_for_mailing_handler(message: types.Message):
     logger.info(f'letter_for_mailing_handler from: {message.from_user.id}',)
-    if message.from_user.id not in MarketBot().get_superadmin_tg_ids():
+    if message.from_user.id not in await MarketBot().aio.get_superadmin_tg_ids():
         return
     text = 'Напишите сообщение. Потом можно будет выбрать кому его отправить.'
     await Mailing.WaitLetter.set()
@@ -354,7 +356,7 @@ async def start_mailing_handler(message: types.Message, state: FSMContext):
                     callback_data=mailing_cb.new(target='delete')),
             ]
         )
-    for game in MarketBot().get_games():
+    for game in await MarketBot().aio.get_games():
         inline_buttons.append(
             [
                 InlineKeyboardButton(
@@ -366,7 +368,10 @@ async def start_mailing_handler(message: types.Message, state: FSMContext):
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=inline_buttons
     )
-    await broadcast_post(parsed_post, message.from_user.id, reply_markup=keyboard)
+    # превью админу - ответ в хендлере, идет с приоритетом INTERACTIVE,
+    # а не в очереди рассылки
+    await send_post_to_user(
+        parsed_post, message.from_user.id, reply_markup=keyboard)
 
 
 @dp.callback_query_handler(mailing_cb.filter())
@@ -378,11 +383,10 @@ async def mailing_broadcast_handler(call: types.CallbackQuery, callback_data: Di
         return
     await call.message.edit_reply_markup(InlineKeyboardMarkup())
 
-    game: Game = Game.get(int(target))
-    users_id = game.get_gameuser_tg_ids()
-    result_text = await broadcast_post(
+    game: Game = await Game.aget(int(target))
+    users_id = await game.aio.get_gameuser_tg_ids()
+    await start_broadcast(
         post=await parse_message(call.message),
         users_id=users_id,
-        show_result=True
+        progress_chat_id=call.message.chat.id
     )
-    await call.message.answer(result_text)
@@ -1,6 +1,7 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, \
+    InlineKeyboardMarkup, InlineKeyboardButton
 
-from tgbot.keyboards.inline import make_inline_keyboard
+from tgbot.keyboards.inline import make_inline_keyboard, button_cb
 
 
 market_button_word = 'Рынок 🏛️'
@@ -40,12 +41,46 @@ def get_gameuser_keyboard() -> ReplyKeyboardMarkup:
     return keyboard
 
 
-async def make_keyboard_for_company(company_id: int):
-    keyboard = await make_inline_keyboard(
-        question_name='market_deal',
-        answers=[buy_button, sell_button],
-        data=company_id
-    )
+async def make_keyboard_for_market(
+        companies: list,
+        page: int,
+        pages: int,
+        is_market_open: bool) -> InlineKeyboardMarkup:
+    """Кнопки сделок для компаний страницы и навигация по страницам.
+
+    Args:
+        companies (list): компании страницы из GameUser.get_market
+    """
+    keyboard = InlineKeyboardMarkup()
+    if is_market_open:
+        for company in companies:
+            keyboard.row(*[
+                InlineKeyboardButton(
+                    f'{answer} {company["ticker"]}',
+                    callback_data=button_cb.new(
+                        question_name='market_deal',
+                        answer=answer,
+                        data=company['company_id']))
+                for answer in (buy_button, sell_button)
+            ])
+
+    def page_button(text: str, page_number: int) -> InlineKeyboardButton:
+        return InlineKeyboardButton(
+            text,
+            callback_data=button_cb.new(
+                question_name='market_page',
+                answer='page',
+                data=page_number % pages))
+
+    refresh_button = page_button(f'🔄 {page + 1}/{pages}', page)
+    if pages > 1:
+        keyboard.row(
+            page_button('⬅️', page - 1),
+            refresh_button,
+            page_button('➡️', page + 1)
+        )
+    else:
+        keyboard.row(refresh_button)
     return keyboard
 
 
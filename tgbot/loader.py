@@ -1,14 +1,20 @@
-from aiogram import Bot, Dispatcher, types
+from aiogram import Dispatcher, types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from tgbot.config import TGBOT_TOKEN
+from tgbot.config import TGBOT_TOKEN, FSM_STORAGE
+from tgbot.utils.rate_limiter import GovernedBot
 
 # Setup storage
-storage = MemoryStorage()
+if FSM_STORAGE == 'postgres':
+    from tgbot.services.fsm_storage import PostgresStorage
+    storage = PostgresStorage()
+else:
+    storage = MemoryStorage()
 
 # Setup bot
-bot = Bot(token=TGBOT_TOKEN, parse_mode=types.ParseMode.HTML)
+# all sends share one rate governor, replies go before mailings
+bot = GovernedBot(token=TGBOT_TOKEN, parse_mode=types.ParseMode.HTML)
 dp = Dispatcher(bot, storage=storage)
 
 # Setup middlewares
@@ -3,7 +3,9 @@ from loguru import logger
 from tgbot.loader import dp
 
 from .authentification import AccessMiddleware
+from .inflight import in_flight_updates
 
 if __name__ == "tgbot.middlewares":
+    dp.middleware.setup(in_flight_updates)
     dp.middleware.setup(AccessMiddleware())
     logger.info('Middlewares configured')
@@ -0,0 +1,47 @@
+import asyncio
+
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from loguru import logger
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Считает апдейты, которые сейчас обрабатываются,
+    чтобы при остановке бота дождаться их завершения."""
+
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    async def on_pre_process_update(
+            self, update: types.Update, data: dict, *arg, **kwargs):
+        self.in_flight += 1
+        self._drained.clear()
+
+    async def on_post_process_update(
+            self, update: types.Update, result, data: dict, *arg, **kwargs):
+        self.in_flight -= 1
+        if self.in_flight <= 0:
+            self.in_flight = 0
+            self._drained.set()
+
+    async def wait_drained(self, timeout: float) -> bool:
+        """Ждет окончания обработки всех апдейтов, не дольше timeout секунд.
+
+        Returns:
+            bool: все апдейты обработаны
+        """
+        if self.in_flight:
+            logger.info(f'waiting for {self.in_flight} updates in flight')
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(
+                f'{self.in_flight} updates still in flight after {timeout}s')
+            return False
+
+
+in_flight_updates = InFlightMiddleware()
@@ -1,50 +1,104 @@
 from __future__ import annotations
-from collections import defaultdict
 import string
+import threading
 import random
 from datetime import date, timezone, timedelta, datetime, time
 from loguru import logger
+from apscheduler.jobstores.base import JobLookupError
 from typing import List
 
-from tgbot.services.gs_module import GameSheet
+from tgbot.services.gs_module import GameSheet, BASE_WS, GAMEUSERS_WS, \
+    TRADING_VOLUME_WS, PRICES_WS, PORTFOLIO_WS
+from tgbot.services.gs_outbox import flush_gs_outbox
+from tgbot.services.cache import ObjectCache
 from tgbot.services.db_managing import CompanyData, GameData, GameUserData, MarketBotData, \
-    ShareData, SuperAdminData, TgUserData, DoesNotExist
-from tgbot.config import TIMEZONE_SERVER
+    SuperAdminData, TgUserData, DoesNotExist, NotEnoughMoney, DealIllegal, \
+    MarketClosed, BaseConnection, OutboxData, FsmStateData, \
+    run_in_db_executor, run_in_transaction
+from tgbot.config import TIMEZONE_SERVER, CACHE_MAX_SIZE, CACHE_TTL, \
+    BLOCKED_USERS_RELOAD_INTERVAL, GSHEET_OUTBOX_INTERVAL, \
+    GSHEET_OUTBOX_MAX_ATTEMPTS, GSHEET_REGISTRATION_BATCH_SIZE, \
+    GSHEET_FAQ_CACHE_TTL, FSM_STORAGE, FSM_STATE_TTL
 from tgbot.loader import scheduler
 
 
-class NotEnoughMoney(Exception):
-    pass
+class AsyncProxy(object):
+    """Awaitable-версия объекта: каждый метод выполняется
+    в пуле потоков БД, а не в event loop.
 
+    Example:
+        cash = await gameuser.aio.get_cash()
+    """
+    def __init__(self, target):
+        self._target = target
 
-class DealIllegal(Exception):
-    pass
+    def __getattr__(self, name):
+        method = getattr(self._target, name)
 
+        async def wrapper(*args, **kwargs):
+            return await run_in_db_executor(method, *args, **kwargs)
+        return wrapper
 
-class CacheMixin(object):
-    __all_objects = defaultdict(dict)
+
+class AsyncMixin(object):
+    @property
+    def aio(self) -> AsyncProxy:
+        return AsyncProxy(self)
+
+
+class CacheMixin(AsyncMixin):
+    """Кэш объектов по ключу, отдельный для каждого класса.
+    Размер и TTL можно переопределить в классе-наследнике."""
+    cache_max_size = CACHE_MAX_SIZE
+    cache_ttl = CACHE_TTL
+    __caches = {}
+    __caches_lock = threading.Lock()
 
     def __init__(self, key):
-        self.__all_objects[self.__class__][key] = self
+        self.get_cache().put(key, self)
+
+    @classmethod
+    def get_cache(cls) -> ObjectCache:
+        cache = cls.__caches.get(cls)
+        if cache is None:
+            with cls.__caches_lock:
+                cache = cls.__caches.setdefault(
+                    cls, ObjectCache(cls.cache_max_size, cls.cache_ttl))
+        return cache
 
     @classmethod
     def get(cls, key):
-        if key in cls.__all_objects[cls]:
-            object_ = cls.__all_objects[cls][key]
-            if object_ is not None:
-                return object_
+        object_ = cls.get_cache().get(key)
+        if object_ is not None:
+            return object_
         try:
-            return cls(key)
+            object_ = cls(key)
         except DoesNotExist:
-            cls.__all_objects[cls][key] = None
             return None
-    
+        cls.get_cache().put(key, object_)
+        return object_
+
+    @classmethod
+    async def aget(cls, key):
+        return await run_in_db_executor(cls.get, key)
+
+    @classmethod
+    def invalidate(cls, key) -> None:
+        cls.get_cache().invalidate(key)
+
     @classmethod
     def clear_cache(cls):
-        cls.__all_objects = defaultdict(dict)
+        cls.get_cache().clear()
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        """Returns:
+            dict: {'size': int, 'hits': int, 'misses': int, 'evictions': int}
+        """
+        return cls.get_cache().stats()
 
 
-class MarketBot():
+class MarketBot(AsyncMixin):
     def __init__(self):
         self.market_bot_data = MarketBotData()
 
@@ -129,6 +183,55 @@ class MarketBot():
         )
         # schedule.every().day.at(close_time_str).do(close_job)
     
+    def create_blocked_users_schedule(self):
+        """Загружает заблокированных пользователей и периодически
+        сверяет их список с БД."""
+        TgUser.load_blocked_tg_ids()
+        scheduler.add_job(
+            func=TgUser.load_blocked_tg_ids,
+            trigger='interval',
+            seconds=BLOCKED_USERS_RELOAD_INTERVAL,
+            id='reload_blocked_users',
+            replace_existing=True
+        )
+
+    def create_gs_outbox_schedule(self):
+        """Фоновая выгрузка очереди в Google Sheets."""
+        scheduler.add_job(
+            func=flush_gs_outbox,
+            trigger='interval',
+            seconds=GSHEET_OUTBOX_INTERVAL,
+            id='flush_gs_outbox',
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
+    def create_fsm_cleanup_schedule(self):
+        """Удаляет из БД состояния FSM старше FSM_STATE_TTL."""
+        if FSM_STORAGE != 'postgres':
+            return
+
+        def job():
+            deleted = FsmStateData.delete_stale(FSM_STATE_TTL)
+            if deleted:
+                logger.info(f'{deleted} stale fsm states deleted')
+        scheduler.add_job(
+            func=job,
+            trigger='interval',
+            hours=1,
+            id='fsm_cleanup',
+            replace_existing=True
+        )
+
+    def flush_gs_outbox_now(self):
+        """Запустить выгрузку очереди, не дожидаясь интервала."""
+        try:
+            scheduler.modify_job(
+                'flush_gs_outbox', next_run_time=datetime.now(timezone.utc))
+        except JobLookupError:
+            logger.warning('gs outbox schedule is not created')
+
     def check_games_and_create_schedule(self):
         for game in MarketBot().get_games():
             if not game.game_is_ended():
@@ -153,6 +256,21 @@ class MarketBot():
 
 
 class TgUser(CacheMixin):
+    # tg_id заблокированных пользователей, чтобы не ходить в БД
+    # на каждый апдейт
+    _blocked_tg_ids = set()
+    _blocked_lock = threading.Lock()
+
+    @staticmethod
+    def load_blocked_tg_ids() -> None:
+        with TgUser._blocked_lock:
+            TgUser._blocked_tg_ids = MarketBotData.get_blocked_tg_ids()
+        logger.info(f'blocked users loaded: {len(TgUser._blocked_tg_ids)}')
+
+    @staticmethod
+    def is_tg_id_blocked(tg_id: int) -> bool:
+        return tg_id in TgUser._blocked_tg_ids
+
     def __init__(self, tg_id: int):
         super(TgUser, self).__init__(key=tg_id)
         self.tg_id = tg_id
@@ -173,11 +291,15 @@ class TgUser(CacheMixin):
 
     def ban(self):
         logger.info(f'ban: {self.tg_id}')
-        self.tg_data.block()
+        with TgUser._blocked_lock:
+            self.tg_data.block()
+            TgUser._blocked_tg_ids.add(self.tg_id)
 
     def unban(self):
         logger.info(f'unban: {self.tg_id}')
-        self.tg_data.unblock()
+        with TgUser._blocked_lock:
+            self.tg_data.unblock()
+            TgUser._blocked_tg_ids.discard(self.tg_id)
 
 
 class SuperAdmin(TgUser):
@@ -220,6 +342,8 @@ class GameUser(CacheMixin):
         return self.gameuser_data.get_cash()
 
     def change_cash(self, new_cash: float):
+        # кэш не сбрасываем: get_cash всегда читает баланс из БД,
+        # а остальные поля игрока от денег не зависят
         self.gameuser_data.change_cash(new_cash=new_cash)
 
     def change_last_name(self, new_last_name: str) -> None:
@@ -249,28 +373,52 @@ class GameUser(CacheMixin):
         # update data from DB
         self.gameuser_data = GameUserData(self.gameuser_id)
 
-    def get_list_of_shares(self, company_id: int = None) -> list:
-        id_list = self.gameuser_data.get_id_list_of_shares(
+    def get_number_of_shares(self, company_id: int = None) -> int:
+        return self.gameuser_data.get_number_of_shares(
             company_id=company_id
         )
-        shares = [Share.get(share_id) for share_id in id_list]
-        return shares
+
+    def get_holdings(self) -> dict:
+        """Returns:
+            dict: {company_id: количество акций}
+        """
+        return self.gameuser_data.get_holdings()
+
+    def get_market(self) -> dict:
+        """Returns:
+            dict: {
+                'cash': float,
+                'is_market_open': bool,
+                'companies': [{
+                    'company_id', 'name', 'ticker', 'price', 'count'
+                }]
+            }
+        """
+        return self.gameuser_data.get_market()
+
+    def get_portfolio(self) -> dict:
+        """Returns:
+            dict: {
+                'cash': float,
+                'positions': [{
+                    'company_id', 'ticker', 'quantity', 'price', 'value'
+                }]
+            }
+        """
+        return self.gameuser_data.get_portfolio()
 
     def get_portfolio_size(self) -> float:
-        partfolio_size = self.get_cash()
-        for share in self.get_list_of_shares():
-            partfolio_size += share.get_price()
+        partfolio_size = self.gameuser_data.get_portfolio_size()
         return round(partfolio_size, 2)
 
     def get_total_value_of_shares(self, company_id: int = None) -> float:
-        total_value = sum(
-            [share.get_price()
-                for share in self.get_list_of_shares(company_id)]
-        )
-        return total_value
+        return self.gameuser_data.get_shares_value(company_id=company_id)
 
 
 class Game(CacheMixin):
+    # ЧаВо игры по game_id: читается из таблицы не чаще раза в TTL
+    faq_cache = ObjectCache(CACHE_MAX_SIZE, GSHEET_FAQ_CACHE_TTL)
+
     @staticmethod
     def is_url_correct(gs_url: str) -> bool:
         return GameSheet.is_url_correct(gs_url)
@@ -433,18 +581,35 @@ class Game(CacheMixin):
         )
         return gameuser
 
-    def add_gameuser_in_sheet(self, gameuser_id: int) -> int:
+    def add_gameuser_in_sheet(self, gameuser_id: int) -> None:
+        """Ставит игрока в очередь выгрузки на лист регистраций."""
         gameuser = GameUser.get(gameuser_id)
-        self.get_game_sheet().add_gameuser(
+        row = GameSheet.make_gameuser_row(
             last_name=gameuser.get_last_name(),
             first_name=gameuser.get_first_name(),
             nickname=gameuser.get_nickname(),
             tg_username=TgUser.get(gameuser.get_tg_id()).get_username(),
             tg_id=gameuser.get_tg_id()
         )
+        self.game_data.add_to_outbox(GAMEUSERS_WS, [row])
+
+    def finish_registration(self, gameuser: GameUser, nickname: str) -> None:
+        """Сохраняет ник игрока и ставит его в очередь выгрузки
+        в таблицу одной транзакцией. Регистрации уходят в таблицу
+        пачкой по расписанию или сразу, как их накопится
+        GSHEET_REGISTRATION_BATCH_SIZE."""
+        with BaseConnection.connection():
+            gameuser.change_nickname(new_nickname=nickname)
+            self.add_gameuser_in_sheet(gameuser.gameuser_id)
+
+        pending = OutboxData.count_pending(
+            self.game_id, GAMEUSERS_WS,
+            max_attempts=GSHEET_OUTBOX_MAX_ATTEMPTS)
+        if pending >= GSHEET_REGISTRATION_BATCH_SIZE:
+            MarketBot().flush_gs_outbox_now()
 
     def load_base_value(self) -> bool:
-        self.clear_cache()
+        self.clear_game_cache()
         try:
             base_value_dict = self.get_game_sheet().get_base_value()
             logger.info(f'Loaded base value: {base_value_dict}')
@@ -480,21 +645,11 @@ class Game(CacheMixin):
                 company_ticker=company_dict['ticker']
             )
 
-    def create_share(self, company_id: int, owner_gameuser_id: int) -> Share:
-        share_id = self.game_data.create_share(
-            company_id=company_id,
-            owner_gameuser_id=owner_gameuser_id
-        )
-        return Share.get(share_id)
-
-    def delete_share(self, share_id: int) -> None:
-        self.game_data.delete_share(share_id)
-
     def buy_deal(
             self,
             buyer: GameUser,
             company: Company,
-            shares_number: int) -> list:
+            shares_number: int) -> int:
         """Сделка на покупку акций
 
         Args:
@@ -503,43 +658,22 @@ class Game(CacheMixin):
             shares_number (int): количество акций
 
         Raises:
-            Exception: Исключение, если не хватает денег
+            MarketClosed: Исключение, если биржа уже закрылась
+            NotEnoughMoney: Исключение, если не хватает денег
+            DealIllegal: Исключение, если компания займет
+                больше max_percentage портфеля
 
         Returns:
-            list: список созданных акций
+            int: количество купленных акций
         """
-        sum_of_deal = company.get_price() * shares_number
-        if sum_of_deal > buyer.get_cash():
-            raise NotEnoughMoney(
-                f'GameUser { buyer.gameuser_id } doesnt have enough money')
-
-        full_size = buyer.get_portfolio_size()
-        company_in_partfolio = \
-            buyer.get_total_value_of_shares(company.get_id())
-        max_persentage = self.get_max_percentage() / 100
-        persentage_after_deal = \
-            (company_in_partfolio + sum_of_deal) / full_size
-        if persentage_after_deal > max_persentage:
-            raise DealIllegal(
-                f'GameUser { buyer.gameuser_id } wont to many')
-
-        new_cash = buyer.get_cash() - sum_of_deal
-        buyer.change_cash(
-            new_cash=round(new_cash, 2)
-        )
-        shares_list = [
-            self.create_share(company.get_id(), buyer.gameuser_id)
-            for _ in range(shares_number)
-        ]
-
-        self.game_data.new_transaction(
+        self.game_data.buy_deal(
             date_deal=self.get_today(),
-            subject_deal_id=buyer.gameuser_id,
-            type_deal='BUY',
+            buyer_id=buyer.gameuser_id,
             company_id=company.get_id(),
-            number_of_shares=shares_number
+            shares_number=shares_number,
+            max_percentage=self.get_max_percentage()
         )
-        return shares_list
+        return shares_number
 
     def sell_deal(
             self,
@@ -553,27 +687,17 @@ class Game(CacheMixin):
             company (Company):
             shares_number (int):
 
+        Raises:
+            MarketClosed: Исключение, если биржа уже закрылась
+
         Returns:
             int: реальное количество проданных акций
         """
-        shares_list = seller.get_list_of_shares(company.get_id())
-        if shares_number > len(shares_list):
-            shares_number = len(shares_list)
-
-        for share in shares_list[:shares_number]:
-            self.delete_share(share_id=share.get_share_id())
-
-        sum_of_deal = company.get_price() * shares_number
-        new_cash = seller.get_cash() + sum_of_deal
-        seller.change_cash(
-            new_cash=round(new_cash, 2)
-        )
-        self.game_data.new_transaction(
+        shares_number = self.game_data.sell_deal(
             date_deal=self.get_today(),
-            subject_deal_id=seller.gameuser_id,
-            type_deal='SELL',
+            seller_id=seller.gameuser_id,
             company_id=company.get_id(),
-            number_of_shares=shares_number
+            shares_number=shares_number
         )
         return shares_number
 
@@ -589,20 +713,42 @@ class Game(CacheMixin):
         ]
         return list_of_companyes
 
-    def liquidation_companyes(self) -> None:
+    def get_company_effects(self) -> dict:
+        """Returns:
+            dict: {ticker: {'effect': int, 'liquidation': bool}}
+        """
+        return self.get_game_sheet().get_company_effects()
+
+    def liquidation_companyes(self, company_effects: dict = None) -> None:
+        if company_effects is None:
+            company_effects = self.get_company_effects()
         companyes_list = self.get_list_of_companyes()
 
         for company in companyes_list:
             if company.get_price() == 0:
                 continue
-            if self.get_game_sheet().get_liquidation(
-                ticker=company.get_ticker()
-            ):
+            effects = company_effects.get(company.get_ticker())
+            if effects and effects['liquidation']:
                 company.change_price(new_price=0)
                 logger.info(f'Company { company.get_name() } was liquidated')
 
-    def update_prices(self) -> None:
+    def get_trading_volume(self) -> dict:
+        """Объем торгов за сегодня.
+
+        Returns:
+            dict: {company_id: {'bought': int, 'sold': int}}
+        """
+        return self.game_data.get_trading_volume(date_deal=self.get_today())
+
+    def update_prices(
+            self,
+            trading_volume: dict = None,
+            company_effects: dict = None) -> None:
         logger.info(f'Updating prices for game { self.game_id }')
+        if trading_volume is None:
+            trading_volume = self.get_trading_volume()
+        if company_effects is None:
+            company_effects = self.get_company_effects()
         companyes_list = self.get_list_of_actual_companyes()
 
         for company in companyes_list:
@@ -610,26 +756,15 @@ class Game(CacheMixin):
             sell_factor = self.get_sell_factor()
             buy_factor = self.get_buy_factor()
 
-            sell_transactions = self.game_data.get_transactions(
-                date_deal=self.get_today(),
-                type_deal='SELL',
-                company_id=company.get_id()
-            )
-            number_of_shares_sold = sum(
-                [tr['number_of_shares'] for tr in sell_transactions])
-
-            buy_transactions = self.game_data.get_transactions(
-                date_deal=self.get_today(),
-                type_deal='BUY',
-                company_id=company.get_id()
-            )
-            number_of_shares_bought = sum(
-                [tr['number_of_shares'] for tr in buy_transactions])
+            company_volume = trading_volume.get(
+                company.get_id(), {'bought': 0, 'sold': 0})
+            number_of_shares_sold = company_volume['sold']
+            number_of_shares_bought = company_volume['bought']
 
             old_effect = company.get_effect()
-            new_effect = self.get_game_sheet().get_effect(
-                ticker=company.get_ticker()
-            )
+            # компания без эффекта в таблице сохраняет прежний эффект
+            effects = company_effects.get(company.get_ticker())
+            new_effect = effects['effect'] if effects else old_effect
             delta_effect_price = new_effect - old_effect
 
             new_price = (
@@ -664,47 +799,45 @@ class Game(CacheMixin):
                     new_cash=cash+extra_cash
                 )
             self.game_data.change_extra_cash(0)
-            self.get_game_sheet().change_extra_cash(0)
+            self.game_data.add_to_outbox(
+                BASE_WS,
+                [{'name': 'extra_cash', 'value': 0}],
+                action='set_value'
+            )
             logger.info(f'Extra cash { extra_cash } was given to gameres { self.game_id }')
 
-    def update_gs_trading_volume(self) -> None:
+    def update_gs_trading_volume(self, trading_volume: dict = None) -> None:
+        if trading_volume is None:
+            trading_volume = self.get_trading_volume()
         companyes_list = self.get_list_of_actual_companyes()
 
+        volumes = []
         for company in companyes_list:
-            sell_transactions = self.game_data.get_transactions(
-                date_deal=self.get_today(),
-                type_deal='SELL',
-                company_id=company.get_id()
-            )
-            number_of_shares_sold = sum(
-                [tr['number_of_shares'] for tr in sell_transactions])
-
-            buy_transactions = self.game_data.get_transactions(
-                date_deal=self.get_today(),
-                type_deal='BUY',
-                company_id=company.get_id()
-            )
-            number_of_shares_bought = sum(
-                [tr['number_of_shares'] for tr in buy_transactions])
-
-            self.get_game_sheet().add_trading_volume(
-                date=self.get_today(),
-                ticker=company.get_ticker(),
-                sold=number_of_shares_sold,
-                bought=number_of_shares_bought
-            )
+            company_volume = trading_volume.get(
+                company.get_id(), {'bought': 0, 'sold': 0})
+            volumes.append({
+                'ticker': company.get_ticker(),
+                'sold': company_volume['sold'],
+                'bought': company_volume['bought']
+            })
+        self.game_data.add_to_outbox(
+            TRADING_VOLUME_WS,
+            GameSheet.make_trading_volume_rows(self.get_today(), volumes)
+        )
         logger.info(f'Trading volume for game { self.game_id } was updated')
         return
 
     def update_gs_company_prices(self) -> None:
         companyes_list = self.get_list_of_actual_companyes()
 
-        for company in companyes_list:
-            self.get_game_sheet().add_company_price(
-                date=self.get_today(),
-                ticker=company.get_ticker(),
-                price=company.get_price()
-            )
+        prices = [
+            {'ticker': company.get_ticker(), 'price': company.get_price()}
+            for company in companyes_list
+        ]
+        self.game_data.add_to_outbox(
+            PRICES_WS,
+            GameSheet.make_company_price_rows(self.get_today(), prices)
+        )
         logger.info(f'Prices for game { self.game_id } was updated')
         return
 
@@ -713,29 +846,57 @@ class Game(CacheMixin):
         gameusers = [GameUser.get(tg_id) for tg_id in id_list]
         return gameusers
 
+    def get_portfolio_sizes(self) -> list:
+        """Returns:
+            list: [{'gameuser_id': int, 'nickname': str, 'size': float}]
+        """
+        portfolios = self.game_data.get_portfolio_sizes()
+        for portfolio in portfolios:
+            portfolio['size'] = round(portfolio['size'], 2)
+        return portfolios
+
     def update_gs_portfolios(self) -> None:
-        gamers = self.get_list_of_gameusers()
-        for gameuser in gamers:
-            self.get_game_sheet().add_portfolio(
-                date=self.get_today(),
-                nickname=gameuser.get_nickname(),
-                size=gameuser.get_portfolio_size()
-            )
+        self.game_data.add_to_outbox(
+            PORTFOLIO_WS,
+            GameSheet.make_portfolio_rows(
+                self.get_today(), self.get_portfolio_sizes())
+        )
         logger.info(f'Portfolios for game { self.game_id } was updated')
 
     def get_FAQ(self) -> list:
-        return self.get_game_sheet().get_FAQ()
+        faq = Game.faq_cache.get(self.game_id)
+        if faq is None:
+            faq = self.get_game_sheet().get_FAQ()
+            Game.faq_cache.put(self.game_id, faq)
+        return faq
 
     def job_before_open(self):
         self.update_is_market_open()
 
+    def clear_game_cache(self) -> None:
+        """Сбрасывает из кэша эту игру и ее компании, не трогая другие игры."""
+        Game.invalidate(self.game_id)
+        Game.faq_cache.invalidate(self.game_id)
+        for company_id in self.game_data.get_list_of_company_ids():
+            Company.invalidate(company_id)
+
     def job_after_close(self):
         self.close_market()
-        self.clear_cache()
-        self.liquidation_companyes()
-        self.update_prices()
+        self.clear_game_cache()
+        company_effects = self.get_company_effects()
+        # пересчет и постановка выгрузки в очередь одной транзакцией,
+        # в Google Sheets данные уйдут фоновой задачей
+        run_in_transaction(self.recalculate_after_close, company_effects)
+
+    def recalculate_after_close(self, company_effects: dict) -> None:
+        # игра блокируется первой, как в сделках, затем game_user и company:
+        # с параллельной сделкой не будет deadlock
+        self.game_data.lock()
+        self.liquidation_companyes(company_effects)
+        trading_volume = self.get_trading_volume()
+        self.update_prices(trading_volume, company_effects)
         self.give_extra_cash()
-        self.update_gs_trading_volume()
+        self.update_gs_trading_volume(trading_volume)
         self.update_gs_company_prices()
         self.update_gs_portfolios()
 
@@ -766,22 +927,3 @@ class Company(CacheMixin):
 
     def change_effect(self, new_effect: int) -> None:
         return self.company_data.change_effect(new_effect)
-
-
-class Share(CacheMixin):
-    def __init__(self, share_id: int):
-        super(Share, self).__init__(key=share_id)
-        self.share_id = share_id
-        self.share_data = ShareData(share_id)
-
-    def get_share_id(self) -> int:
-        return self.share_id
-
-    def get_company_id(self) -> int:
-        return self.share_data.get_company_id()
-
-    def get_company(self) -> Company:
-        return Company.get(self.get_company_id())
-
-    def get_price(self) -> float:
-        return self.get_company().get_price()
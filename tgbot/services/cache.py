@@ -0,0 +1,60 @@
+from collections import OrderedDict
+import threading
+from time import monotonic
+
+
+class ObjectCache(object):
+    """LRU-кэш с ограничением размера и необязательным TTL.
+    Потокобезопасный: к нему обращаются и хендлеры через пул потоков БД,
+    и задачи планировщика.
+    """
+    def __init__(self, max_size: int, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._objects = OrderedDict()  # key -> (object_, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._objects.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            object_, expires_at = item
+            if expires_at is not None and expires_at < monotonic():
+                del self._objects[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._objects.move_to_end(key)
+            self.hits += 1
+            return object_
+
+    def put(self, key, object_) -> None:
+        expires_at = monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._objects[key] = (object_, expires_at)
+            self._objects.move_to_end(key)
+            while len(self._objects) > self.max_size:
+                self._objects.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._objects.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._objects.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._objects),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
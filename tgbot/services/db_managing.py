@@ -1,10 +1,20 @@
 from __future__ import annotations
-from datetime import date, time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, time
+from functools import partial
+import random
+import threading
+from time import monotonic, sleep
 from loguru import logger
 
 import psycopg2
-from psycopg2 import extras
-from tgbot.config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT
+from psycopg2 import extras, extensions, pool
+from tgbot.config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT, \
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_PING_INTERVAL, \
+    DB_TRANSACTION_MAX_ATTEMPTS
 
 db_config = {'host': DB_HOST,
              'dbname': DB_NAME,
@@ -16,60 +26,214 @@ db_config = {'host': DB_HOST,
 class DoesNotExist(Exception):
     pass
 
+
+class NotEnoughMoney(Exception):
+    pass
+
+
+class DealIllegal(Exception):
+    pass
+
+
+class MarketClosed(Exception):
+    pass
+
+
 class BaseConnection:
-    _conn = None
-    
-    def __new__(cls):
-        if not isinstance(cls._instance, cls):
-            cls._instance = super().__new__(cls)
-        return cls._instance
+    """Пул соединений с БД, общий для хендлеров и задач планировщика.
+
+    Соединение выдается через контекстный менеджер: при выходе
+    транзакция коммитится (или откатывается при исключении),
+    а соединение возвращается в пул.
+    """
+    _pool = None
+    _pool_lock = threading.Lock()
+    # getconn у ThreadedConnectionPool не ждет, а падает при исчерпании
+    # пула, поэтому ожидание свободного соединения держим на семафоре
+    _slots = threading.BoundedSemaphore(DB_POOL_MAX)
+    _last_used = {}
+    # соединение открытой в этом потоке транзакции
+    _local = threading.local()
 
     @classmethod
-    def create_conn(cls):
-        cls._conn = psycopg2.connect(**db_config)
-        logger.info(f'new connection to db')
-    
+    def create_pool(cls):
+        cls._pool = pool.ThreadedConnectionPool(
+            DB_POOL_MIN, DB_POOL_MAX, **db_config)
+        logger.info(f'new connection pool to db: {DB_POOL_MIN}-{DB_POOL_MAX}')
+
     @classmethod
-    def close_conn(cls):
-        cls._conn.close()
-        logger.info(f'closed connection to db')
-    
+    def close_pool(cls):
+        if cls._pool is not None:
+            cls._pool.closeall()
+            cls._pool = None
+            cls._last_used.clear()
+            logger.info(f'closed connection pool to db')
+
+    @classmethod
+    def get_pool(cls) -> pool.ThreadedConnectionPool:
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    cls.create_pool()
+        return cls._pool
+
+    @classmethod
+    def _is_healthy(cls, connection) -> bool:
+        """Проверка соединения при выдаче из пула.
+        Пингуем только соединения, которые давно простаивали."""
+        if connection.closed:
+            return False
+        idle = monotonic() - cls._last_used.get(id(connection), 0)
+        if idle < DB_POOL_PING_INTERVAL:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1;')
+            connection.rollback()
+        except psycopg2.Error as e:
+            logger.warning(f'connection to db is broken: {e}')
+            return False
+        return True
+
+    @classmethod
+    def _discard(cls, connection) -> None:
+        cls._last_used.pop(id(connection), None)
+        cls.get_pool().putconn(connection, close=True)
+
     @classmethod
     def get_conn(cls):
-        if cls._conn is None:
-            cls.create_conn()
-        return cls._conn
+        """Взять живое соединение из пула (при необходимости переподключиться).
+        Вернуть его нужно через put_conn."""
+        cls._slots.acquire()
+        try:
+            db_pool = cls.get_pool()
+            for _ in range(DB_POOL_MAX + 1):
+                connection = db_pool.getconn()
+                if cls._is_healthy(connection):
+                    return connection
+                cls._discard(connection)
+                logger.info(f'reconnect to db')
+            raise psycopg2.OperationalError('no healthy connection to db')
+        except BaseException:
+            cls._slots.release()
+            raise
+
+    @classmethod
+    def put_conn(cls, connection) -> None:
+        try:
+            status = connection.get_transaction_status() \
+                if not connection.closed \
+                else extensions.TRANSACTION_STATUS_UNKNOWN
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                cls._discard(connection)
+            else:
+                if status != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                cls._last_used[id(connection)] = monotonic()
+                cls.get_pool().putconn(connection)
+        finally:
+            cls._slots.release()
+
+    @classmethod
+    @contextmanager
+    def connection(cls):
+        """Соединение на одну транзакцию.
+        Вложенные вызовы в том же потоке используют соединение внешнего
+        и коммитятся вместе с ним, поэтому несколько методов *Data
+        можно объединить в одну транзакцию.
+
+        Example:
+            with BaseConnection.connection() as connection:
+                with connection.cursor() as cursor:
+                    ...
+        """
+        connection = getattr(cls._local, 'connection', None)
+        if connection is not None:
+            yield connection
+            return
+
+        connection = cls.get_conn()
+        cls._local.connection = connection
+        try:
+            yield connection
+            connection.commit()
+        except BaseException:
+            if not connection.closed:
+                try:
+                    connection.rollback()
+                except psycopg2.Error as e:
+                    logger.error(f'rollback error: {e}')
+            raise
+        finally:
+            cls._local.connection = None
+            cls.put_conn(connection)
+
+    @classmethod
+    @contextmanager
+    def cursor(cls, cursor_factory=None):
+        """Курсор в отдельной транзакции, коммит при выходе."""
+        with cls.connection() as connection:
+            with connection.cursor(cursor_factory=cursor_factory) as cursor:
+                yield cursor
+
+
+def run_in_transaction(func, *args, **kwargs):
+    """Выполняет func в одной транзакции. Если Postgres прервал ее
+    из-за deadlock или конфликта сериализации, повторяет func целиком,
+    но не больше DB_TRANSACTION_MAX_ATTEMPTS раз.
+    Вызывать вне открытой транзакции, иначе повторять нечего.
+    """
+    for attempt in range(1, DB_TRANSACTION_MAX_ATTEMPTS + 1):
+        try:
+            with BaseConnection.connection():
+                return func(*args, **kwargs)
+        except extensions.TransactionRollbackError as e:
+            if attempt == DB_TRANSACTION_MAX_ATTEMPTS:
+                raise
+            logger.warning(f'transaction rolled back, retry {attempt}: {e}')
+            sleep(random.uniform(0, attempt))
+
+
+# Потоков не больше, чем соединений в пуле: лишние запросы ждут в очереди
+# executor'а, а не блокируют event loop
+db_executor = ThreadPoolExecutor(
+    max_workers=DB_POOL_MAX, thread_name_prefix='db')
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """Выполнить синхронную функцию работы с БД, не блокируя event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        db_executor, partial(func, *args, **kwargs))
+
+
+def shutdown_db_executor() -> None:
+    db_executor.shutdown(wait=True)
+    logger.info(f'db executor shutdown')
 
 
 class MarketBotData:
     @staticmethod
     def add_tg_user(tg_id: int, tg_username: str) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (tg_id, tg_username)
             insert_script = '''INSERT INTO tg_user (tg_id, username)
                                 VALUES (%s, %s)
                                 ON CONFLICT (tg_id)
                                 DO UPDATE SET username = Excluded.username;'''
             cursor.execute(insert_script, insert_values)
-        connection.commit()
-        
 
     @staticmethod
     def add_superadmin(tg_id: int) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (tg_id,)
             insert_script = '''INSERT INTO superadmin (tg_id) VALUES (%s)
                             ON CONFLICT (tg_id) DO NOTHING;'''
             cursor.execute(insert_script, insert_values)
-        connection.commit()
-        
 
     @staticmethod
     def get_active_gameuser_id(tg_id: int) -> int:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''SELECT game_user.gameuser_id
                                 FROM game_user
                                 WHERE game_user.tg_id = %s
@@ -80,26 +244,22 @@ class MarketBotData:
                 active_gameuser, = fetchone_return
             else:
                 active_gameuser = None
-        connection.commit()
-        
+
         return active_gameuser
 
     @staticmethod
     def get_superadmin_ids() -> list:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT superadmin.tg_id FROM superadmin ;'''
             cursor.execute(select_script)
             id_list = cursor.fetchall()
-        connection.commit()
-        
+
         return [id_tuple[0] for id_tuple in id_list]
 
     @staticmethod
     def get_game_id_by_game_key(game_key: str) -> int:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT game.game_id FROM game WHERE game_key = %s;'''
             cursor.execute(select_script, (game_key,))
@@ -108,29 +268,36 @@ class MarketBotData:
                 game_id, = fetchone_return
             else:
                 game_id = None
-        connection.commit()
-        
+
         return game_id
 
     @staticmethod
     def get_game_ids() -> list:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT game.game_id FROM game;'''
             cursor.execute(select_script)
             id_list = cursor.fetchall()
-        connection.commit()
-        
+
         return [id_tuple[0] for id_tuple in id_list]
 
+    @staticmethod
+    def get_blocked_tg_ids() -> set:
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT tg_user.tg_id FROM tg_user
+                WHERE tg_user.is_blocked = TRUE;'''
+            cursor.execute(select_script)
+            id_list = cursor.fetchall()
+
+        return {id_tuple[0] for id_tuple in id_list}
+
 
 class TgUserData:
     def __init__(self, tg_id: int):
         self._tg_id = tg_id
 
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''SELECT tg_user.username
                                 FROM tg_user
                                 WHERE tg_id = %s;'''
@@ -140,8 +307,6 @@ class TgUserData:
                 select_username, = fetchone_return
             else:
                 raise DoesNotExist
-        connection.commit()
-        
 
         self._tg_username = select_username
 
@@ -152,66 +317,53 @@ class TgUserData:
         return self._tg_username
 
     def is_blocked(self) -> bool:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT tg_user.is_blocked
                 FROM tg_user WHERE tg_id = %s;'''
             cursor.execute(select_script, (self._tg_id,))
             is_blocked, = cursor.fetchone()
-        connection.commit()
-        
+
         return is_blocked
 
     def block(self) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (True, self._tg_id)
             update_script = '''UPDATE tg_user
                                 SET is_blocked = %s
                                 WHERE tg_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def unblock(self) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (False, self._tg_id)
             update_script = '''UPDATE tg_user
                                 SET is_blocked = %s
                                 WHERE tg_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
 
 class SuperAdminData:
     def __init__(self, admin_id: int):
         self._admin_id = admin_id
 
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT superadmin.tg_id FROM superadmin
                 WHERE admin_id = %s;'''
             cursor.execute(select_script, (admin_id,))
             select_tg_id, = cursor.fetchone()
-        connection.commit()
-        
 
         self._tg_id = select_tg_id
 
     @staticmethod
     def create_new_game() -> int:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_script = '''INSERT INTO game (game_name)
                                 VALUES (%s) RETURNING game_id;'''
             cursor.execute(insert_script, ('new game',))
             select_game_id, = cursor.fetchone()
-        connection.commit()
-        
+
         return select_game_id
 
 
@@ -219,8 +371,7 @@ class GameUserData:
     def __init__(self, gameuser_id: int):
         self._gameuser_id = gameuser_id
 
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT game_user.tg_id,
                     game_user.first_name,
@@ -233,8 +384,6 @@ class GameUserData:
             cursor.execute(select_script, (gameuser_id,))
             tg_id, first_name, last_name, nickname, \
                 game, cash, is_active = cursor.fetchone()
-        connection.commit()
-        
 
         self._tg_id = tg_id
         self._first_name = first_name
@@ -260,67 +409,53 @@ class GameUserData:
         return self._game
 
     def get_cash(self) -> float:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT game_user.cash
                 FROM game_user WHERE gameuser_id = %s;'''
             cursor.execute(select_script, (self._gameuser_id,))
             cash, = cursor.fetchone()
-        connection.commit()
-        
+
         return cash
 
     def is_active(self) -> bool:
         return self._is_active()
 
     def change_first_name(self, new_first_name: str) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (new_first_name, self._gameuser_id)
             update_script = '''UPDATE game_user
                                 SET first_name = %s
                                 WHERE gameuser_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def change_last_name(self, new_last_name: str) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (new_last_name, self._gameuser_id)
             update_script = '''UPDATE game_user
                                 SET last_name = %s
                                 WHERE gameuser_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def change_nickname(self, new_nickname: str) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (new_nickname, self._gameuser_id)
             update_script = '''UPDATE game_user
                                 SET nickname = %s
                                 WHERE gameuser_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def change_cash(self, new_cash: float) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (new_cash, self._gameuser_id)
             update_script = '''
                 UPDATE game_user SET cash = %s
                 WHERE gameuser_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
+        self._cash = new_cash
 
     def activate(self) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             try:
                 cursor.execute(
                     '''UPDATE game_user
@@ -334,14 +469,11 @@ class GameUserData:
                 SET is_active = TRUE
                 WHERE gameuser_id = %s;'''
             cursor.execute(update_script, (self._gameuser_id,))
-        connection.commit()
-        
 
     # ??
     @staticmethod
     def is_nickname_unique(nickname: str) -> bool:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
             SELECT EXISTS(
                SELECT *
@@ -349,36 +481,172 @@ class GameUserData:
                WHERE nickname = %s);'''
             cursor.execute(select_script, (nickname,))
             exists, = cursor.fetchone()
-        connection.commit()
-        
+
         return not exists
 
-    def get_id_list_of_shares(self, company_id: int = None) -> list:
-        connection = BaseConnection.get_conn()
-        with connection.cursor(cursor_factory=extras.DictCursor) as cursor:
+    def get_number_of_shares(self, company_id: int = None) -> int:
+        with BaseConnection.cursor() as cursor:
             if company_id:
                 select_script = '''
-                    SELECT share.share_id FROM share
-                    WHERE share.owner = %s AND share.company = %s;'''
+                    SELECT COALESCE(SUM(holding.quantity), 0) FROM holding
+                    WHERE holding.owner = %s AND holding.company = %s;'''
                 values = (self._gameuser_id, company_id)
             else:
                 select_script = '''
-                    SELECT share.share_id FROM share
-                    WHERE share.owner = %s;'''
+                    SELECT COALESCE(SUM(holding.quantity), 0) FROM holding
+                    WHERE holding.owner = %s;'''
                 values = (self._gameuser_id,)
             cursor.execute(select_script, values)
-            id_list = cursor.fetchall()
-        connection.commit()
-        
-        return [id_tuple[0] for id_tuple in id_list]
+            number, = cursor.fetchone()
+
+        return number
+
+    def get_holdings(self) -> dict:
+        """Returns:
+            dict: {company_id: quantity}
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT holding.company, holding.quantity FROM holding
+                WHERE holding.owner = %s AND holding.quantity > 0;'''
+            cursor.execute(select_script, (self._gameuser_id,))
+            holdings = cursor.fetchall()
+
+        return dict(holdings)
+
+    def get_market(self) -> dict:
+        """Все действующие компании игры с ценами и акциями игрока,
+        его свободные средства и состояние рынка одним запросом.
+
+        Returns:
+            dict: {
+                'cash': float,
+                'is_market_open': bool,
+                'companies': [
+                    {
+                        'company_id': int,
+                        'name': str,
+                        'ticker': str,
+                        'price': float,
+                        'count': int
+                    },
+                    {...},
+                ]
+            }
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT game_user.cash, game.is_market_open,
+                    company.company_id, company.company_name,
+                    company.company_ticker, company.price,
+                    COALESCE(holding.quantity, 0)
+                FROM game_user
+                JOIN game ON game.game_id = game_user.game
+                LEFT JOIN company ON company.game = game_user.game
+                    AND company.price != 0
+                LEFT JOIN holding ON holding.owner = game_user.gameuser_id
+                    AND holding.company = company.company_id
+                WHERE game_user.gameuser_id = %s
+                ORDER BY company.company_id;'''
+            cursor.execute(select_script, (self._gameuser_id,))
+            market_data = cursor.fetchall()
+
+        cols_names = ('company_id', 'name', 'ticker', 'price', 'count')
+        return {
+            'cash': market_data[0][0],
+            'is_market_open': market_data[0][1],
+            'companies': [
+                dict(zip(cols_names, row[2:]))
+                for row in market_data if row[2] is not None
+            ]
+        }
+
+    def get_portfolio(self) -> dict:
+        """Свободные средства и позиции игрока по компаниям одним запросом,
+        позиции по убыванию стоимости.
+
+        Returns:
+            dict: {
+                'cash': float,
+                'positions': [
+                    {
+                        'company_id': int,
+                        'ticker': str,
+                        'quantity': int,
+                        'price': float,
+                        'value': float
+                    },
+                    {...},
+                ]
+            }
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT game_user.cash, company.company_id,
+                    company.company_ticker, holding.quantity, company.price,
+                    holding.quantity * company.price AS value
+                FROM game_user
+                LEFT JOIN holding ON holding.owner = game_user.gameuser_id
+                    AND holding.quantity > 0
+                LEFT JOIN company ON company.company_id = holding.company
+                WHERE game_user.gameuser_id = %s
+                ORDER BY value DESC NULLS LAST, company.company_ticker;'''
+            cursor.execute(select_script, (self._gameuser_id,))
+            portfolio_data = cursor.fetchall()
+
+        cols_names = ('company_id', 'ticker', 'quantity', 'price', 'value')
+        return {
+            'cash': portfolio_data[0][0],
+            'positions': [
+                dict(zip(cols_names, row[1:]))
+                for row in portfolio_data if row[1] is not None
+            ]
+        }
+
+    def get_shares_value(self, company_id: int = None) -> float:
+        """Стоимость акций игрока по текущим ценам."""
+        with BaseConnection.cursor() as cursor:
+            if company_id:
+                select_script = '''
+                    SELECT COALESCE(SUM(holding.quantity * company.price), 0)
+                    FROM holding
+                    JOIN company ON company.company_id = holding.company
+                    WHERE holding.owner = %s AND holding.company = %s;'''
+                values = (self._gameuser_id, company_id)
+            else:
+                select_script = '''
+                    SELECT COALESCE(SUM(holding.quantity * company.price), 0)
+                    FROM holding
+                    JOIN company ON company.company_id = holding.company
+                    WHERE holding.owner = %s;'''
+                values = (self._gameuser_id,)
+            cursor.execute(select_script, values)
+            shares_value, = cursor.fetchone()
+
+        return shares_value
+
+    def get_portfolio_size(self) -> float:
+        """Свободные средства плюс стоимость акций по текущим ценам."""
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT COALESCE(game_user.cash, 0)
+                    + COALESCE(SUM(holding.quantity * company.price), 0)
+                FROM game_user
+                LEFT JOIN holding ON holding.owner = game_user.gameuser_id
+                LEFT JOIN company ON company.company_id = holding.company
+                WHERE game_user.gameuser_id = %s
+                GROUP BY game_user.gameuser_id;'''
+            cursor.execute(select_script, (self._gameuser_id,))
+            portfolio_size, = cursor.fetchone()
+
+        return portfolio_size
 
 
 class CompanyData:
     def __init__(self, company_id: int):
         self._company_id = company_id
 
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                         SELECT company.game,
                             company.company_name,
@@ -389,8 +657,6 @@ class CompanyData:
             cursor.execute(select_script, (company_id,))
             game, company_name, company_ticker, \
                 price, effect = cursor.fetchone()
-        connection.commit()
-        
 
         self._game = game
         self._company_name = company_name
@@ -409,58 +675,47 @@ class CompanyData:
         return self._company_ticker
 
     def get_price(self) -> float:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                         SELECT company.price
                         FROM company WHERE company_id = %s;'''
             cursor.execute(select_script, (self._company_id,))
             price, = cursor.fetchone()
-        connection.commit()
-        
+
         return price
 
     def get_effect(self) -> int:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT company.effect
                 FROM company WHERE company_id = %s;'''
             cursor.execute(select_script, (self._company_id,))
             effect, = cursor.fetchone()
-        connection.commit()
-        
+
         return effect
 
     def change_price(self, new_price: float) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (new_price, self._company_id)
             update_script = '''UPDATE company
                                 SET price = %s
                                 WHERE company_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def change_effect(self, new_effect: int) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (new_effect, self._company_id)
             update_script = '''
                 UPDATE company SET effect = %s
                 WHERE company_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
 
 class GameData:
     def __init__(self, game_id: int) -> GameData:
         self._game_id = game_id
 
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
             SELECT game.game_key,
                game.game_name,
@@ -484,8 +739,6 @@ class GameData:
                 open_time, close_time, is_market_open, start_price, \
                 start_cash, max_percentage, sell_factor, buy_factor, \
                 admin_contact, chart_link = cursor.fetchone()
-        connection.commit()
-        
 
         self._game_key = game_key
         self._game_name = game_name
@@ -531,27 +784,23 @@ class GameData:
         return self._close_time
 
     def is_market_open(self) -> bool:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT game.is_market_open
                 FROM game WHERE game_id = %s;'''
             cursor.execute(select_script, (self._game_id,))
             is_market_open, = cursor.fetchone()
-        connection.commit()
-        
+
         return is_market_open
 
     def is_registration_open(self) -> bool:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT game.is_registration_open
                 FROM game WHERE game_id = %s;'''
             cursor.execute(select_script, (self._game_id,))
             is_registration_open, = cursor.fetchone()
-        connection.commit()
-        
+
         return is_registration_open
 
     def get_start_price(self) -> int:
@@ -570,15 +819,13 @@ class GameData:
         return self._buy_factor
 
     def get_extra_cash(self) -> int:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             select_script = '''
                 SELECT game.extra_cash
                 FROM game WHERE game_id = %s;'''
             cursor.execute(select_script, (self._game_id,))
             extra_cash, = cursor.fetchone()
-        connection.commit()
-        
+
         return extra_cash
 
     def get_admin_contact(self) -> str:
@@ -588,137 +835,147 @@ class GameData:
         return self._chart_link
 
     def change_game_key(self, game_key: str) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (game_key, self._game_id)
             update_script = '''UPDATE game
                                 SET game_key = %s
                                 WHERE game_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def change_name(self, new_name: str) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (new_name, self._game_id)
             update_script = '''
                 UPDATE game SET game_name = %s
                 WHERE game_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def change_gslink(self, gs_link: str) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (gs_link, self._game_id)
             update_script = '''UPDATE game
                                 SET gs_link = %s
                                 WHERE game_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def open_market(self) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (True, self._game_id)
             update_script = '''UPDATE game
                                 SET is_market_open = %s
                                 WHERE game_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
+
+    def lock(self) -> None:
+        """Блокирует строку игры до конца транзакции.
+        Сделки берут ее FOR SHARE первой, поэтому после lock
+        новые сделки ждут, а начатые уже закончились."""
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT game_id FROM game WHERE game_id = %s FOR UPDATE;'''
+            cursor.execute(select_script, (self._game_id,))
 
     def close_market(self) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (False, self._game_id)
             update_script = '''
                 UPDATE game SET is_market_open = %s
                 WHERE game_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def open_registration(self) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (True, self._game_id)
             update_script = '''UPDATE game
                                 SET is_registration_open = %s
                                 WHERE game_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def close_registration(self) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (False, self._game_id)
             update_script = '''
                 UPDATE game SET is_registration_open = %s
                 WHERE game_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
+
     
     def change_extra_cash(self, extra_cash: int) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (extra_cash, self._game_id)
             update_script = '''
                 UPDATE game SET extra_cash = %s
                 WHERE game_id = %s;'''
             cursor.execute(update_script, insert_values)
-        connection.commit()
-        
 
     def add_gameuser(self, tg_id: int) -> int:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (tg_id, self._game_id)
             insert_script = '''
                 INSERT INTO game_user (tg_id, game) VALUES (%s, %s)
                 RETURNING gameuser_id;'''
             cursor.execute(insert_script, insert_values)
             gameuser_id, = cursor.fetchone()
-        connection.commit()
-        
+
         return gameuser_id
 
     def get_gameuser_ids(self) -> list:
-        connection = BaseConnection.get_conn()
-        with connection.cursor(cursor_factory=extras.DictCursor) as cursor:
+        with BaseConnection.cursor(cursor_factory=extras.DictCursor) as cursor:
             select_script = '''
                 SELECT game_user.gameuser_id
                 FROM game_user WHERE game_user.game = %s;'''
             cursor.execute(select_script, (self._game_id,))
             id_list = cursor.fetchall()
-        connection.commit()
-        
+
         return [id_tuple[0] for id_tuple in id_list]
 
     def get_gameuser_tg_ids(self) -> list:
-        connection = BaseConnection.get_conn()
-        with connection.cursor(cursor_factory=extras.DictCursor) as cursor:
+        with BaseConnection.cursor(cursor_factory=extras.DictCursor) as cursor:
             select_script = '''
                 SELECT game_user.tg_id
                 FROM game_user WHERE game_user.game = %s;'''
             cursor.execute(select_script, (self._game_id,))
             id_list = cursor.fetchall()
-        connection.commit()
-        
+
         return [id_tuple[0] for id_tuple in id_list]
 
+    def get_portfolio_sizes(self) -> list:
+        """Оценка портфелей всех игроков игры одним запросом.
+
+        Returns:
+            list: [
+                {
+                    'gameuser_id': int,
+                    'nickname': str,
+                    'size': float
+                },
+                {...},
+            ]
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT game_user.gameuser_id,
+                    game_user.nickname,
+                    COALESCE(game_user.cash, 0)
+                        + COALESCE(SUM(holding.quantity * company.price), 0)
+                FROM game_user
+                LEFT JOIN holding ON holding.owner = game_user.gameuser_id
+                LEFT JOIN company ON company.company_id = holding.company
+                WHERE game_user.game = %s
+                GROUP BY game_user.gameuser_id
+                ORDER BY game_user.gameuser_id;'''
+            cursor.execute(select_script, (self._game_id,))
+            portfolio_data = cursor.fetchall()
+
+        cols_names = ('gameuser_id', 'nickname', 'size')
+        return [dict(zip(cols_names, row)) for row in portfolio_data]
+
     def add_company(
             self,
             company_name: str,
             company_ticker: str,
             price: int) -> int:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (
                 company_name, company_ticker, price, self._game_id, 0)
             insert_script = '''
@@ -728,21 +985,18 @@ class GameData:
                 RETURNING company_id;'''
             cursor.execute(insert_script, insert_values)
             select_company_id, = cursor.fetchone()
-        connection.commit()
-        
+
         return select_company_id
 
     def get_list_of_company_ids(self) -> list:
-        connection = BaseConnection.get_conn()
-        with connection.cursor(cursor_factory=extras.DictCursor) as cursor:
+        with BaseConnection.cursor(cursor_factory=extras.DictCursor) as cursor:
             select_script = '''
                 SELECT company.company_id
                 FROM company
                 WHERE company.game = %s;'''
             cursor.execute(select_script, (self._game_id,))
             id_list = cursor.fetchall()
-        connection.commit()
-        
+
         return [id_tuple[0] for id_tuple in id_list]
 
     def fill_in_game_data(self, game_data_dict: dict) -> None:
@@ -760,8 +1014,7 @@ class GameData:
         admin_contact = game_data_dict['admin_contact']
         chart_link = game_data_dict['chart_link']
 
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (
                 timezone, start_day, end_day, open_time, close_time,
                 start_price, start_cash, max_percentage, sell_factor,
@@ -784,116 +1037,614 @@ class GameData:
                     chart_link = %s
                 WHERE game_id = %s;'''
             cursor.execute(insert_script, insert_values)
-        connection.commit()
-        
 
-    @staticmethod
-    def create_share(company_id: int, owner_gameuser_id: int) -> int:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
-            insert_values = (company_id, owner_gameuser_id)
-            insert_script = '''
-                INSERT INTO share (company, owner)
-                VALUES (%s, %s)
-                RETURNING share_id;'''
-            cursor.execute(insert_script, insert_values)
-            select_share_id, = cursor.fetchone()
-        connection.commit()
-        
-        return select_share_id
+    def buy_deal(
+            self,
+            date_deal: date,
+            buyer_id: int,
+            company_id: int,
+            shares_number: int,
+            max_percentage: float) -> None:
+        """Покупка акций одной транзакцией.
+        Строка игрока блокируется, поэтому параллельные сделки
+        одного игрока выполняются по очереди.
+
+        Raises:
+            MarketClosed: биржа закрылась до начала сделки
+            NotEnoughMoney: не хватает денег
+            DealIllegal: доля компании в портфеле превысит max_percentage
+        """
+        with BaseConnection.cursor() as cursor:
+            # блокировки берутся в одном порядке с закрытием биржи:
+            # game, затем game_user, затем company
+            cursor.execute(
+                '''SELECT game.is_market_open FROM game
+                WHERE game_id = %s FOR SHARE;''',
+                (self._game_id,))
+            is_market_open, = cursor.fetchone()
+            if not is_market_open:
+                raise MarketClosed(
+                    f'Market of game { self._game_id } is closed')
+            cursor.execute(
+                '''SELECT game_user.cash FROM game_user
+                WHERE gameuser_id = %s FOR UPDATE;''',
+                (buyer_id,))
+            cash, = cursor.fetchone()
+            cursor.execute(
+                '''SELECT company.price FROM company
+                WHERE company_id = %s FOR SHARE;''',
+                (company_id,))
+            price, = cursor.fetchone()
 
-    @staticmethod
-    def delete_share(share_id: int) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
-            delete_script = '''DELETE FROM share WHERE share_id = %s;'''
-            cursor.execute(delete_script, (share_id,))
-        connection.commit()
-        
+            sum_of_deal = price * shares_number
+            if sum_of_deal > cash:
+                raise NotEnoughMoney(
+                    f'GameUser { buyer_id } doesnt have enough money')
 
-    @staticmethod
-    def new_transaction(date_deal: date, subject_deal_id: int, type_deal: str,
-                        company_id: int, number_of_shares: int) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
-            insert_values = (
-                date_deal, subject_deal_id, type_deal,
-                company_id, number_of_shares)
-            insert_script = '''
-                INSERT INTO transactions (
+            select_script = '''
+                SELECT
+                    COALESCE(SUM(holding.quantity * company.price), 0),
+                    COALESCE(SUM(holding.quantity * company.price)
+                        FILTER (WHERE holding.company = %s), 0)
+                FROM holding
+                JOIN company ON company.company_id = holding.company
+                WHERE holding.owner = %s;'''
+            cursor.execute(select_script, (company_id, buyer_id))
+            shares_value, company_in_partfolio = cursor.fetchone()
+            full_size = round(cash + shares_value, 2)
+            if full_size <= 0:
+                raise NotEnoughMoney(
+                    f'GameUser { buyer_id } has empty portfolio')
+            persentage_after_deal = \
+                (company_in_partfolio + sum_of_deal) / full_size
+            if persentage_after_deal > max_percentage / 100:
+                raise DealIllegal(
+                    f'GameUser { buyer_id } wont to many')
+
+            cursor.execute(
+                '''UPDATE game_user SET cash = %s
+                WHERE gameuser_id = %s;''',
+                (round(cash - sum_of_deal, 2), buyer_id))
+            cursor.execute(
+                '''INSERT INTO holding (owner, company, quantity)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (owner, company)
+                DO UPDATE SET quantity = holding.quantity + Excluded.quantity;''',
+                (buyer_id, company_id, shares_number))
+            cursor.execute(
+                '''INSERT INTO transactions (
                     date_deal, subject_deal, type_deal,
                     company_id, number_of_shares)
-                VALUES (%s, %s, %s, %s, %s);'''
-            cursor.execute(insert_script, insert_values)
-        connection.commit()
-        
+                VALUES (%s, %s, 'BUY', %s, %s);''',
+                (date_deal, buyer_id, company_id, shares_number))
 
-    @staticmethod
-    def get_transactions(date_deal, type_deal, company_id) -> list:
-        connection = BaseConnection.get_conn()
-        with connection.cursor(cursor_factory=extras.DictCursor) as cursor:
-            insert_values = (date_deal, type_deal, company_id)
+    def sell_deal(
+            self,
+            date_deal: date,
+            seller_id: int,
+            company_id: int,
+            shares_number: int) -> int:
+        """Продажа акций одной транзакцией, но не больше, чем есть у игрока.
+
+        Raises:
+            MarketClosed: биржа закрылась до начала сделки
+
+        Returns:
+            int: реальное количество проданных акций
+        """
+        with BaseConnection.cursor() as cursor:
+            # блокировки берутся в одном порядке с закрытием биржи:
+            # game, затем game_user, затем company
+            cursor.execute(
+                '''SELECT game.is_market_open FROM game
+                WHERE game_id = %s FOR SHARE;''',
+                (self._game_id,))
+            is_market_open, = cursor.fetchone()
+            if not is_market_open:
+                raise MarketClosed(
+                    f'Market of game { self._game_id } is closed')
+            cursor.execute(
+                '''SELECT game_user.cash FROM game_user
+                WHERE gameuser_id = %s FOR UPDATE;''',
+                (seller_id,))
+            cash, = cursor.fetchone()
+            cursor.execute(
+                '''SELECT company.price FROM company
+                WHERE company_id = %s FOR SHARE;''',
+                (company_id,))
+            price, = cursor.fetchone()
+
+            cursor.execute(
+                '''SELECT holding.quantity FROM holding
+                WHERE owner = %s AND company = %s FOR UPDATE;''',
+                (seller_id, company_id))
+            fetchone_return = cursor.fetchone()
+            if fetchone_return:
+                quantity, = fetchone_return
+            else:
+                quantity = 0
+            shares_number = min(shares_number, quantity)
+
+            if shares_number == quantity:
+                cursor.execute(
+                    '''DELETE FROM holding
+                    WHERE owner = %s AND company = %s;''',
+                    (seller_id, company_id))
+            else:
+                cursor.execute(
+                    '''UPDATE holding SET quantity = quantity - %s
+                    WHERE owner = %s AND company = %s;''',
+                    (shares_number, seller_id, company_id))
+            cursor.execute(
+                '''UPDATE game_user SET cash = %s
+                WHERE gameuser_id = %s;''',
+                (round(cash + price * shares_number, 2), seller_id))
+            cursor.execute(
+                '''INSERT INTO transactions (
+                    date_deal, subject_deal, type_deal,
+                    company_id, number_of_shares)
+                VALUES (%s, %s, 'SELL', %s, %s);''',
+                (date_deal, seller_id, company_id, shares_number))
+
+        return shares_number
+
+    def get_trading_volume(self, date_deal: date) -> dict:
+        """Объем торгов за день по всем компаниям игры одним запросом.
+
+        Returns:
+            dict: {
+                company_id: {'bought': int, 'sold': int},
+                ...
+            }
+        """
+        with BaseConnection.cursor() as cursor:
             select_script = '''
-                SELECT transaction_id, date_deal, subject_deal,
-                    type_deal, company_id, number_of_shares
+                SELECT transactions.company_id,
+                    transactions.type_deal,
+                    SUM(transactions.number_of_shares)
                 FROM transactions
-                WHERE date_deal = %s
-                AND type_deal = %s
-                AND company_id = %s;'''
-            cursor.execute(select_script, insert_values)
-            transaction_data = cursor.fetchall()  # -> list of tuples
-        connection.commit()
-        
-        cols_names = (
-            'transaction_id',
-            'date_deal',
-            'subject_deal',
-            'type_deal',
-            'company_id',
-            'number_of_shares'
-        )
-        transactions_list_of_dicts = []
-        for row in transaction_data:
-            row_data = dict(zip(cols_names, row))
-            transactions_list_of_dicts.append(row_data)
-        return transactions_list_of_dicts
+                JOIN company
+                    ON company.company_id = transactions.company_id
+                WHERE transactions.date_deal = %s
+                AND company.game = %s
+                GROUP BY transactions.company_id, transactions.type_deal;'''
+            cursor.execute(select_script, (date_deal, self._game_id))
+            volume_data = cursor.fetchall()
+
+        type_deal_names = {'BUY': 'bought', 'SELL': 'sold'}
+        trading_volume = defaultdict(lambda: {'bought': 0, 'sold': 0})
+        for company_id, type_deal, number_of_shares in volume_data:
+            trading_volume[company_id][type_deal_names[type_deal]] = \
+                number_of_shares
+        return dict(trading_volume)
+
+    def add_to_outbox(
+            self,
+            worksheet: str,
+            payloads: list,
+            action: str = 'append') -> None:
+        """Ставит записи в очередь выгрузки в Google Sheets.
+
+        Args:
+            worksheet (str): название листа
+            payloads (list): строки для action='append'
+                или {'name': str, 'value': ...} для action='set_value'
+        """
+        if not payloads:
+            return
+        with BaseConnection.cursor() as cursor:
+            insert_values = [
+                (self._game_id, worksheet, action, extras.Json(payload))
+                for payload in payloads
+            ]
+            insert_script = '''
+                INSERT INTO gs_outbox (game, worksheet, action, payload)
+                VALUES %s;'''
+            extras.execute_values(cursor, insert_script, insert_values)
 
     @staticmethod
     def add_company_history(
             company_id: int, date_entry: date, price: float) -> None:
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+        with BaseConnection.cursor() as cursor:
             insert_values = (company_id, date_entry, price)
             insert_script = '''
                 INSERT INTO company_history (company, date_entry, price)
                 VALUES (%s, %s, %s);'''
             cursor.execute(insert_script, insert_values)
-        connection.commit()
-        
 
 
-class ShareData:
-    def __init__(self, share_id: int):
-        self._share_id = share_id
+class OutboxData:
+    @staticmethod
+    def claim_pending(limit: int, max_attempts: int, claim_ttl: int) -> list:
+        """Берет в работу самые старые записи очереди выгрузки
+        в Google Sheets на claim_ttl секунд. Листы, в которых есть записи,
+        занятые другим процессом, пропускаются целиком, чтобы строки
+        одного листа уходили по порядку. Забор записей идет под
+        advisory lock, поэтому два процесса не возьмут одно и то же.
+
+        Returns:
+            list: [
+                {
+                    'outbox_id': int,
+                    'game': int,
+                    'gs_link': str,
+                    'worksheet': str,
+                    'action': str,
+                    'payload': list | dict
+                },
+                {...},
+            ]
+        """
+        with BaseConnection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('gs_outbox'));")
+            update_script = '''
+                WITH claimed AS (
+                    UPDATE gs_outbox
+                    SET claimed_until = now() + %s * interval '1 second'
+                    WHERE outbox_id IN (
+                        SELECT outbox_id FROM gs_outbox
+                        WHERE attempts < %s
+                            AND (claimed_until IS NULL
+                                OR claimed_until < now())
+                            AND NOT EXISTS (
+                                SELECT 1 FROM gs_outbox AS busy
+                                WHERE busy.game = gs_outbox.game
+                                    AND busy.worksheet = gs_outbox.worksheet
+                                    AND busy.claimed_until >= now())
+                        ORDER BY outbox_id
+                        LIMIT %s)
+                    RETURNING outbox_id, game, worksheet, action, payload)
+                SELECT claimed.outbox_id, claimed.game, game.gs_link,
+                    claimed.worksheet, claimed.action, claimed.payload
+                FROM claimed
+                JOIN game ON game.game_id = claimed.game
+                ORDER BY claimed.outbox_id;'''
+            cursor.execute(update_script, (claim_ttl, max_attempts, limit))
+            outbox_data = cursor.fetchall()
+
+        cols_names = (
+            'outbox_id',
+            'game',
+            'gs_link',
+            'worksheet',
+            'action',
+            'payload'
+        )
+        return [dict(zip(cols_names, row)) for row in outbox_data]
 
-        connection = BaseConnection.get_conn()
-        with connection.cursor() as cursor:
+    @staticmethod
+    def count_pending(game_id: int, worksheet: str, max_attempts: int) -> int:
+        """Сколько записей листа игры ждут выгрузки."""
+        with BaseConnection.cursor() as cursor:
             select_script = '''
-                SELECT share.company, share.owner FROM share
-                WHERE share_id = %s;'''
-            cursor.execute(select_script, (share_id,))
-            select_company, select_owner = cursor.fetchone()
-        connection.commit()
-        
+                SELECT COUNT(*) FROM gs_outbox
+                WHERE game = %s AND worksheet = %s AND attempts < %s;'''
+            cursor.execute(
+                select_script, (game_id, worksheet, max_attempts))
+            count = cursor.fetchone()[0]
+        return count
+
+    @staticmethod
+    def delete(outbox_ids: list) -> None:
+        with BaseConnection.cursor() as cursor:
+            delete_script = '''
+                DELETE FROM gs_outbox WHERE outbox_id = ANY(%s);'''
+            cursor.execute(delete_script, (outbox_ids,))
+
+    @staticmethod
+    def mark_failed(outbox_ids: list, error: str) -> None:
+        with BaseConnection.cursor() as cursor:
+            update_script = '''
+                UPDATE gs_outbox
+                SET attempts = attempts + 1, last_error = %s,
+                    claimed_until = NULL
+                WHERE outbox_id = ANY(%s);'''
+            cursor.execute(update_script, (error, outbox_ids))
+
+    @staticmethod
+    def release(outbox_ids: list) -> None:
+        """Возвращает взятые, но не отправленные записи в очередь."""
+        with BaseConnection.cursor() as cursor:
+            update_script = '''
+                UPDATE gs_outbox SET claimed_until = NULL
+                WHERE outbox_id = ANY(%s);'''
+            cursor.execute(update_script, (outbox_ids,))
+
 
-        self._company_id = select_company
-        self._owner_id = select_owner
+class BroadcastData:
+    @staticmethod
+    def create_broadcast(
+            post: dict, tg_ids: list, progress_chat_id: int = None) -> int:
+        """Сохраняет рассылку и ее получателей одной транзакцией.
+
+        Returns:
+            int: broadcast_id
+        """
+        with BaseConnection.cursor() as cursor:
+            insert_script = '''
+                INSERT INTO broadcast (post, progress_chat_id)
+                VALUES (%s, %s) RETURNING broadcast_id;'''
+            cursor.execute(
+                insert_script, (extras.Json(post), progress_chat_id))
+            broadcast_id, = cursor.fetchone()
+
+            insert_script = '''
+                INSERT INTO broadcast_recipient (broadcast, tg_id)
+                VALUES %s ON CONFLICT DO NOTHING;'''
+            extras.execute_values(
+                cursor,
+                insert_script,
+                [(broadcast_id, tg_id) for tg_id in tg_ids]
+            )
+        return broadcast_id
+
+    @staticmethod
+    def get_active_broadcast_ids() -> list:
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT broadcast_id FROM broadcast
+                WHERE status = 'active'
+                ORDER BY broadcast_id;'''
+            cursor.execute(select_script)
+            broadcast_ids = [row[0] for row in cursor.fetchall()]
+        return broadcast_ids
+
+    def __init__(self, broadcast_id: int):
+        self._broadcast_id = broadcast_id
+
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT post, progress_chat_id, created_at
+                FROM broadcast WHERE broadcast_id = %s;'''
+            cursor.execute(select_script, (broadcast_id,))
+            broadcast_data = cursor.fetchone()
+
+        if broadcast_data is None:
+            raise DoesNotExist
+        self._post, self._progress_chat_id, self._created_at = broadcast_data
 
     def get_id(self) -> int:
-        return self._share_id
+        return self._broadcast_id
 
-    def get_company_id(self) -> int:
-        return self._company_id
+    def get_post(self) -> dict:
+        return self._post
+
+    def get_progress_chat_id(self) -> int:
+        return self._progress_chat_id
+
+    def get_created_at(self) -> datetime:
+        return self._created_at
+
+    def get_progress_message_id(self) -> int:
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT progress_message_id
+                FROM broadcast WHERE broadcast_id = %s;'''
+            cursor.execute(select_script, (self._broadcast_id,))
+            progress_message_id, = cursor.fetchone()
+        return progress_message_id
+
+    def set_progress_message_id(self, progress_message_id: int) -> None:
+        with BaseConnection.cursor() as cursor:
+            update_script = '''
+                UPDATE broadcast SET progress_message_id = %s
+                WHERE broadcast_id = %s;'''
+            cursor.execute(
+                update_script, (progress_message_id, self._broadcast_id))
+
+    def get_pending_recipients(self) -> list:
+        """Returns:
+            list: [(tg_id: int, next_part: int), ...]
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT tg_id, next_part FROM broadcast_recipient
+                WHERE broadcast = %s AND status = 'pending'
+                ORDER BY tg_id;'''
+            cursor.execute(select_script, (self._broadcast_id,))
+            recipients = cursor.fetchall()
+        return recipients
+
+    def set_recipient_next_part(self, tg_id: int, next_part: int) -> None:
+        with BaseConnection.cursor() as cursor:
+            update_script = '''
+                UPDATE broadcast_recipient SET next_part = %s
+                WHERE broadcast = %s AND tg_id = %s;'''
+            cursor.execute(
+                update_script, (next_part, self._broadcast_id, tg_id))
+
+    def set_recipient_status(self, tg_id: int, status: str) -> None:
+        with BaseConnection.cursor() as cursor:
+            update_script = '''
+                UPDATE broadcast_recipient SET status = %s
+                WHERE broadcast = %s AND tg_id = %s;'''
+            cursor.execute(update_script, (status, self._broadcast_id, tg_id))
+
+    def get_status_counts(self) -> dict:
+        """Returns:
+            dict: {'pending': int, 'sent': int, 'blocked': int, 'failed': int}
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT status, COUNT(*) FROM broadcast_recipient
+                WHERE broadcast = %s GROUP BY status;'''
+            cursor.execute(select_script, (self._broadcast_id,))
+            counts = dict(cursor.fetchall())
+        return {
+            status: counts.get(status, 0)
+            for status in ('pending', 'sent', 'blocked', 'failed')
+        }
+
+    def finish(self) -> None:
+        with BaseConnection.cursor() as cursor:
+            update_script = '''
+                UPDATE broadcast SET status = 'done', finished_at = now()
+                WHERE broadcast_id = %s;'''
+            cursor.execute(update_script, (self._broadcast_id,))
+
+
+class ScheduledMessageData:
+    @staticmethod
+    def add_messages(tg_id: int, messages: list) -> list:
+        """Args:
+            messages (list): [(text: str, send_at: datetime), ...]
+
+        Returns:
+            list: [(message_id: int, send_at: datetime), ...]
+        """
+        with BaseConnection.cursor() as cursor:
+            insert_script = '''
+                INSERT INTO scheduled_message (tg_id, text, send_at)
+                VALUES %s RETURNING message_id, send_at;'''
+            scheduled = extras.execute_values(
+                cursor,
+                insert_script,
+                [(tg_id, text, send_at) for text, send_at in messages],
+                fetch=True
+            )
+        return scheduled
+
+    @staticmethod
+    def get_all() -> list:
+        """Returns:
+            list: [(message_id: int, send_at: datetime), ...]
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT message_id, send_at FROM scheduled_message
+                ORDER BY send_at;'''
+            cursor.execute(select_script)
+            scheduled = cursor.fetchall()
+        return scheduled
+
+    @staticmethod
+    def get(message_id: int) -> tuple:
+        """Returns:
+            tuple: (tg_id: int, text: str)
+            None: сообщение уже отправлено
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT tg_id, text FROM scheduled_message
+                WHERE message_id = %s;'''
+            cursor.execute(select_script, (message_id,))
+            message = cursor.fetchone()
+        return message
+
+    @staticmethod
+    def delete(message_id: int) -> None:
+        """Удаляет сообщение после отправки, чтобы оно не ушло повторно."""
+        with BaseConnection.cursor() as cursor:
+            delete_script = '''
+                DELETE FROM scheduled_message WHERE message_id = %s;'''
+            cursor.execute(delete_script, (message_id,))
+
+
+class FsmStateData:
+    @staticmethod
+    def get(chat_id: int, user_id: int, ttl: int) -> tuple:
+        """Состояние и данные, если они менялись не раньше ttl секунд назад.
+
+        Returns:
+            tuple: (state: str, data: dict)
+        """
+        with BaseConnection.cursor() as cursor:
+            select_script = '''
+                SELECT state, data FROM fsm_state
+                WHERE chat_id = %s AND user_id = %s
+                    AND updated_at > now() - %s * interval '1 second';'''
+            cursor.execute(select_script, (chat_id, user_id, ttl))
+            fsm_data = cursor.fetchone()
+        return fsm_data or (None, {})
+
+    # Запись старше ttl считается сброшенной, как в get: при изменении
+    # состояния ее данные не сохраняются, и наоборот
+    @staticmethod
+    def set_state(chat_id: int, user_id: int, state: str, ttl: int) -> tuple:
+        """Returns:
+            tuple: (state: str, data: dict) после изменения
+        """
+        with BaseConnection.cursor() as cursor:
+            insert_script = '''
+                INSERT INTO fsm_state (chat_id, user_id, state)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (chat_id, user_id) DO UPDATE
+                SET state = EXCLUDED.state,
+                    data = CASE
+                        WHEN fsm_state.updated_at
+                            > now() - %s * interval '1 second'
+                        THEN fsm_state.data ELSE '{}' END,
+                    updated_at = now()
+                RETURNING state, data;'''
+            cursor.execute(insert_script, (chat_id, user_id, state, ttl))
+            fsm_data = cursor.fetchone()
+        return fsm_data
+
+    @staticmethod
+    def set_data(chat_id: int, user_id: int, data: dict, ttl: int) -> tuple:
+        """Returns:
+            tuple: (state: str, data: dict) после изменения
+        """
+        with BaseConnection.cursor() as cursor:
+            insert_script = '''
+                INSERT INTO fsm_state (chat_id, user_id, data)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (chat_id, user_id) DO UPDATE
+                SET data = EXCLUDED.data,
+                    state = CASE
+                        WHEN fsm_state.updated_at
+                            > now() - %s * interval '1 second'
+                        THEN fsm_state.state END,
+                    updated_at = now()
+                RETURNING state, data;'''
+            cursor.execute(
+                insert_script, (chat_id, user_id, extras.Json(data), ttl))
+            fsm_data = cursor.fetchone()
+        return fsm_data
+
+    @staticmethod
+    def update_data(chat_id: int, user_id: int, data: dict, ttl: int) -> tuple:
+        """Дописывает ключи data к данным состояния.
+
+        Returns:
+            tuple: (state: str, data: dict) после изменения
+        """
+        with BaseConnection.cursor() as cursor:
+            insert_script = '''
+                INSERT INTO fsm_state (chat_id, user_id, data)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (chat_id, user_id) DO UPDATE
+                SET state = CASE
+                        WHEN fsm_state.updated_at
+                            > now() - %s * interval '1 second'
+                        THEN fsm_state.state END,
+                    data = CASE
+                        WHEN fsm_state.updated_at
+                            > now() - %s * interval '1 second'
+                        THEN fsm_state.data || EXCLUDED.data
+                        ELSE EXCLUDED.data END,
+                    updated_at = now()
+                RETURNING state, data;'''
+            cursor.execute(
+                insert_script,
+                (chat_id, user_id, extras.Json(data), ttl, ttl))
+            fsm_data = cursor.fetchone()
+        return fsm_data
 
-    def get_owner_id(self) -> int:
-        return self._owner_id
+    @staticmethod
+    def delete(chat_id: int, user_id: int) -> None:
+        with BaseConnection.cursor() as cursor:
+            delete_script = '''
+                DELETE FROM fsm_state WHERE chat_id = %s AND user_id = %s;'''
+            cursor.execute(delete_script, (chat_id, user_id))
+
+    @staticmethod
+    def delete_stale(ttl: int) -> int:
+        with BaseConnection.cursor() as cursor:
+            delete_script = '''
+                DELETE FROM fsm_state
+                WHERE updated_at < now() - %s * interval '1 second';'''
+            cursor.execute(delete_script, (ttl,))
+            deleted = cursor.rowcount
+        return deleted
@@ -0,0 +1,106 @@
+import copy
+import typing
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from tgbot.services.cache import ObjectCache
+from tgbot.services.db_managing import FsmStateData, run_in_db_executor
+from tgbot.config import CACHE_MAX_SIZE, FSM_CACHE_TTL, FSM_STATE_TTL
+
+
+class PostgresStorage(BaseStorage):
+    """Хранилище FSM в таблице fsm_state нашей БД.
+    Состояния переживают перезапуск и доступны всем процессам бота.
+
+    Чтения идут из локального кэша на FSM_CACHE_TTL секунд, запись -
+    сразу в БД и в кэш. Состояние, которое не менялось FSM_STATE_TTL
+    секунд, считается сброшенным.
+    """
+    def __init__(self):
+        self._cache = ObjectCache(max_size=CACHE_MAX_SIZE, ttl=FSM_CACHE_TTL)
+
+    async def close(self):
+        self._cache.clear()
+
+    async def wait_closed(self):
+        pass
+
+    def cache_stats(self) -> dict:
+        return self._cache.stats()
+
+    def _key(self, chat, user) -> tuple:
+        chat, user = self.check_address(chat=chat, user=user)
+        return (int(chat), int(user))
+
+    async def _get(self, chat, user) -> tuple:
+        key = self._key(chat, user)
+        if FSM_CACHE_TTL:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return key, cached
+        state, data = await run_in_db_executor(
+            FsmStateData.get, *key, FSM_STATE_TTL)
+        return key, self._put(key, state, data)
+
+    def _put(self, key: tuple, state: str, data: dict) -> dict:
+        record = {'state': state, 'data': data}
+        if FSM_CACHE_TTL:
+            self._cache.put(key, record)
+        return record
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None
+                        ) -> typing.Optional[str]:
+        _, record = await self._get(chat, user)
+        if record['state'] is None:
+            return self.resolve_state(default)
+        return record['state']
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._get(chat, user)
+        return copy.deepcopy(record['data'] or default or {})
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.Optional[typing.AnyStr] = None):
+        key = self._key(chat, user)
+        state, data = await run_in_db_executor(
+            FsmStateData.set_state, *key, self.resolve_state(state),
+            FSM_STATE_TTL)
+        self._put(key, state, data)
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        key = self._key(chat, user)
+        state, data = await run_in_db_executor(
+            FsmStateData.set_data, *key, data or {}, FSM_STATE_TTL)
+        self._put(key, state, data)
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None,
+                          **kwargs):
+        key = self._key(chat, user)
+        data = dict(data or {}, **kwargs)
+        state, data = await run_in_db_executor(
+            FsmStateData.update_data, *key, data, FSM_STATE_TTL)
+        self._put(key, state, data)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        if not with_data:
+            return await self.set_state(chat=chat, user=user, state=None)
+        key = self._key(chat, user)
+        await run_in_db_executor(FsmStateData.delete, *key)
+        self._put(key, None, {})
@@ -0,0 +1,391 @@
+import json
+import os
+import random
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from time import sleep, monotonic
+from loguru import logger
+
+from google.auth.transport.requests import Request
+from pygsheets import authorize, Spreadsheet, Worksheet
+from pygsheets.client import Client
+from tgbot.config import GSHEET_BACKEND, GSHEET_SERVICE_FILE, \
+    GSHEET_CACHE_TTL, GSHEET_FAKE_FILE, GSHEET_FAKE_LATENCY, \
+    GSHEET_FAKE_ERROR_RATE, GSHEET_FAKE_REQUESTS_PER_MINUTE
+
+
+class SheetBackend(ABC):
+    """Доступ к листам таблицы игры. Каждый метод - один запрос к API,
+    повторы и лимиты на стороне GameSheet.
+
+    Листы - матрицы строк, адреса ячеек - (row, col) с 1 или A1.
+    """
+    @abstractmethod
+    def get_title(self, gs_link: str) -> str:
+        pass
+
+    @abstractmethod
+    def get_all_values(self, gs_link: str, ws_name: str) -> list:
+        """Все значения листа без пустых строк и столбцов в конце."""
+
+    @abstractmethod
+    def get_values(
+            self, gs_link: str, ws_name: str, start: str, end: str) -> list:
+        pass
+
+    @abstractmethod
+    def update_value(
+            self, gs_link: str, ws_name: str, address: tuple, value) -> None:
+        pass
+
+    @abstractmethod
+    def append_rows(self, gs_link: str, ws_name: str, rows: list) -> None:
+        """Добавляет строки после последней заполненной строки листа."""
+
+    def invalidate(self, gs_link: str) -> None:
+        """Сбросить то, что закэшировано для таблицы (после ошибки)."""
+        pass
+
+
+class SheetsClient():
+    """Один авторизованный клиент Google Sheets на процесс.
+    Открытые таблицы и листы кэшируются по gs_link
+    и переоткрываются раз в GSHEET_CACHE_TTL секунд или после ошибки.
+    """
+    _client = None
+    _sheets = {}  # gs_link -> (Spreadsheet, opened_at)
+    _worksheets = {}  # (gs_link, ws_name) -> Worksheet
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls) -> Client:
+        with cls._lock:
+            if cls._client is None:
+                cls._client = authorize(service_file=GSHEET_SERVICE_FILE)
+                logger.info('authorized in google sheets')
+            elif cls._client.oauth.expired:
+                cls._client.oauth.refresh(Request())
+                logger.info('google sheets token refreshed')
+            return cls._client
+
+    @classmethod
+    def get_sheet(cls, gs_link: str) -> Spreadsheet:
+        cached = cls._sheets.get(gs_link)
+        if cached and monotonic() - cached[1] < GSHEET_CACHE_TTL:
+            return cached[0]
+
+        sheet = cls.get_client().open_by_url(gs_link)
+        with cls._lock:
+            cls._drop_worksheets(gs_link)
+            cls._sheets[gs_link] = (sheet, monotonic())
+        return sheet
+
+    @classmethod
+    def get_worksheet(cls, gs_link: str, ws_name: str) -> Worksheet:
+        sheet = cls.get_sheet(gs_link)
+        worksheet = cls._worksheets.get((gs_link, ws_name))
+        if worksheet is None:
+            worksheet = sheet.worksheet_by_title(ws_name)
+            with cls._lock:
+                cls._worksheets[(gs_link, ws_name)] = worksheet
+        return worksheet
+
+    @classmethod
+    def invalidate(cls, gs_link: str) -> None:
+        with cls._lock:
+            cls._sheets.pop(gs_link, None)
+            cls._drop_worksheets(gs_link)
+
+    @classmethod
+    def _drop_worksheets(cls, gs_link: str) -> None:
+        for key in [key for key in cls._worksheets if key[0] == gs_link]:
+            del cls._worksheets[key]
+
+
+class PygsheetsBackend(SheetBackend):
+    """Настоящие таблицы Google через pygsheets."""
+    def get_title(self, gs_link: str) -> str:
+        return SheetsClient.get_sheet(gs_link).title
+
+    def get_all_values(self, gs_link: str, ws_name: str) -> list:
+        worksheet = SheetsClient.get_worksheet(gs_link, ws_name)
+        return worksheet.get_all_values(
+            include_tailing_empty=False,
+            include_tailing_empty_rows=False
+        )
+
+    def get_values(
+            self, gs_link: str, ws_name: str, start: str, end: str) -> list:
+        worksheet = SheetsClient.get_worksheet(gs_link, ws_name)
+        return worksheet.get_values(start=start, end=end)
+
+    def update_value(
+            self, gs_link: str, ws_name: str, address: tuple, value) -> None:
+        worksheet = SheetsClient.get_worksheet(gs_link, ws_name)
+        worksheet.update_value(address, value)
+
+    def append_rows(self, gs_link: str, ws_name: str, rows: list) -> None:
+        worksheet = SheetsClient.get_worksheet(gs_link, ws_name)
+        worksheet.append_table(
+            values=rows,
+            start='A2',
+            end=None,
+            dimension='ROWS',
+            overwrite=False
+        )
+
+    def invalidate(self, gs_link: str) -> None:
+        SheetsClient.invalidate(gs_link)
+
+
+class FakeSheetsError(Exception):
+    """Ошибка фейкового API, status как у HTTP ответа Google."""
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_a1(address: str) -> tuple:
+    """'B12' -> (12, 2)"""
+    match = re.fullmatch(r'([A-Z]+)(\d+)', address.upper())
+    if match is None:
+        raise ValueError(f'wrong cell address: {address}')
+    letters, row = match.groups()
+    col = 0
+    for letter in letters:
+        col = col * 26 + ord(letter) - ord('A') + 1
+    return (int(row), col)
+
+
+def strip_matrix(matrix: list) -> list:
+    """Убирает пустые ячейки в конце строк и пустые строки в конце."""
+    result = []
+    for row in matrix:
+        row = list(row)
+        while row and row[-1] == '':
+            row.pop()
+        result.append(row)
+    while result and not result[-1]:
+        result.pop()
+    return result
+
+
+# часовой пояс игры в шаблоне, как в ячейке timezone
+TEMPLATE_TIMEZONE = 3
+
+
+def make_game_template(title: str = 'Fake game', today: date = None) -> dict:
+    """Таблица игры с листами и ячейками, которые читает бот.
+    Значения подходят для запуска игры без правок: сегодня - торговый
+    день внутри окна игры.
+
+    Args:
+        today (date): сегодняшний день игры, по умолчанию текущая дата
+            в часовом поясе TEMPLATE_TIMEZONE
+    """
+    from tgbot.services.gs_module import BASE_WS, QA_WS, TIMETABLE_WS, \
+        EFFECT_WS, GAMEUSERS_WS, TRADING_VOLUME_WS, PRICES_WS, PORTFOLIO_WS
+    if today is None:
+        today = datetime.now(
+            timezone(timedelta(hours=TEMPLATE_TIMEZONE))).date()
+    start_day = today - timedelta(days=1)
+    end_day = today + timedelta(days=30)
+    return {
+        'title': title,
+        'worksheets': {
+            BASE_WS: [
+                ['key', '1'],
+                ['game_key', ''],
+                ['timezone', str(TEMPLATE_TIMEZONE)],
+                ['start_day', start_day.strftime('%d.%m.%Y')],
+                ['end_day', end_day.strftime('%d.%m.%Y')],
+                ['open_time', '10:00'],
+                ['close_time', '18:00'],
+                ['start_price', '100'],
+                ['start_cash', '10000'],
+                ['max_percentage', '30'],
+                ['sell_factor', '0,01'],
+                ['buy_factor', '0,01'],
+                ['extra_cash', '0'],
+                ['admin_contact', '@admin'],
+                ['chart_link', 'https://example.com/chart'],
+            ],
+            QA_WS: [
+                ['ЧаВо'],
+                ['Вопрос', 'Ответ'],
+                ['Как купить акции?', 'Нажмите «Рынок 🏛️»'],
+            ],
+            TIMETABLE_WS: [
+                ['today_date', today.strftime('%d.%m.%Y')],
+                ['is_market_open', '1'],
+            ],
+            EFFECT_WS: [
+                ['Команды'],
+                ['Название', 'Тикер', 'Эффект', 'Ликвидация'],
+                ['Альфа', 'ALFA', '0', '0'],
+                ['Бета', 'BETA', '0', '0'],
+                ['Гамма', 'GAMM', '0', '0'],
+            ],
+            GAMEUSERS_WS: [
+                ['Фамилия', 'Имя', 'Никнейм', 'Telegram', 'tg_id'],
+            ],
+            TRADING_VOLUME_WS: [
+                ['Дата', 'Тикер', 'Куплено', 'Продано'],
+            ],
+            PRICES_WS: [
+                ['Дата', 'Тикер', 'Цена'],
+            ],
+            PORTFOLIO_WS: [
+                ['Дата', 'Никнейм', 'Портфель'],
+            ],
+        }
+    }
+
+
+class FakeSheetBackend(SheetBackend):
+    """Таблицы в памяти или в json файле, для тестов и нагрузки без сети.
+
+    Неизвестная ссылка открывается как новая таблица из make_game_template.
+    Каждый запрос ждет latency секунд, падает с 503 с вероятностью
+    error_rate и с 429, если запросов за минуту больше requests_per_minute.
+    """
+    def __init__(
+            self,
+            path: str = None,
+            latency: float = 0,
+            error_rate: float = 0,
+            requests_per_minute: int = 0):
+        self.path = path
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self._calls = deque()
+        self._lock = threading.RLock()
+        self._sheets = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self._sheets = json.load(file)
+
+    def _call(self) -> None:
+        if self.latency:
+            sleep(self.latency)
+        with self._lock:
+            now = monotonic()
+            while self._calls and now - self._calls[0] >= 60:
+                self._calls.popleft()
+            if self.requests_per_minute \
+                    and len(self._calls) >= self.requests_per_minute:
+                raise FakeSheetsError('quota exceeded', status=429)
+            self._calls.append(now)
+        if random.random() < self.error_rate:
+            raise FakeSheetsError('backend error', status=503)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self._sheets, file, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def add_sheet(self, gs_link: str, sheet: dict = None) -> dict:
+        """Создать таблицу, по умолчанию из make_game_template."""
+        with self._lock:
+            self._sheets[gs_link] = sheet or make_game_template()
+            self._save()
+            return self._sheets[gs_link]
+
+    def get_matrix(self, gs_link: str, ws_name: str) -> list:
+        """Лист как есть, без задержек и ошибок. Для проверок в тестах."""
+        with self._lock:
+            sheet = self._sheets.get(gs_link) or self.add_sheet(gs_link)
+            worksheets = sheet['worksheets']
+            if ws_name not in worksheets:
+                raise FakeSheetsError(
+                    f'worksheet {ws_name} not found', status=404)
+            return worksheets[ws_name]
+
+    def get_title(self, gs_link: str) -> str:
+        self._call()
+        with self._lock:
+            sheet = self._sheets.get(gs_link) or self.add_sheet(gs_link)
+            return sheet['title']
+
+    def get_all_values(self, gs_link: str, ws_name: str) -> list:
+        self._call()
+        with self._lock:
+            return strip_matrix(self.get_matrix(gs_link, ws_name))
+
+    def get_values(
+            self, gs_link: str, ws_name: str, start: str, end: str) -> list:
+        self._call()
+        start_row, start_col = parse_a1(start)
+        end_row, end_col = parse_a1(end)
+        width = end_col - start_col + 1
+        with self._lock:
+            matrix = self.get_matrix(gs_link, ws_name)
+            rows = [
+                (list(row[start_col - 1:end_col]) + [''] * width)[:width]
+                for row in matrix[start_row - 1:end_row]
+            ]
+        while rows and not any(rows[-1]):
+            rows.pop()
+        return rows
+
+    def update_value(
+            self, gs_link: str, ws_name: str, address: tuple, value) -> None:
+        self._call()
+        if isinstance(address, str):
+            address = parse_a1(address)
+        row, col = address
+        with self._lock:
+            matrix = self.get_matrix(gs_link, ws_name)
+            while len(matrix) < row:
+                matrix.append([])
+            cells = matrix[row - 1]
+            cells.extend([''] * (col - len(cells)))
+            cells[col - 1] = str(value)
+            self._save()
+
+    def append_rows(self, gs_link: str, ws_name: str, rows: list) -> None:
+        self._call()
+        with self._lock:
+            matrix = self.get_matrix(gs_link, ws_name)
+            matrix[:] = strip_matrix(matrix)
+            matrix.extend(
+                [str(value) for value in row] for row in rows)
+            self._save()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_sheet_backend() -> SheetBackend:
+    """Бэкенд по GSHEET_BACKEND: pygsheets или fake."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if GSHEET_BACKEND == 'fake':
+                _backend = FakeSheetBackend(
+                    path=GSHEET_FAKE_FILE,
+                    latency=GSHEET_FAKE_LATENCY,
+                    error_rate=GSHEET_FAKE_ERROR_RATE,
+                    requests_per_minute=GSHEET_FAKE_REQUESTS_PER_MINUTE
+                )
+                logger.warning('google sheets: fake backend is used')
+            elif GSHEET_BACKEND == 'pygsheets':
+                _backend = PygsheetsBackend()
+            else:
+                raise ValueError(f'unknown GSHEET_BACKEND: {GSHEET_BACKEND}')
+        return _backend
+
+
+def set_sheet_backend(backend: SheetBackend) -> None:
+    """Подменить бэкенд всего процесса, например в тестах."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -1,11 +1,12 @@
 from datetime import date, datetime
-import time
-import logging
-from time import sleep
+import random
+import threading
+from time import sleep, monotonic
 from loguru import logger
 
-from pygsheets import authorize, Worksheet
-from tgbot.config import GSHEET_SERVICE_FILE
+from tgbot.services.gs_backends import SheetBackend, get_sheet_backend
+from tgbot.config import GSHEET_APPEND_CHUNK_SIZE, GSHEET_REQUESTS_PER_MINUTE, \
+    GSHEET_MAX_RETRIES, GSHEET_BACKOFF_BASE, GSHEET_BACKOFF_MAX
 
 
 BASE_WS = 'База'
@@ -52,92 +53,181 @@ base_value_date = [
 ]
 
 
+# ответы Sheets API, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class BaseValuesError(ValueError):
+    pass
+
+
+class SheetsApiError(Exception):
+    """Запрос к Google Sheets не выполнен (в том числе после всех повторов)."""
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class RateLimiter():
+    """Token bucket: не больше rate запросов за period секунд.
+    Потокобезопасный, ждет свободный токен в вызывающем потоке."""
+    def __init__(self, rate: int, period: float = 60):
+        self.capacity = rate
+        self.fill_rate = rate / period
+        self._tokens = rate
+        self._updated_at = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated_at) * self.fill_rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.fill_rate
+            sleep(wait)
+
+
+sheets_rate_limiter = RateLimiter(GSHEET_REQUESTS_PER_MINUTE, period=60)
+
+
+def get_error_status(error: Exception) -> int:
+    """HTTP статус ошибки Sheets API, если он есть."""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is None:
+        status = getattr(error, 'status', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def sheets_request(func, *args, **kwargs):
+    """Выполняет запрос к Sheets API через общий лимитер.
+    На 429/5xx и сетевых ошибках повторяет запрос с экспоненциальной
+    задержкой и jitter, но не больше GSHEET_MAX_RETRIES раз.
+
+    Raises:
+        SheetsApiError: запрос не удался
+    """
+    for attempt in range(GSHEET_MAX_RETRIES + 1):
+        sheets_rate_limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            status = get_error_status(e)
+            is_retryable = status in RETRY_STATUSES or isinstance(e, OSError)
+            if not is_retryable or attempt == GSHEET_MAX_RETRIES:
+                raise SheetsApiError(
+                    f'sheets request failed: {e}', status=status) from e
+            delay = random.uniform(
+                0, min(GSHEET_BACKOFF_MAX, GSHEET_BACKOFF_BASE * 2 ** attempt))
+            logger.warning(
+                f'sheets request error: {e}. retry in {delay:.1f} seconds')
+            sleep(delay)
+
+
 class GameSheet():
     @staticmethod
     def is_url_correct(gs_url: str) -> bool:
         try:
-            client = authorize(service_file=GSHEET_SERVICE_FILE)
-            sheet = client.open_by_url(gs_url)
-            worksheet = sheet.worksheet_by_title(BASE_WS)
-            cell_list = worksheet.find('key', matchEntireCell=True)
-            if len(cell_list) == 1:
-                return True
-            else:
-                return False
+            return 'key' in GameSheet(gs_url).get_key_values(BASE_WS)
         except Exception as e:
             logger.error(f'url is not correct: {e}')
             return False
 
-    def __init__(self, gs_link: str):
+    def __init__(self, gs_link: str, backend: SheetBackend = None):
         self.gs_link = gs_link
+        self.backend = backend or get_sheet_backend()
 
-    def get_sheet(self):
-        did_conect = False
-        while not did_conect:
-            try:
-                client = authorize(service_file=GSHEET_SERVICE_FILE)
-                sheet = client.open_by_url(self.gs_link)
-                did_conect = True
-            except Exception as e:
-                logger.error(f'connection error: {e}. sleep 2 seconds')
-                time.sleep(2)
-                pass
-
-        return sheet
+    def request(self, method: str, *args, **kwargs):
+        """Вызывает метод бэкенда для этой таблицы через sheets_request,
+        после ошибки таблица будет переоткрыта."""
+        func = getattr(self.backend, method)
+        try:
+            return sheets_request(func, self.gs_link, *args, **kwargs)
+        except SheetsApiError as e:
+            logger.error(f'connection error: {e}')
+            self.backend.invalidate(self.gs_link)
+            raise
 
     def get_title(self) -> str:
-        sheet = self.get_sheet()
-        return sheet.title
+        return self.request('get_title')
 
-    def get_worksheet(self, ws_name: str) -> Worksheet:
-        sheet = self.get_sheet()
-        worksheet = sheet.worksheet_by_title(ws_name)
-        return worksheet
+    def get_key_values(self, ws_name: str) -> dict:
+        """Читает лист одним запросом и возвращает значения,
+        записанные справа от ячеек с названиями переменных.
 
-    def add_game_key(self, game_key: str) -> None:
-        worksheet = self.get_worksheet(BASE_WS)
+        Returns:
+            dict: {
+                name: (value: str, address: tuple (row, col) ячейки значения),
+                ...
+            }
+        """
+        matrix = self.request('get_all_values', ws_name)
+        result = {}
+        for row_index, row in enumerate(matrix, start=1):
+            for col_index, name in enumerate(row, start=1):
+                if not name or name in result:
+                    continue
+                value = row[col_index] if col_index < len(row) else ''
+                result[name] = (value, (row_index, col_index + 1))
+        return result
 
-        key_name_cell = worksheet.find('game_key', matchEntireCell=True)[0]
-        key_address = key_name_cell.address + (0, 1)
-        key_cell = worksheet.cell(key_address)
-        key_cell.set_value(game_key)
+    def set_key_value(self, ws_name: str, name: str, value) -> None:
+        key_values = self.get_key_values(ws_name)
+        _, address = key_values[name]
+        self.request('update_value', ws_name, address, value)
 
-    def is_base_values_ready(self) -> bool:
-        worksheet = self.get_worksheet(BASE_WS)
+    def add_game_key(self, game_key: str) -> None:
+        self.set_key_value(BASE_WS, 'game_key', game_key)
 
-        key_name_cell = worksheet.find('key', matchEntireCell=True)[0]
-        key_address = key_name_cell.address + (0, 1)
-        key_cell = worksheet.cell(key_address)
-        if int(key_cell.value) == 1:
+    def is_base_values_ready(self) -> bool:
+        key_values = self.get_key_values(BASE_WS)
+        value, _ = key_values['key']
+        if int(value) == 1:
             return True
         else:
             return False
 
     def get_base_value(self) -> dict:
-        worksheet = self.get_worksheet(BASE_WS)
+        """Читает и проверяет все базовые значения игры.
+
+        Raises:
+            BaseValuesError: со списком всех ошибок сразу
+        """
+        key_values = self.get_key_values(BASE_WS)
         result = {}
+        errors = []
         for variable in base_value_list:
-            var_name_cell = worksheet.find(variable, matchEntireCell=True)[0]
-            var_address = var_name_cell.address + (0, 1)
-            var_cell = worksheet.cell(var_address)
-            value = var_cell.value
-            if variable in base_value_int:
-                value = int(value)
-            elif variable in base_value_float:
-                value = float(value.replace(',', '.'))
-            elif variable in base_value_date:
-                value = datetime.strptime(value, '%d.%m.%Y').date()
+            if variable not in key_values:
+                errors.append(f'{variable}: not found')
+                continue
+            value, _ = key_values[variable]
+            try:
+                if variable in base_value_int:
+                    value = int(value)
+                elif variable in base_value_float:
+                    value = float(value.replace(',', '.'))
+                elif variable in base_value_date:
+                    value = datetime.strptime(value, '%d.%m.%Y').date()
+            except ValueError as e:
+                errors.append(f'{variable}: {e}')
+                continue
             result[variable] = value
 
+        if errors:
+            raise BaseValuesError('; '.join(errors))
         return result
     
     def change_extra_cash(self, extra_cash: int) -> None:
-        worksheet = self.get_worksheet(BASE_WS)
-
-        key_name_cell = worksheet.find('extra_cash', matchEntireCell=True)[0]
-        key_address = key_name_cell.address + (0, 1)
-        key_cell = worksheet.cell(key_address)
-        key_cell.set_value(extra_cash)
+        self.set_key_value(BASE_WS, 'extra_cash', extra_cash)
 
     def get_company_names(self) -> list:
         """return list of dicts with name of companes
@@ -151,12 +241,8 @@ class GameSheet():
                 {...},
             ]
         """
-        worksheet = self.get_worksheet(EFFECT_WS)
         result = []
-        matrix = worksheet.get_values(
-            start='A3',
-            end='B100',
-        )
+        matrix = self.request('get_values', EFFECT_WS, 'A3', 'B100')
         for row in matrix:
             result.append(
                 {
@@ -178,12 +264,8 @@ class GameSheet():
                 {...},
             ]
         """
-        worksheet = self.get_worksheet(QA_WS)
         result = []
-        matrix = worksheet.get_values(
-            start='A3',
-            end='B1000',
-        )
+        matrix = self.request('get_values', QA_WS, 'A3', 'B1000')
         for row in matrix:
             result.append(
                 {
@@ -199,119 +281,104 @@ class GameSheet():
         Returns:
             tuple: (date_now: date, bool_: bool)
         """
-        worksheet = self.get_worksheet(TIMETABLE_WS)
+        key_values = self.get_key_values(TIMETABLE_WS)
 
-        date_name_cell = worksheet.find('today_date', matchEntireCell=True)[0]
-        date_address = date_name_cell.address + (0, 1)
-        date_cell = worksheet.cell(date_address)
-        date_now = datetime.strptime(date_cell.value, '%d.%m.%Y').date()
+        date_value, _ = key_values['today_date']
+        date_now = datetime.strptime(date_value, '%d.%m.%Y').date()
 
-        bool_name_cell = worksheet.find(
-            'is_market_open',
-            matchEntireCell=True)[0]
-        bool_address = bool_name_cell.address + (0, 1)
-        bool_cell = worksheet.cell(bool_address)
-        bool_ = bool(int(bool_cell.value))
+        bool_value, _ = key_values['is_market_open']
+        bool_ = bool(int(bool_value))
 
         return (date_now, bool_)
 
-    def add_gameuser(
-            self,
+    def append_rows(self, ws_name: str, rows: list) -> None:
+        """Добавляет строки в конец листа.
+        Пишет пачками по GSHEET_APPEND_CHUNK_SIZE строк за запрос."""
+        if not rows:
+            return
+        for start in range(0, len(rows), GSHEET_APPEND_CHUNK_SIZE):
+            self.request(
+                'append_rows',
+                ws_name,
+                rows[start:start + GSHEET_APPEND_CHUNK_SIZE]
+            )
+
+    @staticmethod
+    def make_gameuser_row(
             last_name: str,
             first_name: str,
             nickname: str,
             tg_username: str,
-            tg_id: int) -> None:
-        worksheet = self.get_worksheet(GAMEUSERS_WS)
-        values_list = [
+            tg_id: int) -> list:
+        return [
             last_name,
             first_name,
             nickname,
             tg_username,
             tg_id
         ]
-        worksheet.append_table(
-            values=values_list,
-            start='A2',
-            end=None,
-            dimension='ROWS',
-            overwrite=False
-        )
-
-    def get_effect(self, ticker: str) -> int:
-        worksheet = self.get_worksheet(EFFECT_WS)
-        var_name_cell = worksheet.find(ticker, matchEntireCell=True)[0]
-        var_address = var_name_cell.address + (0, 1)
-        var_cell = worksheet.cell(var_address)
-        effect = int(var_cell.value)
-        sleep(0.25)
-        return effect
-
-    def get_liquidation(self, ticker: str) -> bool:
-        worksheet = self.get_worksheet(EFFECT_WS)
-        var_name_cell = worksheet.find(ticker, matchEntireCell=True)[0]
-        var_address = var_name_cell.address + (0, 2)
-        var_cell = worksheet.cell(var_address)
-        sleep(0.25)
-        if var_cell.value == '1':
-            return True
-        else:
-            return False
 
-    def add_trading_volume(
-            self,
-            date: date,
-            ticker: str,
-            sold: int,
-            bought: int):
-        worksheet = self.get_worksheet(TRADING_VOLUME_WS)
-        values_list = [
-            str(date), ticker, bought, sold
+    def get_company_effects(self) -> dict:
+        """Эффекты и флаги ликвидации всех компаний одним запросом.
+        Пустой эффект - 0, строки с нечисловым эффектом пропускаются.
+
+        Returns:
+            dict: {
+                ticker: {
+                    'effect': int,
+                    'liquidation': bool
+                },
+                ...
+            }
+        """
+        result = {}
+        matrix = self.request('get_values', EFFECT_WS, 'A3', 'D100')
+        for row in matrix:
+            _, ticker, effect, liquidation = (row + [''] * 4)[:4]
+            if not ticker:
+                continue
+            try:
+                effect = int(effect) if effect.strip() else 0
+            except ValueError:
+                logger.error(
+                    f'{self.gs_link}: wrong effect {effect!r} for {ticker}, '
+                    'row skipped')
+                continue
+            result[ticker] = {
+                'effect': effect,
+                'liquidation': liquidation == '1'
+            }
+        return result
+
+    @staticmethod
+    def make_trading_volume_rows(date: date, volumes: list) -> list:
+        """Args:
+            volumes (list): [{'ticker': str, 'sold': int, 'bought': int}]
+        """
+        return [
+            [str(date), volume['ticker'], volume['bought'], volume['sold']]
+            for volume in volumes
         ]
-        worksheet.append_table(
-            values=values_list,
-            start='A2',
-            end=None,
-            dimension='ROWS',
-            overwrite=False
-        )
-        sleep(0.25)
-
-    def add_company_price(
-            self,
-            date: date,
-            ticker: str,
-            price: float):
-        worksheet = self.get_worksheet(PRICES_WS)
-        values_list = [
-            str(date), ticker, price
+
+    @staticmethod
+    def make_company_price_rows(date: date, prices: list) -> list:
+        """Args:
+            prices (list): [{'ticker': str, 'price': float}]
+        """
+        return [
+            [str(date), price['ticker'], price['price']]
+            for price in prices
         ]
-        worksheet.append_table(
-            values=values_list,
-            start='A2',
-            end=None,
-            dimension='ROWS',
-            overwrite=False
-        )
-        sleep(0.25)
-
-    def add_portfolio(
-            self,
-            date: date,
-            nickname: str,
-            size: float):
-        worksheet = self.get_worksheet(PORTFOLIO_WS)
-        values_list = [
-            str(date), nickname, size
+
+    @staticmethod
+    def make_portfolio_rows(date: date, portfolios: list) -> list:
+        """Args:
+            portfolios (list): [{'nickname': str, 'size': float}]
+        """
+        return [
+            [str(date), portfolio['nickname'], portfolio['size']]
+            for portfolio in portfolios
         ]
-        worksheet.append_table(
-            values=values_list,
-            start='A2',
-            end=None,
-            dimension='ROWS',
-            overwrite=False
-        )
-        sleep(0.25)
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,108 @@
+from itertools import groupby
+from loguru import logger
+
+from tgbot.services.gs_module import GameSheet
+from tgbot.services.db_managing import OutboxData
+from tgbot.config import GSHEET_OUTBOX_BATCH_SIZE, \
+    GSHEET_OUTBOX_MAX_ATTEMPTS, GSHEET_OUTBOX_CLAIM_TTL, \
+    GSHEET_APPEND_CHUNK_SIZE
+
+
+def split_requests(entries: list) -> list:
+    """Записи одного листа одного действия по запросам к API:
+    append - пачками по GSHEET_APPEND_CHUNK_SIZE строк, остальное - по одной.
+
+    Returns:
+        list: [[entry, ...], ...]
+    """
+    if entries[0]['action'] == 'append':
+        size = GSHEET_APPEND_CHUNK_SIZE
+    else:
+        size = 1
+    return [
+        entries[start:start + size] for start in range(0, len(entries), size)
+    ]
+
+
+def send_entries(game_sheet: GameSheet, worksheet: str, entries: list) -> None:
+    """Отправляет записи одного листа одного действия одним запросом."""
+    action = entries[0]['action']
+    if action == 'append':
+        game_sheet.append_rows(
+            worksheet, [entry['payload'] for entry in entries])
+    elif action == 'set_value':
+        for entry in entries:
+            game_sheet.set_key_value(
+                worksheet,
+                entry['payload']['name'],
+                entry['payload']['value']
+            )
+    else:
+        raise ValueError(f'unknown outbox action: {action}')
+
+
+def flush_gs_outbox() -> int:
+    """Отправляет очередь выгрузки в Google Sheets.
+    Записи одного листа уходят строго по порядку: после ошибки
+    остаток листа ждет следующего запуска, а запись, на которой
+    выгрузка падает GSHEET_OUTBOX_MAX_ATTEMPTS раз, пропускается.
+    Каждый успешный запрос сразу удаляет свои записи из очереди,
+    поэтому после ошибки уже записанные строки не уходят повторно.
+
+    Returns:
+        int: количество отправленных записей
+    """
+    entries = OutboxData.claim_pending(
+        limit=GSHEET_OUTBOX_BATCH_SIZE,
+        max_attempts=GSHEET_OUTBOX_MAX_ATTEMPTS,
+        claim_ttl=GSHEET_OUTBOX_CLAIM_TTL
+    )
+    unsent = {entry['outbox_id'] for entry in entries}
+
+    worksheets = {}
+    for entry in entries:
+        key = (entry['gs_link'], entry['worksheet'])
+        worksheets.setdefault(key, []).append(entry)
+
+    sent = 0
+    try:
+        for (gs_link, worksheet), ws_entries in worksheets.items():
+            sent += send_worksheet(
+                GameSheet(gs_link), worksheet, ws_entries, unsent)
+    finally:
+        # записи листа после ошибки ждут следующего запуска
+        if unsent:
+            OutboxData.release(list(unsent))
+
+    if sent:
+        logger.info(f'gs outbox: {sent} entries sent')
+    return sent
+
+
+def send_worksheet(
+        game_sheet: GameSheet,
+        worksheet: str,
+        entries: list,
+        unsent: set) -> int:
+    """Отправляет записи листа по порядку до первой ошибки.
+    Отправленные и упавшие записи убирает из unsent.
+
+    Returns:
+        int: количество отправленных записей
+    """
+    sent = 0
+    for _, action_entries in groupby(entries, key=lambda e: e['action']):
+        for request_entries in split_requests(list(action_entries)):
+            outbox_ids = [entry['outbox_id'] for entry in request_entries]
+            unsent.difference_update(outbox_ids)
+            try:
+                send_entries(game_sheet, worksheet, request_entries)
+            except Exception as e:
+                logger.error(
+                    f'gs outbox: {worksheet} of {game_sheet.gs_link} '
+                    f'failed: {e}')
+                OutboxData.mark_failed(outbox_ids, str(e))
+                return sent
+            OutboxData.delete(outbox_ids)
+            sent += len(outbox_ids)
+    return sent
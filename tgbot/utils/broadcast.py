@@ -1,5 +1,6 @@
 import asyncio
 import datetime
+from functools import partial
 from typing import Union
 
 from aiogram import types
@@ -7,24 +8,34 @@ from aiogram.utils import exceptions
 from loguru import logger
 
 from tgbot.loader import dp
-from tgbot.config import TG_ADMINS_ID
+from tgbot.config import TG_ADMINS_ID, BROADCAST_WORKERS, \
+    BROADCAST_PROGRESS_INTERVAL
+from tgbot.utils.rate_limiter import chat_limiter, priority, \
+    message_priority, INTERACTIVE, NOTIFICATION, MAILING
 from tgbot.utils.pars_messages import Post
+from tgbot.services.db_managing import BroadcastData, run_in_db_executor
+
+# статусы получателя рассылки
+SENT = 'sent'
+BLOCKED = 'blocked'
+FAILED = 'failed'
 
 
 async def send_messages(
         users_id: Union[list, str],
         text: str):
-    await broadcast_post(
-        post=Post(
-            title=None,
-            text=text,
-            photos=[],
-            video=None,
-            docs=[],
-            polls=[],
-        ),
-        users_id=users_id
-    )
+    with priority(NOTIFICATION):
+        await broadcast_post(
+            post=Post(
+                title=None,
+                text=text,
+                photos=[],
+                video=None,
+                docs=[],
+                polls=[],
+            ),
+            users_id=users_id
+        )
 
 
 async def broadcast_post(
@@ -32,56 +43,259 @@ async def broadcast_post(
         users_id: Union[list, str],
         reply_markup: types.InlineKeyboardMarkup = None,
         disable_web_page_preview=False,
-        show_result=False):
+        show_result=False,
+        progress_chat_id: int = None):
+    """Рассылает пост без сохранения в БД, для коротких рассылок.
+    Если указан progress_chat_id, в этот чат приходит сообщение
+    с результатами, которое обновляется по ходу рассылки.
+    """
     logger.info('started message sending')
-    count = 0
     start_time = datetime.datetime.now()
     users_id = users_id if isinstance(users_id, list) else [users_id]
+    stats = {'count': 0}
+
+    async def on_result(user_id: int, status: str):
+        if status == SENT:
+            stats['count'] += 1
+
+    async def make_progress_text(finished: bool) -> str:
+        return await create_result_text(
+            start_time, len(users_id), stats['count'], finished=finished)
+
+    progress = None
+    if progress_chat_id:
+        message = await dp.bot.send_message(
+            progress_chat_id, await make_progress_text(finished=False))
+        progress = (progress_chat_id, message.message_id)
+
+    await run_with_progress(
+        send_to_recipients(
+            post, users_id, on_result,
+            reply_markup, disable_web_page_preview),
+        progress,
+        make_progress_text
+    )
+    logger.info(
+        f'message sending finished: {stats["count"]}/{len(users_id)}')
+
+    if show_result:
+        return await make_progress_text(finished=True)
+
+
+async def start_broadcast(
+        post: Post,
+        users_id: list,
+        progress_chat_id: int = None) -> int:
+    """Сохраняет рассылку со списком получателей в БД и запускает ее.
+    Каждый получатель получает пост один раз: после перезапуска бота
+    рассылка продолжается с тех, кому пост еще не отправлен.
+
+    Returns:
+        int: broadcast_id
+    """
+    broadcast_id = await run_in_db_executor(
+        BroadcastData.create_broadcast,
+        post._asdict(),
+        users_id,
+        progress_chat_id
+    )
+    logger.info(f'broadcast {broadcast_id} created: {len(users_id)} users')
+    await run_broadcast(broadcast_id)
+    return broadcast_id
+
+
+async def run_broadcast(broadcast_id: int) -> None:
+    """Отправляет пост всем получателям рассылки со статусом pending."""
+    broadcast_data = await run_in_db_executor(BroadcastData, broadcast_id)
+    post = Post(**broadcast_data.get_post())
+    recipients = await run_in_db_executor(
+        broadcast_data.get_pending_recipients)
+    users_id = [tg_id for tg_id, _ in recipients]
+    logger.info(f'broadcast {broadcast_id}: {len(users_id)} users pending')
+    start_time = datetime.datetime.now()
+
+    async def on_result(user_id: int, status: str):
+        await run_in_db_executor(
+            broadcast_data.set_recipient_status, user_id, status)
+
+    async def on_part(user_id: int, next_part: int):
+        await run_in_db_executor(
+            broadcast_data.set_recipient_next_part, user_id, next_part)
+
+    async def make_progress_text(finished: bool) -> str:
+        counts = await run_in_db_executor(broadcast_data.get_status_counts)
+        return await create_result_text(
+            start_time,
+            sum(counts.values()),
+            counts['sent'],
+            finished=finished
+        )
+
+    progress = None
+    progress_chat_id = broadcast_data.get_progress_chat_id()
+    if progress_chat_id:
+        progress_message_id = await run_in_db_executor(
+            broadcast_data.get_progress_message_id)
+        if progress_message_id is None:
+            message = await dp.bot.send_message(
+                progress_chat_id, await make_progress_text(finished=False))
+            progress_message_id = message.message_id
+            await run_in_db_executor(
+                broadcast_data.set_progress_message_id, progress_message_id)
+        progress = (progress_chat_id, progress_message_id)
+
+    await run_with_progress(
+        send_to_recipients(
+            post, users_id, on_result,
+            on_part=on_part, start_parts=dict(recipients)),
+        progress,
+        make_progress_text
+    )
+    await run_in_db_executor(broadcast_data.finish)
+    logger.info(f'broadcast {broadcast_id} finished')
+
+
+async def resume_broadcasts() -> None:
+    """Продолжает рассылки, прерванные перезапуском бота."""
+    broadcast_ids = await run_in_db_executor(
+        BroadcastData.get_active_broadcast_ids)
+    for broadcast_id in broadcast_ids:
+        logger.info(f'broadcast {broadcast_id} resumed')
+        asyncio.create_task(run_broadcast(broadcast_id))
+
+
+async def send_to_recipients(
+        post: Post,
+        users_id: list,
+        on_result,
+        reply_markup: types.InlineKeyboardMarkup = None,
+        disable_web_page_preview: bool = False,
+        on_part=None,
+        start_parts: dict = None) -> None:
+    """Рассылает пост BROADCAST_WORKERS параллельными отправителями
+    с приоритетом MAILING, если он не задан выше, и лимитом на чат.
+    После каждого получателя вызывает await on_result(user_id, status).
+
+    Args:
+        on_part: async (user_id, next_part) после каждой отправленной
+            части поста, кроме последней
+        start_parts (dict): {user_id: номер части, с которой досылать}
+    """
+    start_parts = start_parts or {}
+    queue = asyncio.Queue()
     for user_id in users_id:
+        queue.put_nowait(user_id)
+
+    async def worker():
+        if message_priority.get() == INTERACTIVE:
+            message_priority.set(MAILING)
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            status = await send_post_to_user(
+                post, user_id,
+                reply_markup, disable_web_page_preview,
+                start_part=start_parts.get(user_id, 0),
+                on_part=on_part)
+            await on_result(user_id, status)
+
+    await asyncio.gather(
+        *[worker() for _ in range(min(BROADCAST_WORKERS, len(users_id)))])
+
+
+async def run_with_progress(sending, progress: tuple, make_progress_text):
+    """Ждет окончания рассылки и раз в BROADCAST_PROGRESS_INTERVAL секунд
+    обновляет сообщение с результатами.
+
+    Args:
+        sending: корутина рассылки
+        progress (tuple): (chat_id, message_id) сообщения с результатами
+            или None
+        make_progress_text: async (finished: bool) -> str
+    """
+    task = asyncio.ensure_future(sending)
+    while progress:
+        done, _ = await asyncio.wait(
+            [task], timeout=BROADCAST_PROGRESS_INTERVAL)
+        finished = bool(done) and not task.exception()
+        chat_id, message_id = progress
         try:
-            await send_post(
-                post=post,
-                tg_chat_id=user_id,
-                reply_markup=reply_markup,
-                disable_web_page_preview=disable_web_page_preview,
+            await dp.bot.edit_message_text(
+                await make_progress_text(finished=finished),
+                chat_id,
+                message_id
             )
-            await asyncio.sleep(0.04)  # Telegram limit 30 message per second
-        except exceptions.BotBlocked:
-            logger.info(f"Target [ID:{user_id}]: blocked by user")
-        except exceptions.ChatNotFound:
-            logger.info(f"Target [ID:{user_id}]: invalid user ID")
+        except exceptions.TelegramAPIError as e:
+            logger.warning(f'broadcast progress not updated: {e}')
+        if done:
+            break
+    await task
+
+
+async def send_post_to_user(
+        post: Post,
+        user_id: int,
+        reply_markup: types.InlineKeyboardMarkup = None,
+        disable_web_page_preview: bool = False,
+        start_part: int = 0,
+        on_part=None) -> str:
+    """Отправляет пост одному получателю по частям с учетом лимита на чат.
+    После RetryAfter все отправки бота стоят на паузе, затем пост
+    досылается с неотправленной части, уже отправленные не повторяются.
+
+    Args:
+        start_part (int): с какой части начать, если пост уже отправлялся
+        on_part: async (user_id, next_part) после каждой части,
+            кроме последней
+
+    Returns:
+        str: SENT, BLOCKED или FAILED
+    """
+    parts = make_post_parts(
+        post, user_id, reply_markup, disable_web_page_preview)
+    next_part = start_part
+    while next_part < len(parts):
+        await chat_limiter.acquire(user_id)
+        try:
+            await parts[next_part]()
         except exceptions.RetryAfter as e:
             logger.info(
                 f"Target [ID:{user_id}]: Flood limit is exceeded."
                 f" Sleep {e.timeout} seconds.")
-            await asyncio.sleep(e.timeout)
-            await broadcast_post(
-                post,
-                users_id,
-                reply_markup,
-                disable_web_page_preview,
-                show_result)
+            continue
+        except exceptions.BotBlocked:
+            logger.info(f"Target [ID:{user_id}]: blocked by user")
+            return BLOCKED
+        except exceptions.ChatNotFound:
+            logger.info(f"Target [ID:{user_id}]: invalid user ID")
+            return BLOCKED
         except exceptions.UserDeactivated:
             logger.info(f"Target [ID:{user_id}]: user is deactivated")
+            return BLOCKED
         except exceptions.TelegramAPIError:
             logger.error(f"Target [ID:{user_id}]: failed")
-        else:
-            count += 1
-            logger.info(f"Target [ID:{user_id}]: success")
-
-    if show_result:
-        return await create_result_text(start_time, users_id, count)
+            return FAILED
+        next_part += 1
+        if on_part and next_part < len(parts):
+            await on_part(user_id, next_part)
+    logger.info(f"Target [ID:{user_id}]: success")
+    return SENT
 
 
-async def create_result_text(start_time, users_id, count):
+async def create_result_text(start_time, users_number, count, finished=True):
     finish_time = datetime.datetime.now()
     total_time = (finish_time - start_time).total_seconds()
+    if finished:
+        title = 'Результаты рассылки:'
+        finish_line = f'Время окончания рассылки - {finish_time}\n'
+    else:
+        title = 'Рассылка идет:'
+        finish_line = ''
     msg = (
-        f'Результаты рассылки:\n'
+        f'{title}\n'
         f'Время начала рассылки - {start_time.time()}\n'
-        f'Всего пользователей - {len(users_id)}\n'
+        f'Всего пользователей - {users_number}\n'
         f'Отправлено сообщений - {count}\n'
-        f'Время окончания рассылки - {finish_time}\n'
+        f'{finish_line}'
         f'Итоговое время рассылки, в сек. - {total_time}\n'
     )
     return msg
@@ -93,38 +307,51 @@ async def send_post(
         reply_markup: types.InlineKeyboardMarkup = None,
         disable_web_page_preview: bool = False,
     ) -> None:
+    for part in make_post_parts(
+            post, tg_chat_id, reply_markup, disable_web_page_preview):
+        await chat_limiter.acquire(tg_chat_id)
+        await part()
+    logger.info(f"Post sended to {tg_chat_id}")
+
 
+def make_post_parts(
+        post: Post,
+        tg_chat_id: int,
+        reply_markup: types.InlineKeyboardMarkup = None,
+        disable_web_page_preview: bool = False,
+    ) -> list:
+    """Пост как список частей: каждая часть - одно сообщение в чат.
+    Часть вызывается без аргументов и возвращает корутину отправки.
+    """
     if len(post.photos) == 1:
-        await send_photo_post(
+        parts = photo_post_parts(
             post,
             tg_chat_id,
             reply_markup,
             disable_web_page_preview)
     elif len(post.photos) >= 2:
-        await send_photos_post(
+        parts = photos_post_parts(
             post,
             tg_chat_id,
-            reply_markup,
             disable_web_page_preview)
     elif post.video:
-        await send_video_post(
+        parts = video_post_parts(
             post,
             tg_chat_id,
             reply_markup,
             disable_web_page_preview)
     else:
-        await send_text_post(
+        parts = text_post_parts(
             post,
             tg_chat_id,
             reply_markup,
             disable_web_page_preview)
 
     if post.docs:
-        await send_docs_post(post, tg_chat_id)
+        parts.append(partial(send_docs_post, post, tg_chat_id))
     if post.polls:
         pass
-
-    logger.info(f"Post sended to {tg_chat_id}")
+    return parts
     
 
 def split_text(text: str, fragment_size: int) -> list:
@@ -134,125 +361,121 @@ def split_text(text: str, fragment_size: int) -> list:
     return fragments
 
 
-async def send_text_post(
+def text_post_parts(
         post: Post,
         tg_chat_id: int,
         reply_markup: types.InlineKeyboardMarkup = None,
         disable_web_page_preview: bool = False
-    ) -> None:
+    ) -> list:
 
     if not post.text:
-        return
+        return []
 
     if len(post.text) < 4096:
-        await dp.bot.send_message(
+        return [partial(
+            dp.bot.send_message,
             tg_chat_id,
             post.text,
             parse_mode=types.ParseMode.HTML,
             disable_web_page_preview=disable_web_page_preview,
-            reply_markup=reply_markup)
-    else:
-        text_parts = split_text(post.text, 4084)
-        prepared_text_parts = (
-            [text_parts[0] + " (...)"]
-            + ["(...) " + part + " (...)" for part in text_parts[1:-1]]
-            + ["(...) " + text_parts[-1]]
-        )
+            reply_markup=reply_markup)]
 
-        for part in prepared_text_parts[:-1]:
-            await dp.bot.send_message(
-                tg_chat_id,
-                part,
-                parse_mode=types.ParseMode.HTML,
-                disable_web_page_preview=disable_web_page_preview)
-            await asyncio.sleep(0.5)
-        # send last part
-        await dp.bot.send_message(
+    text_parts = split_text(post.text, 4084)
+    prepared_text_parts = (
+        [text_parts[0] + " (...)"]
+        + ["(...) " + part + " (...)" for part in text_parts[1:-1]]
+        + ["(...) " + text_parts[-1]]
+    )
+    return [
+        partial(
+            dp.bot.send_message,
             tg_chat_id,
-            prepared_text_parts[-1],
+            part,
             parse_mode=types.ParseMode.HTML,
             disable_web_page_preview=disable_web_page_preview)
-    logger.info("Text post sent to Telegram.")
+        for part in prepared_text_parts
+    ]
 
 
-async def send_photo_post(
+def photo_post_parts(
         post: Post,
         tg_chat_id: int,
         reply_markup: types.InlineKeyboardMarkup,
         disable_web_page_preview: bool,
-) -> None:
+) -> list:
     if len(post.text) <= 1024:
-        await dp.bot.send_photo(
+        return [partial(
+            dp.bot.send_photo,
             tg_chat_id,
             post.photos[0],
             post.text,
             parse_mode=types.ParseMode.HTML,
             reply_markup=reply_markup,
-        )
-        logger.info("Text post (<=1024) with photo sent to Telegram.")
-    else:
-        prepared_text = f'<a href="{post.photos[0]}"> </a>{post.text}'
-        if len(prepared_text) <= 4096:
-            await dp.bot.send_message(
-                tg_chat_id, prepared_text,
-                parse_mode=types.ParseMode.HTML,
-                disable_web_page_preview=disable_web_page_preview,
-                reply_markup=reply_markup,
-            )
-        else:
-            await dp.bot.send_photo(tg_chat_id, post.photos[0])
-            await send_text_post(
-                post,
-                tg_chat_id,
-                reply_markup,
-                disable_web_page_preview)
-        logger.info("Text post (>1024) with photo sent to Telegram.")
+        )]
+
+    prepared_text = f'<a href="{post.photos[0]}"> </a>{post.text}'
+    if len(prepared_text) <= 4096:
+        return [partial(
+            dp.bot.send_message,
+            tg_chat_id, prepared_text,
+            parse_mode=types.ParseMode.HTML,
+            disable_web_page_preview=disable_web_page_preview,
+            reply_markup=reply_markup,
+        )]
+    return (
+        [partial(dp.bot.send_photo, tg_chat_id, post.photos[0])]
+        + text_post_parts(
+            post,
+            tg_chat_id,
+            reply_markup,
+            disable_web_page_preview)
+    )
 
 
-async def send_photos_post(
+def photos_post_parts(
         post: Post,
         tg_chat_id: int,
         disable_web_page_preview: bool
-) -> None:
+) -> list:
     media = types.MediaGroup()
     for photo in post.photos:
         media.attach_photo(types.InputMediaPhoto(photo))
 
+    parts = []
     if (len(post.text) > 0) and (len(post.text) <= 1024):
         media.media[0].caption = post.text
         media.media[0].parse_mode = types.ParseMode.HTML
     elif len(post.text) > 1024:
-        await send_text_post(post, tg_chat_id, disable_web_page_preview)
-    await dp.bot.send_media_group(tg_chat_id, media)
-    logger.info("Text post with photos sent to Telegram.")
+        parts = text_post_parts(
+            post, tg_chat_id,
+            disable_web_page_preview=disable_web_page_preview)
+    parts.append(partial(dp.bot.send_media_group, tg_chat_id, media))
+    return parts
 
 
-async def send_video_post(
+def video_post_parts(
         post: Post,
         tg_chat_id: int,
         reply_markup: types.InlineKeyboardMarkup,
         disable_web_page_preview: bool,
-) -> None:
+) -> list:
     if len(post.text) <= 1024:
-        await dp.bot.send_video(
+        return [partial(
+            dp.bot.send_video,
             tg_chat_id,
             post.video,
             caption=post.text,
             parse_mode=types.ParseMode.HTML,
             reply_markup=reply_markup,
-        )
-        logger.info("Text post (<=1024) with photo sent to Telegram.")
-    else:
-        await dp.bot.send_video(
-            tg_chat_id,
-            post.video,
-        )
-        await send_text_post(
+        )]
+    return (
+        [partial(dp.bot.send_video, tg_chat_id, post.video)]
+        + text_post_parts(
             post,
             tg_chat_id,
             reply_markup,
             disable_web_page_preview)
-        logger.info("Text post (>1024) with photo sent to Telegram.")
+    )
 
 
 async def send_docs_post(post: Post, tg_chat_id: str) -> None:
@@ -0,0 +1,149 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+from aiogram import Bot
+from aiogram.utils import exceptions
+
+from tgbot.config import TG_MESSAGES_PER_SECOND, TG_CHAT_MESSAGE_INTERVAL
+
+
+# приоритеты исходящих сообщений: меньше - раньше
+INTERACTIVE = 0  # ответы игрокам в хендлерах
+NOTIFICATION = 1  # уведомления от бота и задач по расписанию
+MAILING = 2  # рассылки
+
+# приоритет отправок текущей задачи asyncio, по умолчанию - ответ игроку
+message_priority = ContextVar('message_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def priority(value: int):
+    """Все отправки внутри блока идут с приоритетом value.
+
+    Example:
+        with priority(MAILING):
+            await bot.send_message(chat_id, text)
+    """
+    token = message_priority.set(value)
+    try:
+        yield
+    finally:
+        message_priority.reset(token)
+
+
+class PriorityRateGovernor():
+    """Общий лимит rate запросов за period секунд.
+    Свободный токен получает ожидающий с самым высоким приоритетом,
+    с равным приоритетом - кто раньше пришел. pause() останавливает
+    выдачу токенов всем, например после RetryAfter от Telegram.
+    """
+    def __init__(self, rate: int, period: float = 1):
+        self.capacity = rate
+        self.fill_rate = rate / period
+        self._tokens = rate
+        self._updated_at = monotonic()
+        self._paused_until = 0
+        self._waiters = []  # heap of (priority, number, future)
+        self._counter = itertools.count()
+        self._releasing = None
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+        self._tokens = 0
+        self._updated_at = self._paused_until
+
+    def _refill(self) -> None:
+        now = monotonic()
+        if now < self._updated_at:
+            return
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated_at) * self.fill_rate
+        )
+        self._updated_at = now
+
+    async def acquire(self, priority: int = None) -> None:
+        if priority is None:
+            priority = message_priority.get()
+        self._refill()
+        if not self._waiters and self._tokens >= 1 \
+                and monotonic() >= self._paused_until:
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(
+            self._waiters, (priority, next(self._counter), future))
+        if self._releasing is None or self._releasing.done():
+            self._releasing = asyncio.ensure_future(self._release())
+        await future
+
+    async def _release(self) -> None:
+        while self._waiters:
+            now = monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.fill_rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._tokens -= 1
+                future.set_result(None)
+
+
+class ChatRateLimiter():
+    """Не чаще одного сообщения в interval секунд в один чат."""
+    # сколько чатов помнить, прежде чем чистить старые
+    max_chats = 10000
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_at = {}  # chat_id -> время, когда чат снова свободен
+
+    async def acquire(self, chat_id: int, messages: int = 1) -> None:
+        now = monotonic()
+        if len(self._next_at) > self.max_chats:
+            self._next_at = {
+                chat: next_at for chat, next_at in self._next_at.items()
+                if next_at > now
+            }
+        start = max(now, self._next_at.get(chat_id, 0))
+        self._next_at[chat_id] = start + self.interval * messages
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+# общие лимиты Telegram для всех отправок бота
+telegram_governor = PriorityRateGovernor(TG_MESSAGES_PER_SECOND, period=1)
+chat_limiter = ChatRateLimiter(TG_CHAT_MESSAGE_INTERVAL)
+
+# методы Bot API, которые расходуют лимит на отправку сообщений
+GOVERNED_METHODS = {
+    'sendMessage', 'forwardMessage', 'copyMessage', 'sendPhoto',
+    'sendAudio', 'sendDocument', 'sendVideo', 'sendAnimation', 'sendVoice',
+    'sendVideoNote', 'sendMediaGroup', 'sendLocation', 'sendVenue',
+    'sendContact', 'sendPoll', 'sendDice', 'sendSticker',
+    'editMessageText', 'editMessageCaption', 'editMessageMedia',
+    'editMessageReplyMarkup', 'deleteMessage',
+}
+
+
+class GovernedBot(Bot):
+    """Bot, у которого все отправки проходят через telegram_governor
+    в порядке приоритета из message_priority."""
+    async def request(self, method, data=None, files=None, **kwargs):
+        if method not in GOVERNED_METHODS:
+            return await super().request(method, data, files, **kwargs)
+        await telegram_governor.acquire()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except exceptions.RetryAfter as e:
+            telegram_governor.pause(e.timeout)
+            raise
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+from aiogram.utils import exceptions
+from loguru import logger
+
+from tgbot.loader import dp, scheduler
+from tgbot.services.db_managing import ScheduledMessageData, \
+    run_in_db_executor
+from tgbot.utils.rate_limiter import priority, NOTIFICATION
+
+# через сколько секунд повторить отправку после сетевой ошибки
+SEND_RETRY_DELAY = 60
+
+
+async def schedule_messages(tg_id: int, messages: list) -> None:
+    """Сохраняет цепочку сообщений пользователю и планирует отправку.
+    Не ждет отправки, сообщения переживают перезапуск бота.
+
+    Args:
+        messages (list): [(delay: float секунд от текущего момента, text), ...]
+    """
+    now = datetime.now(timezone.utc)
+    scheduled = await run_in_db_executor(
+        ScheduledMessageData.add_messages,
+        tg_id,
+        [(text, now + timedelta(seconds=delay)) for delay, text in messages]
+    )
+    for message_id, send_at in scheduled:
+        add_send_job(message_id, send_at)
+
+
+def add_send_job(message_id: int, send_at: datetime) -> None:
+    scheduler.add_job(
+        func=send_scheduled_message,
+        trigger='date',
+        run_date=max(send_at, datetime.now(timezone.utc)),
+        args=(message_id,),
+        id=f'scheduled_message_{message_id}',
+        misfire_grace_time=None,
+        replace_existing=True
+    )
+
+
+async def send_scheduled_message(message_id: int) -> None:
+    """Отправляет сообщение и только после этого удаляет его из БД.
+    При сетевой ошибке сообщение остается и отправка повторяется
+    через SEND_RETRY_DELAY секунд, при остальных ошибках Telegram
+    (бот заблокирован, чат не найден) - удаляется.
+    """
+    message = await run_in_db_executor(ScheduledMessageData.get, message_id)
+    if message is None:
+        return
+    tg_id, text = message
+    while True:
+        try:
+            with priority(NOTIFICATION):
+                await dp.bot.send_message(tg_id, text)
+        except exceptions.RetryAfter:
+            continue  # бот уже на паузе до конца RetryAfter
+        except exceptions.NetworkError as e:
+            logger.warning(f'scheduled message to {tg_id} will be retried: {e}')
+            add_send_job(
+                message_id,
+                datetime.now(timezone.utc) + timedelta(seconds=SEND_RETRY_DELAY)
+            )
+            return
+        except exceptions.TelegramAPIError as e:
+            logger.warning(f'scheduled message to {tg_id} not sent: {e}')
+        break
+    await run_in_db_executor(ScheduledMessageData.delete, message_id)
+
+
+async def restore_scheduled_messages() -> None:
+    """Планирует сообщения, не отправленные до перезапуска бота."""
+    scheduled = await run_in_db_executor(ScheduledMessageData.get_all)
+    for message_id, send_at in scheduled:
+        add_send_job(message_id, send_at)
+    if scheduled:
+        logger.info(f'{len(scheduled)} scheduled messages restored')